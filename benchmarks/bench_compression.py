@@ -0,0 +1,154 @@
+"""大きなテキストの圧縮によるDBサイズと読み込み時間のベンチマーク
+
+実行方法: python benchmarks/bench_compression.py [--rows N]
+
+ログ・JSONダンプ・ソースコード・短いテキストを混ぜたコーパスを
+非圧縮と圧縮の2つのデータベースに書き込み、ファイルサイズ、
+一覧表示（保存済みのプレビューを読み込む）と1件の全文取得の時間を比較する。
+"""
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compression import ENCODING_PLAIN, compress_text, decompress_text, zstandard  # noqa: E402
+from database import make_preview  # noqa: E402
+
+
+LIST_PAGE_SIZE = 200
+
+
+def make_log(rng: random.Random) -> str:
+    """アプリケーションログ風のテキスト"""
+    levels = ["INFO", "DEBUG", "WARN", "ERROR"]
+    lines = []
+    for i in range(rng.randint(50, 800)):
+        lines.append(
+            f"2024-05-{rng.randint(1, 28):02d} 12:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}.{i:03d} "
+            f"[{rng.choice(levels)}] worker-{rng.randint(1, 8)} request_id={rng.getrandbits(48):012x} "
+            f"path=/api/v1/items/{rng.randint(1, 99999)} status={rng.choice([200, 200, 200, 404, 500])} "
+            f"elapsed={rng.random() * 300:.2f}ms"
+        )
+    return "\n".join(lines)
+
+
+def make_json(rng: random.Random) -> str:
+    """APIレスポンスのJSONダンプ風のテキスト"""
+    records = [
+        {
+            "id": rng.randint(1, 10**9),
+            "name": f"ユーザー{rng.randint(1, 9999)}",
+            "email": f"user{rng.randint(1, 9999)}@example.com",
+            "tags": rng.sample(["alpha", "beta", "gamma", "delta", "東京", "大阪"], 3),
+            "score": round(rng.random() * 100, 3),
+            "active": rng.random() > 0.3,
+        }
+        for _ in range(rng.randint(20, 400))
+    ]
+    return json.dumps(records, ensure_ascii=False, indent=2)
+
+
+def make_short(rng: random.Random) -> str:
+    """URLやメモなどの短いテキスト"""
+    return rng.choice([
+        f"https://github.com/example/repo/pull/{rng.randint(1, 9999)}",
+        f"会議メモ {rng.randint(1, 999)}: 来週の打ち合わせについて確認",
+        f"user{rng.randint(1, 9999)}@example.com",
+        f"090-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+    ])
+
+
+def build_corpus(rows: int, seed: int = 0) -> list[str]:
+    """ベンチマーク用のコーパスを生成"""
+    rng = random.Random(seed)
+    sources = [
+        path.read_text(encoding="utf-8")
+        for path in Path(__file__).resolve().parent.parent.glob("**/*.py")
+    ]
+
+    corpus = []
+    for _ in range(rows):
+        kind = rng.random()
+        if kind < 0.6:
+            corpus.append(make_short(rng))
+        elif kind < 0.75:
+            corpus.append(make_log(rng))
+        elif kind < 0.9:
+            corpus.append(make_json(rng))
+        else:
+            corpus.append(rng.choice(sources))
+    return corpus
+
+
+def write_database(path: Path, corpus: list[str], compress: bool) -> None:
+    """コーパスをデータベースに書き込む"""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY, preview TEXT, content, content_encoding INTEGER)")
+    with conn:
+        for text in corpus:
+            stored, encoding = compress_text(text) if compress else (text, ENCODING_PLAIN)
+            conn.execute(
+                "INSERT INTO history (preview, content, content_encoding) VALUES (?, ?, ?)",
+                (make_preview(text), stored, encoding),
+            )
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def bench_reads(path: Path, rows: int, repeat: int = 20) -> tuple[float, float]:
+    """一覧表示と全文取得の平均時間（ミリ秒）を計測"""
+    conn = sqlite3.connect(path)
+    rng = random.Random(1)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        offset = rng.randint(0, max(0, rows - LIST_PAGE_SIZE))
+        # 一覧はアプリと同じく保存済みのプレビューだけを読み込む（本文は展開しない）
+        conn.execute(
+            "SELECT preview FROM history ORDER BY id DESC LIMIT ? OFFSET ?",
+            (LIST_PAGE_SIZE, offset),
+        ).fetchall()
+    list_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat * 50):
+        content, encoding = conn.execute(
+            "SELECT content, content_encoding FROM history WHERE id = ?", (rng.randint(1, rows),)
+        ).fetchone()
+        decompress_text(content, encoding)
+    get_ms = (time.perf_counter() - start) * 1000 / (repeat * 50)
+
+    conn.close()
+    return list_ms, get_ms
+
+
+def main() -> None:
+    """ベンチマークを実行"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.rows)
+    raw_bytes = sum(len(text.encode("utf-8")) for text in corpus)
+    print(f"コーパス: {args.rows}件, {raw_bytes / 1024 / 1024:.1f} MB")
+    print(f"圧縮方式: {'zstd' if zstandard is not None else 'zlib'}")
+    print()
+    print(f"{'':8} {'DBサイズ':>10} {'一覧(200件)':>12} {'全文取得':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, compress in (("非圧縮", False), ("圧縮", True)):
+            path = Path(tmp) / f"{label}.db"
+            write_database(path, corpus, compress)
+            list_ms, get_ms = bench_reads(path, args.rows)
+            size_mb = path.stat().st_size / 1024 / 1024
+            print(f"{label:8} {size_mb:8.1f}MB {list_ms:10.2f}ms {get_ms:8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""画像の取り込み時間のベンチマーク
+
+実行方法: python benchmarks/bench_image_capture.py [--repeat N]
+
+1080p・4K・8Kのスクリーンショット風の画像について、従来の方式
+（ハッシュ計算のためにPNGへエンコードし、保存時にもう一度エンコード）と
+現在の方式（ピクセルデータをハッシュ計算し、1回だけエンコードして書き込む）の
+取り込み時間を比較する。同じ画像を再びコピーした場合（重複でスキップ）の時間も測る。
+"""
+import argparse
+import hashlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PyQt6.QtCore import QBuffer, QIODevice, QRect  # noqa: E402
+from PyQt6.QtGui import QColor, QFont, QImage, QPainter  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+from image_capture import image_hash, encode_png  # noqa: E402
+
+
+SIZES = (
+    ("1080p", 1920, 1080),
+    ("4K", 3840, 2160),
+    ("8K", 7680, 4320),
+)
+
+
+def make_screenshot(width: int, height: int) -> QImage:
+    """ウィンドウと文字を並べたスクリーンショット風の画像"""
+    image = QImage(width, height, QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(QColor("#f3f3f3"))
+
+    painter = QPainter(image)
+    painter.setFont(QFont("Sans", max(height // 80, 8)))
+    for i in range(12):
+        rect = QRect(
+            (i * 397) % (width // 2), (i * 211) % (height // 2),
+            width // 3, height // 3,
+        )
+        painter.fillRect(rect, QColor.fromHsv((i * 29) % 360, 40, 250))
+        painter.setPen(QColor("#202020"))
+        for line in range(rect.height() // max(height // 60, 12)):
+            painter.drawText(
+                rect.x() + 10, rect.y() + 20 + line * max(height // 60, 12),
+                f"window {i} line {line}: def capture(image): return hash(image) + {line * i}",
+            )
+    painter.end()
+    return image
+
+
+def capture_before(image: QImage, path: Path) -> str:
+    """従来の方式（ハッシュ用と保存用に2回エンコード）"""
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    content_hash = hashlib.sha256(buffer.data().data()).hexdigest()
+    buffer.close()
+    image.save(str(path), "PNG")
+    return content_hash
+
+
+def capture_after(image: QImage, path: Path) -> str:
+    """現在の方式（ピクセルデータをハッシュ計算し、1回だけエンコード）"""
+    content_hash = image_hash(image)
+    path.write_bytes(encode_png(image))
+    return content_hash
+
+
+def duplicate_before(image: QImage) -> str:
+    """従来の方式で重複を判定する時間（エンコードしてハッシュ計算）"""
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    return hashlib.sha256(buffer.data().data()).hexdigest()
+
+
+def best_of(func, *args, repeat: int) -> float:
+    """最短所要時間（ミリ秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main() -> None:
+    """ベンチマークを実行"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])  # noqa: F841
+
+    print(f"{'':8} {'取り込み(従来)':>14} {'取り込み(現在)':>14} {'重複(従来)':>12} {'重複(現在)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "capture.png"
+        for label, width, height in SIZES:
+            image = make_screenshot(width, height)
+            before_ms = best_of(capture_before, image, path, repeat=args.repeat)
+            after_ms = best_of(capture_after, image, path, repeat=args.repeat)
+            dup_before_ms = best_of(duplicate_before, image, repeat=args.repeat)
+            dup_after_ms = best_of(image_hash, image, repeat=args.repeat)
+            print(
+                f"{label:8} {before_ms:12.1f}ms {after_ms:12.1f}ms "
+                f"{dup_before_ms:10.1f}ms {dup_after_ms:10.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""類似画像の検索時間のベンチマーク
+
+実行方法: python benchmarks/bench_perceptual_index.py [--count N] [--queries N]
+
+ランダムな64ビットの知覚ハッシュをN件登録し、ハミング距離のしきい値ごとに
+全件と比較する方式とマルチインデックスハッシュの検索時間を比較する。
+問い合わせの半分は登録済みのハッシュを少しだけ変えたもの（類似画像あり）にする。
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from hamming_index import HASH_BITS, MultiIndexHash  # noqa: E402
+
+
+THRESHOLDS = (4, 6, 8, 10)
+
+
+def linear_query(hashes: dict[int, int], value: int, max_distance: int) -> list[tuple[int, int]]:
+    """全件と比較する方式"""
+    matches = [
+        (item_id, distance) for item_id, stored in hashes.items()
+        if (distance := (value ^ stored).bit_count()) <= max_distance
+    ]
+    matches.sort(key=lambda match: (match[1], -match[0]))
+    return matches
+
+
+def make_queries(rng: random.Random, hashes: dict[int, int], count: int) -> list[int]:
+    """問い合わせのハッシュ（半分は登録済みのハッシュから数ビット変えたもの）"""
+    values = list(hashes.values())
+    queries = []
+    for i in range(count):
+        if i % 2:
+            queries.append(rng.getrandbits(HASH_BITS))
+        else:
+            value = rng.choice(values)
+            for bit in rng.sample(range(HASH_BITS), rng.randint(0, 5)):
+                value ^= 1 << bit
+            queries.append(value)
+    return queries
+
+
+def average_ms(func, queries: list[int], *args) -> float:
+    """1回あたりの平均所要時間（ミリ秒）"""
+    started = time.perf_counter()
+    for value in queries:
+        func(value, *args)
+    return (time.perf_counter() - started) * 1000 / len(queries)
+
+
+def main() -> None:
+    """ベンチマークを実行"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    hashes = {item_id: rng.getrandbits(HASH_BITS) for item_id in range(1, args.count + 1)}
+
+    started = time.perf_counter()
+    index = MultiIndexHash()
+    for item_id, value in hashes.items():
+        index.add(item_id, value)
+    print(f"索引の作成: {args.count}件 {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    queries = make_queries(rng, hashes, args.queries)
+    print(f"{'距離':>4} {'全件比較':>12} {'索引':>12} {'倍率':>8}")
+    for threshold in THRESHOLDS:
+        for value in queries[:10]:
+            assert index.query(value, threshold) == linear_query(hashes, value, threshold)
+
+        linear_ms = average_ms(lambda value: linear_query(hashes, value, threshold), queries)
+        index_ms = average_ms(index.query, queries, threshold)
+        print(f"{threshold:>4} {linear_ms:10.2f}ms {index_ms:10.3f}ms {linear_ms / index_ms:7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""履歴テーブルの旧形式とコンパクト形式のサイズ比較ベンチマーク
+
+実行方法: python benchmarks/bench_schema.py [--rows N]
+
+同じ内容の履歴を旧形式（16進文字列のハッシュ、カテゴリ名、日時文字列）と
+コンパクト形式（32バイトのハッシュ、カテゴリコード、エポックミリ秒）の
+テーブルに書き込み、テーブルとインデックスごとのサイズと1行あたりの幅を比較する。
+"""
+import argparse
+import hashlib
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import CATEGORIES  # noqa: E402
+from database import COMPACT_HISTORY_TABLE, COMPACT_HISTORY_INDEXES  # noqa: E402
+
+
+# 旧形式（スキーマバージョン5）の履歴テーブル
+LEGACY_HISTORY_TABLE = """
+    CREATE TABLE clipboard_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content_type TEXT NOT NULL,
+        content TEXT,
+        image_path TEXT,
+        content_hash TEXT NOT NULL UNIQUE,
+        category TEXT NOT NULL,
+        is_favorite BOOLEAN DEFAULT FALSE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        size_bytes INTEGER,
+        content_encoding INTEGER NOT NULL DEFAULT 0,
+        preview TEXT,
+        line_count INTEGER NOT NULL DEFAULT 0,
+        last_used_at DATETIME,
+        copy_count INTEGER NOT NULL DEFAULT 1
+    )
+"""
+
+LEGACY_HISTORY_INDEXES = (
+    "CREATE INDEX idx_created_at ON clipboard_history(created_at)",
+    "CREATE INDEX idx_content_hash ON clipboard_history(content_hash)",
+    "CREATE INDEX idx_size_pending ON clipboard_history(id) WHERE size_bytes IS NULL",
+    "CREATE INDEX idx_last_used_at ON clipboard_history(last_used_at)",
+    "CREATE INDEX idx_category_last_used_at ON clipboard_history(category, last_used_at)",
+    "CREATE INDEX idx_is_favorite_last_used_at ON clipboard_history(is_favorite, last_used_at)",
+)
+
+
+def build_rows(rows: int, seed: int = 0) -> list[dict]:
+    """ベンチマーク用の履歴を生成"""
+    rng = random.Random(seed)
+    categories = list(CATEGORIES)
+    now = time.time()
+
+    entries = []
+    for i in range(rows):
+        preview = f"会議メモ {i}: https://example.com/items/{rng.randint(1, 99999)}"[:rng.randint(10, 60)]
+        created = now - rng.random() * 365 * 86400
+        entries.append({
+            "id": i + 1,
+            "hash": hashlib.sha256(f"{i}".encode()).hexdigest(),
+            "category": rng.choice(categories),
+            "is_favorite": rng.random() < 0.05,
+            "created": created,
+            "last_used": created + rng.random() * 86400,
+            "preview": preview,
+            "size_bytes": len(preview.encode("utf-8")),
+        })
+    return entries
+
+
+def write_legacy(path: Path, entries: list[dict]) -> None:
+    """旧形式で書き込む"""
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_HISTORY_TABLE)
+    for index in LEGACY_HISTORY_INDEXES:
+        conn.execute(index)
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO clipboard_history
+                (id, content_type, content_hash, category, is_favorite, created_at, last_used_at,
+                 size_bytes, preview, line_count)
+            VALUES (?, 'text', ?, ?, ?, ?, ?, ?, ?, 1)
+            """,
+            [
+                (
+                    e["id"], e["hash"], e["category"], e["is_favorite"],
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(e["created"])),
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(e["last_used"])) + f".{e['id'] % 1000:03d}",
+                    e["size_bytes"], e["preview"],
+                )
+                for e in entries
+            ],
+        )
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def write_compact(path: Path, entries: list[dict]) -> None:
+    """コンパクト形式で書き込む"""
+    codes = {name: code for code, name in enumerate(CATEGORIES, start=1)}
+
+    conn = sqlite3.connect(path)
+    conn.execute(COMPACT_HISTORY_TABLE)
+    for index in COMPACT_HISTORY_INDEXES:
+        conn.execute(index)
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO clipboard_history_v2
+                (id, content_type, content_hash, category, is_favorite, created_at, last_used_at,
+                 size_bytes, preview, line_count)
+            VALUES (?, 'text', ?, ?, ?, ?, ?, ?, ?, 1)
+            """,
+            [
+                (
+                    e["id"], bytes.fromhex(e["hash"]), codes[e["category"]], e["is_favorite"],
+                    int(e["created"] * 1000), int(e["last_used"] * 1000),
+                    e["size_bytes"], e["preview"],
+                )
+                for e in entries
+            ],
+        )
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def measure(path: Path) -> list[tuple[str, int, float]]:
+    """テーブル・インデックスごとの(名前, バイト数, 1行あたりの平均ペイロード)を取得"""
+    conn = sqlite3.connect(path)
+    rows = conn.execute(
+        """
+        SELECT name, SUM(pgsize), SUM(payload) * 1.0 / MAX(SUM(ncell), 1)
+        FROM dbstat WHERE pagetype IN ('leaf', 'internal') OR pagetype IS NULL
+        GROUP BY name ORDER BY name
+        """
+    ).fetchall()
+    conn.close()
+    return [row for row in rows if row[0].startswith(("clipboard_history", "idx_", "sqlite_autoindex_clipboard"))]
+
+
+def main() -> None:
+    """ベンチマークを実行"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    entries = build_rows(args.rows)
+    print(f"履歴: {args.rows}件")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, writer in (("旧形式", write_legacy), ("コンパクト形式", write_compact)):
+            path = Path(tmp) / f"{label}.db"
+            writer(path, entries)
+
+            print()
+            print(f"{label}: {path.stat().st_size / 1024 / 1024:.1f} MB")
+            print(f"  {'名前':40} {'サイズ':>10} {'1行の幅':>8}")
+            for name, size, width in measure(path):
+                print(f"  {name:40} {size / 1024:8.0f}KB {width:7.1f}B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""テキストの編集版の検索時間のベンチマーク
+
+実行方法: python benchmarks/bench_text_grouping.py [--rows N] [--queries N]
+
+SimHashの索引トリガー付きの履歴テーブルにN件（初期値100万件）を書き込み、
+追加時に行う編集前の版の検索（索引の区間のキーで候補を引く）と、全件のSimHashを
+読んで比較する方式の時間を比較する。書き込み時のトリガーの負担も測る。
+問い合わせの半分は登録済みのSimHashを数ビット変えたもの（編集版あり）にする。
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import MAX_TEXT_GROUP_THRESHOLD, TEXT_SIMHASH_BAND_TABLE, TEXT_SIMHASH_BAND_TRIGGERS  # noqa: E402
+from hamming_index import HASH_BITS, band_keys, from_signed, to_signed  # noqa: E402
+
+
+# 履歴テーブルのうちSimHashに関わるカラム
+HISTORY_TABLE = """
+    CREATE TABLE clipboard_history (
+        id INTEGER PRIMARY KEY,
+        text_simhash INTEGER
+    )
+"""
+
+# 索引から候補を引くクエリ（database._similar_textsと同じ形）
+BAND_QUERY = "SELECT history_id, simhash FROM text_simhash_band WHERE key IN ({placeholders})"
+
+# 全件を読むクエリ
+SCAN_QUERY = "SELECT id, text_simhash FROM clipboard_history WHERE text_simhash IS NOT NULL"
+
+
+def write_history(path: Path, hashes: list[int], triggers: bool) -> float:
+    """履歴を書き込んで所要時間（秒）を返す"""
+    conn = sqlite3.connect(path)
+    conn.execute(HISTORY_TABLE)
+    if triggers:
+        conn.execute(TEXT_SIMHASH_BAND_TABLE)
+        for trigger in TEXT_SIMHASH_BAND_TRIGGERS:
+            conn.execute(trigger)
+
+    started = time.perf_counter()
+    with conn:
+        conn.executemany(
+            "INSERT INTO clipboard_history (text_simhash) VALUES (?)",
+            ((to_signed(value),) for value in hashes),
+        )
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def band_search(conn: sqlite3.Connection, value: int) -> list[int]:
+    """索引で距離MAX_TEXT_GROUP_THRESHOLD以内の履歴を探す"""
+    keys = band_keys(value, MAX_TEXT_GROUP_THRESHOLD)
+    rows = conn.execute(BAND_QUERY.format(placeholders=", ".join("?" * len(keys))), keys)
+    return sorted({
+        history_id for history_id, stored in rows
+        if (value ^ from_signed(stored)).bit_count() <= MAX_TEXT_GROUP_THRESHOLD
+    })
+
+
+def scan_search(conn: sqlite3.Connection, value: int) -> list[int]:
+    """全件と比較して距離MAX_TEXT_GROUP_THRESHOLD以内の履歴を探す"""
+    return sorted(
+        history_id for history_id, stored in conn.execute(SCAN_QUERY)
+        if (value ^ from_signed(stored)).bit_count() <= MAX_TEXT_GROUP_THRESHOLD
+    )
+
+
+def make_queries(rng: random.Random, hashes: list[int], count: int) -> list[int]:
+    """問い合わせのSimHash（半分は登録済みのSimHashから数ビット変えたもの）"""
+    queries = []
+    for i in range(count):
+        if i % 2:
+            queries.append(rng.getrandbits(HASH_BITS))
+        else:
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(HASH_BITS), rng.randint(0, MAX_TEXT_GROUP_THRESHOLD)):
+                value ^= 1 << bit
+            queries.append(value)
+    return queries
+
+
+def average_ms(func, conn: sqlite3.Connection, queries: list[int]) -> float:
+    """1回あたりの平均所要時間（ミリ秒）"""
+    started = time.perf_counter()
+    for value in queries:
+        func(conn, value)
+    return (time.perf_counter() - started) * 1000 / len(queries)
+
+
+def main() -> None:
+    """ベンチマークを実行"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(HASH_BITS) for _ in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = Path(tmp) / "plain.db"
+        indexed_path = Path(tmp) / "indexed.db"
+        plain_s = write_history(plain_path, hashes, triggers=False)
+        indexed_s = write_history(indexed_path, hashes, triggers=True)
+        print(f"書き込み {args.rows}件: 索引なし {plain_s:.1f}s / 索引あり {indexed_s:.1f}s")
+
+        conn = sqlite3.connect(indexed_path)
+        queries = make_queries(rng, hashes, args.queries)
+        scan_queries = queries[:max(len(queries) // 20, 2)]
+        for value in scan_queries:
+            assert band_search(conn, value) == scan_search(conn, value)
+
+        band_ms = average_ms(band_search, conn, queries)
+        scan_ms = average_ms(scan_search, conn, scan_queries)
+        print(f"距離{MAX_TEXT_GROUP_THRESHOLD}以内の検索: 全件比較 {scan_ms:.1f}ms / 索引 {band_ms:.2f}ms ({scan_ms / band_ms:.0f}x)")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
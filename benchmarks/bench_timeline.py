@@ -0,0 +1,127 @@
+"""タイムライン集計のベンチマーク
+
+実行方法: python benchmarks/bench_timeline.py [--rows N]
+
+3年分の履歴を集計トリガー付きのテーブルに書き込み、トリガーで維持した
+1時間ごとの集計から日ごと・時間ごとの件数を読む時間と、履歴テーブルを
+GROUP BYで集計する時間を比較する。書き込み時のトリガーの負担も測る。
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import TIMELINE_BUCKET_MS, TIMELINE_TABLE, TIMELINE_TRIGGERS  # noqa: E402
+
+
+# 履歴テーブルのうちタイムラインに関わるカラム
+HISTORY_TABLE = """
+    CREATE TABLE clipboard_history (
+        id INTEGER PRIMARY KEY,
+        category INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        deleted_at INTEGER
+    )
+"""
+
+DAY_MS = 86400 * 1000
+SPAN_DAYS = 3 * 365
+CATEGORY_COUNT = 7
+
+# 集計済みテーブルから読むクエリ（database.get_activity_timelineと同じ形、UTCで区切る）
+TIMELINE_QUERY = """
+    SELECT bucket / ? AS slot, category, SUM(count) AS count
+    FROM history_timeline WHERE bucket >= ? AND bucket < ?
+    GROUP BY slot, category HAVING SUM(count) > 0
+"""
+
+# 履歴テーブルを直接集計するクエリ
+GROUP_BY_QUERY = """
+    SELECT created_at / ? AS slot, category, COUNT(*) AS count
+    FROM clipboard_history WHERE deleted_at IS NULL AND created_at >= ? AND created_at < ?
+    GROUP BY slot, category
+"""
+
+
+def write_history(path: Path, rows: int, triggers: bool) -> float:
+    """履歴を書き込んで所要時間（秒）を返す"""
+    rng = random.Random(0)
+    now = int(time.time() * 1000)
+
+    conn = sqlite3.connect(path)
+    conn.execute(HISTORY_TABLE)
+    conn.execute("CREATE INDEX idx_history_created_at ON clipboard_history(created_at)")
+    if triggers:
+        conn.execute(TIMELINE_TABLE)
+        for trigger in TIMELINE_TRIGGERS:
+            conn.execute(trigger)
+
+    started = time.perf_counter()
+    with conn:
+        conn.executemany(
+            "INSERT INTO clipboard_history (category, created_at) VALUES (?, ?)",
+            (
+                (rng.randint(1, CATEGORY_COUNT), now - rng.randint(0, SPAN_DAYS * DAY_MS))
+                for _ in range(rows)
+            ),
+        )
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def bench_query(conn: sqlite3.Connection, query: str, params: tuple, repeat: int = 5) -> tuple[float, int]:
+    """クエリの最短所要時間（ミリ秒）と結果の行数"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = conn.execute(query, params).fetchall()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, len(rows)
+
+
+def main() -> None:
+    """ベンチマークを実行"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    now = int(time.time() * 1000)
+    bucket_now = now // TIMELINE_BUCKET_MS + 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = Path(tmp) / "plain.db"
+        timeline_path = Path(tmp) / "timeline.db"
+
+        plain_s = write_history(plain_path, args.rows, triggers=False)
+        timeline_s = write_history(timeline_path, args.rows, triggers=True)
+        print(f"履歴: {args.rows}件（{SPAN_DAYS}日分）")
+        print(f"書き込み: トリガーなし {plain_s:.2f}s / トリガーあり {timeline_s:.2f}s")
+        print()
+
+        conn = sqlite3.connect(timeline_path)
+        cases = (
+            ("直近30日（日ごと）", 24, 30 * 24),
+            ("直近1年（日ごと）", 24, 365 * 24),
+            ("直近48時間（時間ごと）", 1, 48),
+        )
+
+        print(f"{'':24} {'集計テーブル':>12} {'GROUP BY':>12} {'行数':>8}")
+        for label, hours, span_hours in cases:
+            timeline_ms, count = bench_query(conn, TIMELINE_QUERY, (hours, bucket_now - span_hours, bucket_now))
+            group_ms, _ = bench_query(
+                conn, GROUP_BY_QUERY,
+                (hours * TIMELINE_BUCKET_MS, (bucket_now - span_hours) * TIMELINE_BUCKET_MS, bucket_now * TIMELINE_BUCKET_MS),
+                repeat=1,
+            )
+            print(f"{label:24} {timeline_ms:10.2f}ms {group_ms:10.2f}ms {count:8}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
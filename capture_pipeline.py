@@ -0,0 +1,390 @@
+"""履歴の取り込みパイプラインモジュール
+
+クリップボードの内容の読み取り（スナップショット）だけをGUIスレッドで行い、
+ハッシュ計算・カテゴリ分類（AI分類を含む）・画像のエンコードと保存は
+スレッドプールで行う。処理の終わった順ではなく取り込んだ順に、
+GUIスレッドで書き込みスレッドへ渡す。
+既存の画像の知覚ハッシュのバックフィルも、画像の読み込みと計算は別スレッドで行い、
+書き込みだけをアイドル時タスクで行う。
+"""
+import hashlib
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from database import check_hash_exists, remove_image_files, get_perceptual_hash_backlog, store_perceptual_hashes
+from categorizer import categorize, is_image_file, extract_file_path
+from capture_writer import CaptureWriter
+from image_capture import (
+    image_hash, encode_png, legacy_image_hash, perceptual_hash, perceptual_hash_file, save_png,
+)
+from text_fingerprint import simhash
+
+
+# 処理中の取り込みがこの件数以上ある場合は、AI分類を行わずルールベースで分類する（遅れを溜めないため）
+MAX_PENDING = 4
+
+# 同時に処理する画像の上限（超えた分は取り込んだ順に待たせる、取り込まないことはない）
+MAX_PENDING_IMAGES = 2
+
+# 取り込みを処理するスレッド数
+WORKER_COUNT = 2
+
+# 知覚ハッシュのバックフィルで1回に計算する既存の画像の数
+BACKFILL_BATCH_SIZE = 20
+
+# 所要時間を記録する段階
+#   snapshot: GUIスレッドでクリップボードを読み取る時間
+#   queue: スレッドプールで処理が始まるまでの待ち時間
+#   hash / categorize / encode: 各処理の時間（encodeは画像のエンコードと書き込み）
+#   perceptual: 画像の知覚ハッシュの計算時間
+#   simhash: テキストのSimHash（編集版の判定用の指紋）の計算時間
+#   order: 処理が終わってから、先に取り込んだものの完了を待った時間
+#   total: 読み取りから書き込みスレッドに渡すまでの時間
+STAGES = ("snapshot", "queue", "hash", "categorize", "encode", "perceptual", "simhash", "order", "total")
+
+
+class CaptureTask(QRunnable):
+    """1件の取り込みをスレッドプールで処理するタスク"""
+
+    def __init__(self, pipeline: "CapturePipeline", seq: int, snapshot: dict):
+        super().__init__()
+        self._pipeline = pipeline
+        self._seq = seq
+        self._snapshot = snapshot
+
+    def run(self) -> None:
+        """処理して結果をパイプラインに渡す"""
+        try:
+            result = self._pipeline._process(self._snapshot)
+        except Exception as e:
+            print(f"履歴の取り込みに失敗: {e}")
+            result = None
+        self._pipeline._finish(self._seq, result)
+
+
+class CapturePipeline(QObject):
+    """クリップボードのスナップショットを別スレッドで処理して書き込むクラス
+
+    直前に取り込んだ内容と同じハッシュのものは書き込まない
+    （処理中にも確認して分類やエンコードを省き、取り込んだ順に渡す時にも確認する）。
+    """
+
+    _result_ready = pyqtSignal()  # 処理の完了（スレッドプールから発行され、GUIスレッドで処理される）
+
+    def __init__(self, writer: CaptureWriter, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._writer = writer
+        self._use_ai = False
+        self._last_hash: Optional[str] = None  # 処理スレッドからも読む（文字列の参照の置き換えのみ）
+
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(WORKER_COUNT)
+
+        self._lock = threading.Lock()
+        self._results: dict[int, Optional[dict]] = {}  # 処理が終わった取り込み（番号ごと）
+        self._next_seq = 0  # 次に割り当てる番号
+        self._next_commit = 0  # 次に書き込みスレッドへ渡す番号
+        self._deferred: deque[tuple[int, dict]] = deque()  # 上限を超えて待たせている画像（番号とスナップショット）
+        self._running_images: set[int] = set()  # 処理中の画像の番号
+        self._rule_based = 0  # 処理の遅れのためAI分類を行わなかった件数
+
+        self._timings = {stage: {"count": 0, "total_ms": 0.0, "max_ms": 0.0} for stage in STAGES}
+
+        self._result_ready.connect(self._commit_ready)
+
+    def set_use_ai(self, use_ai: bool) -> None:
+        """AI分類の使用を設定"""
+        self._use_ai = use_ai
+
+    def set_last_hash(self, content_hash: str) -> None:
+        """直前の内容のハッシュを設定（アプリ自身がコピーした内容を取り込まないため）"""
+        self._last_hash = content_hash
+
+    def pending_count(self) -> int:
+        """処理中（書き込みスレッドに渡していない）取り込みの数"""
+        return self._next_seq - self._next_commit
+
+    def submit(self, snapshot: dict) -> None:
+        """スナップショットの処理を開始
+
+        snapshotは{"kind": "text", "text": ...}または{"kind": "image", "image": QImage}で、
+        "started"に読み取りを始めた時刻（time.perf_counter）を含める。
+        テキストはすぐに処理を始める（処理中の取り込みが多い場合はAI分類を行わない）。
+        画像は同時に処理する件数を制限し、超えた分は取り込んだ順に待たせる。
+        """
+        now = time.perf_counter()
+        self._record("snapshot", now - snapshot["started"])
+        snapshot["queued"] = now
+
+        if snapshot["kind"] == "text":
+            snapshot["use_ai"] = self._use_ai and self.pending_count() < MAX_PENDING
+            if self._use_ai and not snapshot["use_ai"]:
+                self._rule_based += 1
+
+        seq = self._next_seq
+        self._next_seq += 1
+
+        if snapshot["kind"] == "image" and (self._deferred or len(self._running_images) >= MAX_PENDING_IMAGES):
+            self._deferred.append((seq, snapshot))
+            return
+
+        self._start(seq, snapshot)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """処理中の取り込みを書き込みスレッドに渡し終えるまで待つ"""
+        deadline = time.monotonic() + timeout
+        while self.pending_count():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"取り込み中の履歴を破棄: {self.pending_count()}件")
+                break
+            self._pool.waitForDone(int(remaining * 1000))
+            self._commit_ready()
+
+    def stats(self) -> dict[str, object]:
+        """段階ごとの所要時間（件数・合計・最大、ミリ秒）と処理中・待機中の件数、AI分類を省いた件数"""
+        return {
+            "stages": {stage: dict(timing) for stage, timing in self._timings.items()},
+            "pending": self.pending_count(),
+            "deferred": len(self._deferred),
+            "rule_based": self._rule_based,
+        }
+
+    def _start(self, seq: int, snapshot: dict) -> None:
+        """割り当てた番号でスレッドプールで処理"""
+        if snapshot["kind"] == "image":
+            self._running_images.add(seq)
+        self._pool.start(CaptureTask(self, seq, snapshot))
+
+    def _record(self, stage: str, seconds: float) -> None:
+        """段階の所要時間を記録"""
+        timing = self._timings[stage]
+        ms = seconds * 1000
+        timing["count"] += 1
+        timing["total_ms"] += ms
+        timing["max_ms"] = max(timing["max_ms"], ms)
+
+    def _process(self, snapshot: dict) -> Optional[dict]:
+        """スナップショットを処理（スレッドプールで実行）
+
+        書き込みスレッドに渡す内容（entry、直前と同じ内容ならNone）と、
+        ハッシュ、各段階の所要時間を返す。
+        """
+        timings = {"queue": time.perf_counter() - snapshot["queued"]}
+
+        started = time.perf_counter()
+        if snapshot["kind"] == "image":
+            content_hash = image_hash(snapshot["image"])
+        else:
+            text = snapshot["text"].strip()
+            if not text:
+                return None
+            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        timings["hash"] = time.perf_counter() - started
+
+        result = {
+            "content_hash": content_hash,
+            "entry": None,
+            "timings": timings,
+            "started": snapshot["started"],
+        }
+
+        # 直前の内容と同じなら分類・エンコードしない
+        if content_hash == self._last_hash:
+            return result
+
+        if snapshot["kind"] == "image":
+            result["entry"] = {
+                "content_type": "image",
+                "content_hash": content_hash,
+                "category": "image",
+            }
+
+            # 履歴にある画像は最終使用日時の更新だけになるため、エンコードもハッシュ計算もしない
+            if check_hash_exists(content_hash, live_only=True):
+                return result
+
+            started = time.perf_counter()
+            png_data = encode_png(snapshot["image"])
+            timings["encode"] = time.perf_counter() - started
+
+            # 以前の形式（PNGのバイト列）のハッシュで保存された履歴なら、その履歴を現在のハッシュに置き換える
+            legacy_hash = legacy_image_hash(png_data)
+            if check_hash_exists(legacy_hash, live_only=True):
+                result["entry"]["legacy_hash"] = legacy_hash
+                return result
+
+            started = time.perf_counter()
+            image_path = save_png(png_data)
+            timings["encode"] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            result["entry"].update(
+                image_path=str(image_path),
+                owns_image=True,
+                perceptual_hash=perceptual_hash(snapshot["image"]),
+            )
+            timings["perceptual"] = time.perf_counter() - started
+            return result
+
+        # カテゴリ分類（既存の履歴と重複する場合はカテゴリが更新されないため、AI分類を行わない）
+        started = time.perf_counter()
+        use_ai = snapshot["use_ai"] and not check_hash_exists(content_hash)
+        category = categorize(text, use_ai=use_ai)
+        timings["categorize"] = time.perf_counter() - started
+
+        entry = {
+            "content_type": "text",
+            "content": text,
+            "content_hash": content_hash,
+            "category": category,
+        }
+
+        # 画像ファイルパスの場合は特別処理
+        if category == "image" and is_image_file(text):
+            # file:///形式からパスを抽出、または直接パスとして使用
+            file_path = extract_file_path(text)
+            if file_path is None:
+                file_path = text
+
+            if Path(file_path).exists():
+                # 元のURLも保存
+                started = time.perf_counter()
+                entry.update(
+                    content_type="image",
+                    image_path=file_path,
+                    perceptual_hash=perceptual_hash_file(file_path),
+                )
+                timings["perceptual"] = time.perf_counter() - started
+            else:
+                # ファイルが存在しない場合はURLとして保存
+                entry["category"] = "url"
+        else:
+            started = time.perf_counter()
+            entry["text_simhash"] = simhash(text, category)
+            timings["simhash"] = time.perf_counter() - started
+
+        result["entry"] = entry
+        return result
+
+    def _finish(self, seq: int, result: Optional[dict]) -> None:
+        """処理の完了を記録してGUIスレッドに通知（スレッドプールで実行）"""
+        if result is not None:
+            result["finished"] = time.perf_counter()
+        with self._lock:
+            self._results[seq] = result
+        self._result_ready.emit()
+
+    def _commit_ready(self) -> None:
+        """取り込んだ順に、処理の終わったものを書き込みスレッドへ渡す"""
+        with self._lock:
+            self._running_images = {seq for seq in self._running_images if seq not in self._results and seq >= self._next_commit}
+
+        while True:
+            with self._lock:
+                if self._next_commit not in self._results:
+                    break
+                result = self._results.pop(self._next_commit)
+            self._next_commit += 1
+
+            if result is not None:
+                self._commit(result)
+
+        # 待たせていた画像を開始
+        while self._deferred and len(self._running_images) < MAX_PENDING_IMAGES:
+            seq, snapshot = self._deferred.popleft()
+            self._start(seq, snapshot)
+
+    def _commit(self, result: dict) -> None:
+        """1件を書き込みスレッドへ渡し、所要時間を記録"""
+        now = time.perf_counter()
+        for stage, seconds in result["timings"].items():
+            self._record(stage, seconds)
+        self._record("order", now - result["finished"])
+        self._record("total", now - result["started"])
+
+        entry = result["entry"]
+        if entry is None:
+            return
+
+        if result["content_hash"] == self._last_hash:
+            # 処理中に同じ内容が先に書き込まれた場合
+            if entry.get("owns_image"):
+                remove_image_files([entry["image_path"]])
+            return
+
+        self._writer.submit(**entry)
+        self._last_hash = result["content_hash"]
+
+
+class PerceptualHashTask(QRunnable):
+    """既存の画像の知覚ハッシュをまとめて計算するタスク"""
+
+    def __init__(self, backfill: "PerceptualHashBackfill", images: list[tuple[int, str]]):
+        super().__init__()
+        self._backfill = backfill
+        self._images = images
+
+    def run(self) -> None:
+        """画像を読み込んでハッシュを計算し、結果をバックフィルに渡す（読み込めなければNone）"""
+        hashes = []
+        for history_id, image_path in self._images:
+            try:
+                value = perceptual_hash_file(image_path)
+            except Exception as e:
+                print(f"知覚ハッシュの計算に失敗: {e}")
+                value = None
+            hashes.append((history_id, value))
+        self._backfill._finish(hashes)
+
+
+class PerceptualHashBackfill(QObject):
+    """既存の画像の知覚ハッシュを別スレッドで計算し、アイドル時タスクで書き込むクラス
+
+    run_stepをアイドル時タスクとして登録する。GUIスレッドでは画像を読み込まない。
+    """
+
+    def __init__(self, parent: Optional[QObject] = None, batch_size: int = BACKFILL_BATCH_SIZE):
+        super().__init__(parent)
+        self._batch_size = batch_size
+
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+
+        self._lock = threading.Lock()
+        self._running = False  # 計算中のタスクがあるか（GUIスレッドだけが読み書きする）
+        self._results: Optional[list[tuple[int, Optional[int]]]] = None  # 計算の終わったハッシュ
+
+    def run_step(self) -> bool:
+        """計算の終わったハッシュを書き込み、次の画像の計算を始める（作業が残っていればTrue）"""
+        with self._lock:
+            results, self._results = self._results, None
+
+        if results is not None:
+            store_perceptual_hashes(results)
+            self._running = False
+
+        if self._running:
+            return True
+
+        images = get_perceptual_hash_backlog(self._batch_size)
+        if not images:
+            return False
+
+        self._running = True
+        self._pool.start(PerceptualHashTask(self, images))
+        return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """計算中のタスクの終了を待つ（書き込まなかった分は次回の起動で計算し直す）"""
+        self._pool.waitForDone(int(timeout * 1000))
+
+    def _finish(self, hashes: list[tuple[int, Optional[int]]]) -> None:
+        """計算結果を記録（スレッドプールで実行）"""
+        with self._lock:
+            self._results = hashes
@@ -0,0 +1,153 @@
+"""履歴書き込みモジュール（ライトビハインド方式）"""
+import queue
+import threading
+import time
+from typing import Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from database import add_history_many, set_synchronous, close_connection, remove_image_files
+
+
+# 書き込みの耐久性モード
+#   synchronous: 書き込みスレッドの接続に設定するPRAGMA synchronous
+#   max_delay: 最初の要求を受け取ってから後続の要求をまとめるまでの待ち時間（秒）
+DURABILITY_MODES = {
+    "strict": {"synchronous": "FULL", "max_delay": 0.0},
+    "normal": {"synchronous": "NORMAL", "max_delay": 0.02},
+    "relaxed": {"synchronous": "OFF", "max_delay": 0.25},
+}
+
+DEFAULT_DURABILITY = "normal"
+
+# 1トランザクションにまとめる最大件数
+MAX_BATCH_SIZE = 500
+
+
+class CaptureWriter(QObject):
+    """専用スレッドで履歴をまとめて書き込むクラス"""
+
+    # 履歴が書き込まれたときのシグナル（書き込みスレッドから発行され、受信側のスレッドで処理される）
+    history_written = pyqtSignal(int)  # 追加または最近使ったものとして更新された履歴のID
+
+    _STOP = object()
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._durability = DEFAULT_DURABILITY
+
+    def start(self) -> None:
+        """書き込みスレッドを開始"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._thread = threading.Thread(target=self._run, name="CaptureWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """未処理の要求を書き込んでからスレッドを停止"""
+        if self._thread is None:
+            return
+
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def set_durability(self, mode: str) -> None:
+        """耐久性モードを設定（次のバッチから反映）"""
+        if mode not in DURABILITY_MODES:
+            mode = DEFAULT_DURABILITY
+        self._durability = mode
+
+    def submit(
+        self,
+        content_type: str,
+        content_hash: str,
+        category: str,
+        content: Optional[str] = None,
+        image_path: Optional[str] = None,
+        owns_image: bool = False,
+        perceptual_hash: Optional[int] = None,
+        text_simhash: Optional[int] = None,
+        legacy_hash: Optional[str] = None,
+    ) -> None:
+        """履歴の追加を要求（owns_imageがTrueなら既存の履歴と重複した時に画像ファイルを削除）
+
+        perceptual_hashは画像の知覚ハッシュで、類似画像の設定に応じて既存の画像とまとめる。
+        text_simhashはテキストのSimHashで、編集前の版のテキストとまとめる。
+        legacy_hashは以前の形式の画像のハッシュで、その履歴をcontent_hashに置き換える。
+        """
+        self._queue.put({
+            "content_type": content_type,
+            "content_hash": content_hash,
+            "category": category,
+            "content": content,
+            "image_path": image_path,
+            "owns_image": owns_image,
+            "perceptual_hash": perceptual_hash,
+            "text_simhash": text_simhash,
+            "legacy_hash": legacy_hash,
+        })
+
+    def _run(self) -> None:
+        """書き込みスレッドのメインループ"""
+        applied_mode = None
+
+        try:
+            while True:
+                entries, stopping = self._collect_batch()
+
+                mode = self._durability
+                if mode != applied_mode:
+                    set_synchronous(DURABILITY_MODES[mode]["synchronous"])
+                    applied_mode = mode
+
+                if entries:
+                    self._write_batch(entries)
+
+                if stopping:
+                    break
+        finally:
+            close_connection()
+
+    def _collect_batch(self) -> tuple[list[dict], bool]:
+        """キューから1トランザクション分の要求を集める"""
+        first = self._queue.get()
+        if first is self._STOP:
+            return [], True
+
+        entries = [first]
+        deadline = time.monotonic() + DURABILITY_MODES[self._durability]["max_delay"]
+
+        while len(entries) < MAX_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    # 待ち時間を過ぎても既に溜まっている要求はまとめて書き込む
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if entry is self._STOP:
+                return entries, True
+            entries.append(entry)
+
+        return entries, False
+
+    def _write_batch(self, entries: list[dict]) -> None:
+        """要求をまとめて書き込み、追加・更新されたIDを通知"""
+        try:
+            results = add_history_many(entries)
+        except Exception as e:
+            print(f"履歴の書き込みに失敗: {e}")
+            return
+
+        for entry, (history_id, inserted) in zip(entries, results):
+            if not inserted and entry["owns_image"] and entry["image_path"]:
+                # 重複していた場合は保存済みの画像ファイルを削除
+                remove_image_files([entry["image_path"]])
+            self.history_written.emit(history_id)
@@ -0,0 +1,201 @@
+"""クリップボードの変更検出モジュール
+
+内容を読み込む前に、安価な指紋（Windowsのシーケンス番号、macOSの変更カウント、
+それ以外では形式の一覧・アプリ自身が所有しているか・テキストの長さとハッシュ）で
+クリップボードが変わったかを判定する。
+変更はQClipboard.dataChangedで受け取り、シグナルが届かない環境だと分かった場合だけ
+間隔を伸ばしながらポーリングする。
+形式の一覧による指紋では画像どうしの変更を区別できないため、内容の重複は
+取り込みパイプラインのハッシュで判定する。
+"""
+import sys
+from typing import Callable, Hashable, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal, QTimer
+from PyQt6.QtGui import QClipboard
+
+
+# ポーリング間隔の最小値と最大値（ミリ秒、変更がないたびに2倍にする）
+POLL_MIN_INTERVAL = 500
+POLL_MAX_INTERVAL = 4000
+
+# シグナルが届くと分かった後に取りこぼしを確認する間隔（ミリ秒）
+VERIFY_INTERVAL = 60000
+
+# シグナルを信頼するまでに必要な、シグナルで検出した変更の回数
+SIGNAL_TRUST_COUNT = 2
+
+# ポーリングに戻るまでに許す、シグナルが届かなかった変更の回数
+SIGNAL_MISS_LIMIT = 2
+
+
+def _windows_sequence_number() -> Optional[Callable[[], int]]:
+    """Windowsのクリップボードのシーケンス番号を取得する関数（変更のたびに増える）"""
+    try:
+        import ctypes
+        get_sequence_number = ctypes.windll.user32.GetClipboardSequenceNumber
+        get_sequence_number.restype = ctypes.c_uint32
+        return get_sequence_number
+    except Exception:
+        return None
+
+
+def _macos_change_count() -> Optional[Callable[[], int]]:
+    """macOSのペーストボードの変更カウントを取得する関数（pyobjcがある場合のみ）"""
+    try:
+        from AppKit import NSPasteboard
+    except ImportError:
+        return None
+    pasteboard = NSPasteboard.generalPasteboard()
+    return lambda: int(pasteboard.changeCount())
+
+
+def _platform_sequence() -> Optional[Callable[[], int]]:
+    """プラットフォームのクリップボード変更番号を取得する関数（使えない場合はNone）"""
+    if sys.platform == "win32":
+        return _windows_sequence_number()
+    if sys.platform == "darwin":
+        return _macos_change_count()
+    return None
+
+
+def mime_fingerprint(clipboard: QClipboard) -> Hashable:
+    """形式の一覧とアプリ自身が所有しているか、テキストの長さとハッシュによる指紋
+
+    テキストどうしの変更をポーリングで見つけるため、テキストだけは読み込む。
+    画像は転送とエンコードに時間がかかるため読み込まない。
+    """
+    mime_data = clipboard.mimeData()
+    if mime_data is None:
+        return None
+
+    text_key = None
+    if mime_data.hasText():
+        text = mime_data.text()
+        text_key = (len(text), hash(text))
+    return tuple(mime_data.formats()), clipboard.ownsClipboard(), text_key
+
+
+class ClipboardChangeDetector(QObject):
+    """クリップボードの変更を検出してchangedを発行するクラス
+
+    プラットフォームの変更番号が使える場合は、dataChangedとポーリングのどちらで気づいても
+    指紋が前回と同じなら発行しない（同じ変更で両方が発火した場合や、アプリ自身のコピーを除く）。
+    形式の一覧による指紋では、dataChangedは指紋が同じでも発行する（画像どうしの変更を区別できないため）。
+    起動直後はポーリングも行い、シグナルで変更を受け取れることを確認したら
+    取りこぼしの確認だけを低頻度で行う。シグナルが届かない変更をポーリングで
+    見つけた場合はポーリングに戻る。
+    """
+
+    changed = pyqtSignal()
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._clipboard: Optional[QClipboard] = None
+        self._sequence = _platform_sequence()
+        self._last_fingerprint: Hashable = None
+        self._polled_fingerprint: Hashable = None  # ポーリングで見つけ、まだシグナルが届いていない変更
+
+        self._signal_hits = 0  # 続けてシグナルで受け取れた変更の数
+        self._signal_misses = 0  # シグナルを信頼した後に取りこぼした変更の数
+        self._trusted = False
+        self._interval = POLL_MIN_INTERVAL
+        self._stats = {"signals": 0, "polls": 0, "changes": 0, "polled_changes": 0}
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._on_poll)
+
+    def fingerprint(self) -> Hashable:
+        """現在のクリップボードの指紋"""
+        if self._sequence is not None:
+            return self._sequence()
+        if self._clipboard is None:
+            return None
+        return mime_fingerprint(self._clipboard)
+
+    def start(self, clipboard: QClipboard) -> None:
+        """検出を開始（現在の内容も変更として通知する）"""
+        self._clipboard = clipboard
+        self._clipboard.dataChanged.connect(self._on_data_changed)
+        self._last_fingerprint = self.fingerprint()
+        self._interval = POLL_MIN_INTERVAL
+        self._timer.start(self._interval)
+        self.changed.emit()
+
+    def stop(self) -> None:
+        """検出を停止"""
+        self._timer.stop()
+        if self._clipboard is not None:
+            try:
+                self._clipboard.dataChanged.disconnect(self._on_data_changed)
+            except Exception:
+                pass
+            self._clipboard = None
+
+    def mark_current(self) -> None:
+        """現在の内容を通知済みとする（アプリ自身がコピーした直後に呼ぶ）"""
+        self._last_fingerprint = self.fingerprint()
+
+    def stats(self) -> dict[str, object]:
+        """シグナル・ポーリングの回数と現在の監視方式"""
+        return {**self._stats, "trusted": self._trusted, "interval": self._timer.interval() if self._timer.isActive() else 0}
+
+    def _on_data_changed(self) -> None:
+        """dataChanged受信時"""
+        self._stats["signals"] += 1
+        current = self.fingerprint()
+
+        if current == self._polled_fingerprint:
+            # ポーリングで見つけた直後に届いたシグナル（取りこぼしではない）
+            self._polled_fingerprint = None
+            self._signal_misses = max(self._signal_misses - 1, 0)
+            self._record_signal_hit()
+            return
+
+        if current == self._last_fingerprint and self._sequence is not None:
+            return
+
+        self._last_fingerprint = current
+        self._record_signal_hit()
+        self._emit_changed()
+
+    def _record_signal_hit(self) -> None:
+        """シグナルで変更を受け取れたことを記録（続けて受け取れたらポーリングをやめる）"""
+        self._signal_hits += 1
+        if not self._trusted and self._signal_hits >= SIGNAL_TRUST_COUNT:
+            self._trusted = True
+            self._signal_misses = 0
+            self._timer.start(VERIFY_INTERVAL)
+
+    def _on_poll(self) -> None:
+        """ポーリング時（変更がなければ間隔を伸ばす）"""
+        self._stats["polls"] += 1
+        current = self.fingerprint()
+
+        if current == self._last_fingerprint:
+            if self._trusted:
+                self._timer.start(VERIFY_INTERVAL)
+            else:
+                self._interval = min(self._interval * 2, POLL_MAX_INTERVAL)
+                self._timer.start(self._interval)
+            return
+
+        # シグナルが届いていない変更（直後にシグナルが届けば取りこぼしとしない）
+        self._last_fingerprint = current
+        self._polled_fingerprint = current
+        self._stats["polled_changes"] += 1
+        self._signal_hits = 0
+        if self._trusted:
+            self._signal_misses += 1
+            if self._signal_misses >= SIGNAL_MISS_LIMIT:
+                self._trusted = False
+
+        self._interval = POLL_MIN_INTERVAL
+        self._timer.start(VERIFY_INTERVAL if self._trusted else self._interval)
+        self._emit_changed()
+
+    def _emit_changed(self) -> None:
+        """変更を通知"""
+        self._stats["changes"] += 1
+        self.changed.emit()
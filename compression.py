@@ -0,0 +1,58 @@
+"""テキスト圧縮モジュール"""
+import zlib
+from typing import Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # zstandardがなければzlibのみ使用
+    zstandard = None
+
+
+# 保存形式（content_encodingカラムの値）
+ENCODING_PLAIN = 0
+ENCODING_ZLIB = 1
+ENCODING_ZSTD = 2
+
+# この文字数以上のテキストを圧縮対象にする
+COMPRESSION_MIN_CHARS = 2048
+
+# 圧縮後のサイズがこの割合を超える場合は圧縮しない（効果が薄いため）
+COMPRESSION_MAX_RATIO = 0.9
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compress_text(text: str) -> tuple[Union[str, bytes], int]:
+    """テキストを保存用に圧縮（(保存する値, 保存形式)を返す）"""
+    if len(text) < COMPRESSION_MIN_CHARS:
+        return text, ENCODING_PLAIN
+
+    raw = text.encode("utf-8")
+    if zstandard is not None:
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        encoding = ENCODING_ZSTD
+    else:
+        data = zlib.compress(raw, ZLIB_LEVEL)
+        encoding = ENCODING_ZLIB
+
+    if len(data) > len(raw) * COMPRESSION_MAX_RATIO:
+        return text, ENCODING_PLAIN
+
+    return data, encoding
+
+
+def decompress_text(data: Optional[Union[str, bytes]], encoding: Optional[int]) -> Optional[str]:
+    """保存された値を元のテキストに戻す"""
+    if data is None or not encoding:
+        return data
+
+    if encoding == ENCODING_ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+
+    if encoding == ENCODING_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd圧縮された履歴の展開にはzstandardが必要です")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+    raise ValueError(f"不明な保存形式です: {encoding}")
@@ -10,11 +10,13 @@ load_dotenv()
 APP_DIR = Path(__file__).parent
 DATA_DIR = APP_DIR / "data"
 IMAGES_DIR = APP_DIR / "images"
+ARCHIVE_DIR = DATA_DIR / "archive"
 RESOURCES_DIR = APP_DIR / "resources"
 
 # ディレクトリが存在しない場合は作成
 DATA_DIR.mkdir(exist_ok=True)
 IMAGES_DIR.mkdir(exist_ok=True)
+ARCHIVE_DIR.mkdir(exist_ok=True)
 RESOURCES_DIR.mkdir(exist_ok=True)
 
 # データベースパス
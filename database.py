@@ -1,250 +1,3478 @@
 """データベース操作モジュール"""
+import base64
+import itertools
+import json
 import sqlite3
-from typing import Optional
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
 from pathlib import Path
 
-from config import DATABASE_PATH
+from config import DATABASE_PATH, IMAGES_DIR, ARCHIVE_DIR, CATEGORIES, AI_PROVIDER, OPENAI_API_KEY, GEMINI_API_KEY
+from compression import ENCODING_PLAIN, compress_text, decompress_text
+from derived_fields import FACET_FIELDS, extract_derived_fields, normalize_facet_value
+from hamming_index import CHUNK_BITS, CHUNK_COUNT, CHUNK_MASK, MultiIndexHash, band_keys, from_signed, hamming_distance, to_signed
+from history_cache import HistoryCache
+from text_fingerprint import simhash
+
+
+# 書き込み用の接続に適用するPRAGMA
+CONNECTION_PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL",  # 空きページを少しずつ解放できるようにする（新規作成時のみ有効）
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # WALではNORMALでもコミット済みデータは破損しない
+    "PRAGMA cache_size = -16000",  # 約16MB（負の値はKiB単位）
+    "PRAGMA mmap_size = 268435456",  # 256MB
+    "PRAGMA temp_store = MEMORY",
+)
+
+# 読み取り専用の接続に適用するPRAGMA（ジャーナルモードなどデータベースに記録される設定は変更しない）
+READER_PRAGMAS = (
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA query_only = ON",  # 書き込もうとするとエラーにする
+)
+
+# プリペアドステートメントのキャッシュ数
+STATEMENT_CACHE_SIZE = 256
+
+# ロック待ちのタイムアウト（秒）
+BUSY_TIMEOUT = 5.0
+
+# PRAGMA synchronousに指定できる値
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# 一括操作で1トランザクションに含める最大件数
+BULK_CHUNK_SIZE = 500
+
+# エクスポート・インポートで1回に読み書きする件数
+TRANSFER_CHUNK_SIZE = 1000
+
+# trigramトークナイザーで索引できる最小文字数（これより短い検索語はLIKEで検索）
+FTS_MIN_QUERY_LENGTH = 3
+
+# 検索結果のスニペット設定
+SNIPPET_OPEN = "【"
+SNIPPET_CLOSE = "】"
+SNIPPET_ELLIPSIS = "…"
+SNIPPET_TOKENS = 32
+
+# 一覧表示用プレビューの最大文字数と最大行数
+PREVIEW_CHARS = 200
+PREVIEW_LINES = 3
+
+# 一覧表示で取得するカラム（本文はclipboard_payloadにあり、コピー・表示時のみ読み込む）
+HISTORY_LIST_COLUMNS = (
+    "h.id, h.content_type, h.preview, h.image_path, h.content_hash, h.category,"
+    " h.is_favorite, h.created_at, h.size_bytes, h.line_count, h.last_used_at, h.copy_count"
+)
+
+# 最終使用日時の値（並び順が同じ秒内でも区別できるようミリ秒まで記録する）
+LAST_USED_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# 現在時刻のエポックミリ秒（コンパクト形式の日時）
+EPOCH_MS_NOW = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+# 全文検索インデックスを本文テーブルと同期するトリガー
+# （圧縮されたテキストはhistory_text()で展開して索引する）
+FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_payload_fts_ai AFTER INSERT ON clipboard_payload BEGIN
+        INSERT INTO clipboard_history_fts (rowid, content)
+        VALUES (new.history_id, history_text(new.content, new.content_encoding));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_payload_fts_ad AFTER DELETE ON clipboard_payload BEGIN
+        INSERT INTO clipboard_history_fts (clipboard_history_fts, rowid, content)
+        VALUES ('delete', old.history_id, history_text(old.content, old.content_encoding));
+    END
+    """,
+    # 圧縮形式だけが変わる更新ではテキストは同じなので索引し直さない
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_payload_fts_au AFTER UPDATE OF content ON clipboard_payload
+    WHEN new.content_encoding = old.content_encoding BEGIN
+        INSERT INTO clipboard_history_fts (clipboard_history_fts, rowid, content)
+        VALUES ('delete', old.history_id, history_text(old.content, old.content_encoding));
+        INSERT INTO clipboard_history_fts (rowid, content)
+        VALUES (new.history_id, history_text(new.content, new.content_encoding));
+    END
+    """,
+)
+
+
+# 件数カウンターを履歴テーブルと同期するトリガー
+# （total: 全件数, favorites: お気に入り件数, bytes: 合計バイト数, category:<名前>: カテゴリ別件数）
+COUNTER_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_counters_ai AFTER INSERT ON clipboard_history BEGIN
+        INSERT INTO history_counters (name, value) VALUES
+            ('total', 1),
+            ('favorites', new.is_favorite != 0),
+            ('bytes', COALESCE(new.size_bytes, 0)),
+            ('category:' || new.category, 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_counters_ad AFTER DELETE ON clipboard_history BEGIN
+        INSERT INTO history_counters (name, value) VALUES
+            ('total', -1),
+            ('favorites', -(old.is_favorite != 0)),
+            ('bytes', -COALESCE(old.size_bytes, 0)),
+            ('category:' || old.category, -1)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_counters_au
+    AFTER UPDATE OF is_favorite, size_bytes, category ON clipboard_history BEGIN
+        INSERT INTO history_counters (name, value) VALUES
+            ('favorites', (new.is_favorite != 0) - (old.is_favorite != 0)),
+            ('bytes', COALESCE(new.size_bytes, 0) - COALESCE(old.size_bytes, 0)),
+            ('category:' || old.category, -1),
+            ('category:' || new.category, 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+)
+
+# 削除済み（deleted_at設定済み）の履歴を件数カウンターから除くトリガー（COUNTER_TRIGGERSの削除・更新用を置き換える）
+TOMBSTONE_COUNTER_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_counters_ad
+    AFTER DELETE ON clipboard_history WHEN old.deleted_at IS NULL BEGIN
+        INSERT INTO history_counters (name, value) VALUES
+            ('total', -1),
+            ('favorites', -(old.is_favorite != 0)),
+            ('bytes', -COALESCE(old.size_bytes, 0)),
+            ('category:' || old.category, -1)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_counters_au
+    AFTER UPDATE OF is_favorite, size_bytes, category ON clipboard_history
+    WHEN old.deleted_at IS NULL AND new.deleted_at IS NULL BEGIN
+        INSERT INTO history_counters (name, value) VALUES
+            ('favorites', (new.is_favorite != 0) - (old.is_favorite != 0)),
+            ('bytes', COALESCE(new.size_bytes, 0) - COALESCE(old.size_bytes, 0)),
+            ('category:' || old.category, -1),
+            ('category:' || new.category, 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+    # 削除（deleted_atの設定）で減らし、取り消し（NULLに戻す）で増やす
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_counters_deleted
+    AFTER UPDATE OF deleted_at ON clipboard_history
+    WHEN (old.deleted_at IS NULL) != (new.deleted_at IS NULL) BEGIN
+        INSERT INTO history_counters (name, value)
+        SELECT name, value * (CASE WHEN new.deleted_at IS NULL THEN 1 ELSE -1 END) FROM (
+            SELECT 'total' AS name, 1 AS value
+            UNION ALL SELECT 'favorites', new.is_favorite != 0
+            UNION ALL SELECT 'bytes', COALESCE(new.size_bytes, 0)
+            UNION ALL SELECT 'category:' || new.category, 1
+        ) WHERE true
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+)
+
+# 履歴の削除に合わせて本文も削除するトリガー
+PAYLOAD_DELETE_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_payload_ad AFTER DELETE ON clipboard_history BEGIN
+        DELETE FROM clipboard_payload WHERE history_id = old.id;
+    END
+"""
+
+# コンパクト形式の履歴テーブル（ハッシュは32バイトのBLOB、カテゴリは整数コード、日時はエポックミリ秒）
+# 移行中はclipboard_history_v2として作成し、全件コピー後にclipboard_historyへ名前を変更する
+COMPACT_HISTORY_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS clipboard_history_v2 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content_type TEXT NOT NULL,
+        content_hash BLOB NOT NULL UNIQUE,
+        category INTEGER NOT NULL,
+        is_favorite INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL DEFAULT ({EPOCH_MS_NOW}),
+        last_used_at INTEGER NOT NULL DEFAULT ({EPOCH_MS_NOW}),
+        copy_count INTEGER NOT NULL DEFAULT 1,
+        size_bytes INTEGER,
+        line_count INTEGER NOT NULL DEFAULT 0,
+        image_path TEXT,
+        preview TEXT
+    )
+"""
+
+# コンパクト形式のインデックス（content_hashはUNIQUE制約のインデックスで検索できるため作成しない）
+COMPACT_HISTORY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_history_created_at ON clipboard_history_v2(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_history_last_used_at ON clipboard_history_v2(last_used_at)",
+    "CREATE INDEX IF NOT EXISTS idx_history_category_last_used_at ON clipboard_history_v2(category, last_used_at)",
+    "CREATE INDEX IF NOT EXISTS idx_history_favorite_last_used_at ON clipboard_history_v2(is_favorite, last_used_at)",
+    "CREATE INDEX IF NOT EXISTS idx_history_size_pending ON clipboard_history_v2(id) WHERE size_bytes IS NULL",
+)
+
+# 旧形式の行をコンパクト形式に変換してコピーするクエリ（{conflict}に競合時の動作、WHERE句は呼び出し側で付与）
+COMPACT_COPY_QUERY = """
+    INSERT {conflict}INTO clipboard_history_v2 (
+        id, content_type, content_hash, category, is_favorite, created_at, last_used_at,
+        copy_count, size_bytes, line_count, image_path, preview
+    )
+    SELECT
+        h.id, h.content_type, history_unhex(h.content_hash),
+        (SELECT c.code FROM history_categories c WHERE c.name = h.category),
+        COALESCE(h.is_favorite, 0) != 0,
+        CAST(ROUND((julianday(h.created_at) - 2440587.5) * 86400000) AS INTEGER),
+        CAST(ROUND((julianday(COALESCE(h.last_used_at, h.created_at)) - 2440587.5) * 86400000) AS INTEGER),
+        h.copy_count, h.size_bytes, h.line_count, h.image_path, h.preview
+    FROM clipboard_history h
+"""
+
+# 移行中に旧形式のテーブルへの変更をコンパクト形式のテーブルへ反映するトリガー
+# （トリガー内のOR IGNORE/OR REPLACEは外側のUPSERTの競合処理で上書きされるため使わない）
+COMPACT_SYNC_STATEMENTS = f"""
+        INSERT INTO history_categories (name)
+            SELECT new.category WHERE NOT EXISTS (SELECT 1 FROM history_categories WHERE name = new.category);
+        DELETE FROM clipboard_history_v2 WHERE id = new.id;
+        {COMPACT_COPY_QUERY.format(conflict="")} WHERE h.id = new.id;
+"""
+
+COMPACT_SYNC_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_v2_sync_ai AFTER INSERT ON clipboard_history BEGIN
+        {COMPACT_SYNC_STATEMENTS}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_v2_sync_au AFTER UPDATE ON clipboard_history BEGIN
+        {COMPACT_SYNC_STATEMENTS}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_v2_sync_ad AFTER DELETE ON clipboard_history BEGIN
+        DELETE FROM clipboard_history_v2 WHERE id = old.id;
+    END
+    """,
+)
+
+# インポートする履歴を一時的に置くテーブル（書き込み用の接続にのみ作成される）
+IMPORT_STAGING_TABLE = """
+    CREATE TEMP TABLE IF NOT EXISTS history_import (
+        content_type TEXT NOT NULL,
+        content_hash NOT NULL UNIQUE,
+        category TEXT NOT NULL,
+        is_favorite INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        last_used_at INTEGER NOT NULL,
+        copy_count INTEGER NOT NULL,
+        image_path TEXT,
+        preview TEXT,
+        size_bytes INTEGER,
+        line_count INTEGER NOT NULL,
+        content,
+        content_encoding INTEGER NOT NULL
+    )
+"""
+
+# 月別アーカイブに移した履歴の管理テーブル（ホットデータベース側）
+# history_archive_indexにある行だけがアーカイブ内の有効な履歴で、削除された行は
+# history_archive_purgeを経由してアイドル時にアーカイブファイルから取り除く
+ARCHIVE_INDEX_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS history_archive_months (
+        month INTEGER PRIMARY KEY
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS history_archive_index (
+        id INTEGER PRIMARY KEY,
+        content_hash BLOB NOT NULL UNIQUE,
+        month INTEGER NOT NULL,
+        category INTEGER NOT NULL,
+        size_bytes INTEGER,
+        deleted_at INTEGER,
+        url_host TEXT,
+        email_domain TEXT,
+        file_ext TEXT,
+        line_count INTEGER,
+        char_count INTEGER,
+        created_at INTEGER,
+        group_id INTEGER,
+        text_simhash INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_archive_index_month ON history_archive_index(month, id)",
+    """
+    CREATE INDEX IF NOT EXISTS idx_archive_index_derived_pending ON history_archive_index(month, id)
+    WHERE char_count IS NULL
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_archive_index_created_pending ON history_archive_index(month, id)
+    WHERE created_at IS NULL
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_archive_index_deleted_at ON history_archive_index(deleted_at)
+    WHERE deleted_at IS NOT NULL
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS history_archive_purge (
+        id INTEGER PRIMARY KEY,
+        month INTEGER NOT NULL
+    )
+    """,
+)
+
+# アーカイブした履歴も件数カウンターに含める（お気に入りはアーカイブしない）
+ARCHIVE_INDEX_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS history_archive_index_ai AFTER INSERT ON history_archive_index BEGIN
+        INSERT INTO history_counters (name, value) VALUES
+            ('total', 1),
+            ('bytes', COALESCE(new.size_bytes, 0)),
+            ('category:' || new.category, 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS history_archive_index_ad AFTER DELETE ON history_archive_index BEGIN
+        INSERT INTO history_counters (name, value)
+        SELECT name, value FROM (
+            SELECT 'total' AS name, -1 AS value
+            UNION ALL SELECT 'bytes', -COALESCE(old.size_bytes, 0)
+            UNION ALL SELECT 'category:' || old.category, -1
+        ) WHERE old.deleted_at IS NULL
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+        INSERT INTO history_archive_purge (id, month) VALUES (old.id, old.month);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS history_archive_index_deleted
+    AFTER UPDATE OF deleted_at ON history_archive_index
+    WHEN (old.deleted_at IS NULL) != (new.deleted_at IS NULL) BEGIN
+        INSERT INTO history_counters (name, value)
+        SELECT name, value * (CASE WHEN new.deleted_at IS NULL THEN 1 ELSE -1 END) FROM (
+            SELECT 'total' AS name, 1 AS value
+            UNION ALL SELECT 'bytes', COALESCE(new.size_bytes, 0)
+            UNION ALL SELECT 'category:' || new.category, 1
+        ) WHERE true
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+    END
+    """,
+)
+
+# タイムライン集計の区間（1時間、エポックミリ秒）
+TIMELINE_BUCKET_MS = 3600 * 1000
+
+# 作成日時の1時間ごと・カテゴリごとの件数（削除済みの履歴は含めない）
+TIMELINE_TABLE = """
+    CREATE TABLE IF NOT EXISTS history_timeline (
+        bucket INTEGER NOT NULL,
+        category INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, category)
+    ) WITHOUT ROWID
+"""
+
+# タイムライン集計を履歴テーブルと同期するトリガー
+TIMELINE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_timeline_ai
+    AFTER INSERT ON clipboard_history WHEN new.deleted_at IS NULL BEGIN
+        INSERT INTO history_timeline (bucket, category, count)
+        VALUES (new.created_at / {TIMELINE_BUCKET_MS}, new.category, 1)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_timeline_ad
+    AFTER DELETE ON clipboard_history WHEN old.deleted_at IS NULL BEGIN
+        INSERT INTO history_timeline (bucket, category, count)
+        VALUES (old.created_at / {TIMELINE_BUCKET_MS}, old.category, -1)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_timeline_au
+    AFTER UPDATE OF category, created_at ON clipboard_history
+    WHEN old.deleted_at IS NULL AND new.deleted_at IS NULL BEGIN
+        INSERT INTO history_timeline (bucket, category, count) VALUES
+            (old.created_at / {TIMELINE_BUCKET_MS}, old.category, -1),
+            (new.created_at / {TIMELINE_BUCKET_MS}, new.category, 1)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_timeline_deleted
+    AFTER UPDATE OF deleted_at ON clipboard_history
+    WHEN (old.deleted_at IS NULL) != (new.deleted_at IS NULL) BEGIN
+        INSERT INTO history_timeline (bucket, category, count)
+        VALUES (new.created_at / {TIMELINE_BUCKET_MS}, new.category, CASE WHEN new.deleted_at IS NULL THEN 1 ELSE -1 END)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+)
+
+# アーカイブした履歴もタイムラインに含める（作成日時が未設定の行はアイドル時に埋めてから数える）
+ARCHIVE_TIMELINE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS history_archive_index_timeline_ai
+    AFTER INSERT ON history_archive_index WHEN new.created_at IS NOT NULL AND new.deleted_at IS NULL BEGIN
+        INSERT INTO history_timeline (bucket, category, count)
+        VALUES (new.created_at / {TIMELINE_BUCKET_MS}, new.category, 1)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS history_archive_index_timeline_ad
+    AFTER DELETE ON history_archive_index WHEN old.created_at IS NOT NULL AND old.deleted_at IS NULL BEGIN
+        INSERT INTO history_timeline (bucket, category, count)
+        VALUES (old.created_at / {TIMELINE_BUCKET_MS}, old.category, -1)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS history_archive_index_timeline_deleted
+    AFTER UPDATE OF deleted_at ON history_archive_index
+    WHEN new.created_at IS NOT NULL AND (old.deleted_at IS NULL) != (new.deleted_at IS NULL) BEGIN
+        INSERT INTO history_timeline (bucket, category, count)
+        VALUES (new.created_at / {TIMELINE_BUCKET_MS}, new.category, CASE WHEN new.deleted_at IS NULL THEN 1 ELSE -1 END)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS history_archive_index_timeline_filled
+    AFTER UPDATE OF created_at ON history_archive_index
+    WHEN old.created_at IS NULL AND new.created_at IS NOT NULL AND new.deleted_at IS NULL BEGIN
+        INSERT INTO history_timeline (bucket, category, count)
+        VALUES (new.created_at / {TIMELINE_BUCKET_MS}, new.category, 1)
+        ON CONFLICT (bucket, category) DO UPDATE SET count = count + excluded.count;
+    END
+    """,
+)
+
+# タイムライン集計を実データから作り直すクエリ
+TIMELINE_SOURCE_QUERY = f"""
+    SELECT created_at / {TIMELINE_BUCKET_MS} AS bucket, category, COUNT(*) AS count FROM (
+        SELECT created_at, category FROM clipboard_history WHERE deleted_at IS NULL
+        UNION ALL
+        SELECT created_at, category FROM history_archive_index WHERE deleted_at IS NULL AND created_at IS NOT NULL
+    )
+    GROUP BY bucket, category
+"""
+
+# アーカイブファイルのスキーマ（{schema}はATTACHしたスキーマ名、本文も同じ行に持つ）
+ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.archived_history (
+        id INTEGER PRIMARY KEY,
+        content_type TEXT NOT NULL,
+        content_hash BLOB NOT NULL,
+        category INTEGER NOT NULL,
+        is_favorite INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL,
+        last_used_at INTEGER NOT NULL,
+        copy_count INTEGER NOT NULL DEFAULT 1,
+        size_bytes INTEGER,
+        line_count INTEGER NOT NULL DEFAULT 0,
+        image_path TEXT,
+        preview TEXT,
+        content,
+        content_encoding INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_archived_last_used_at ON archived_history(last_used_at, id)",
+    """
+    CREATE VIEW IF NOT EXISTS {schema}.archived_history_text AS
+    SELECT id, history_text(content, content_encoding) AS content FROM archived_history
+    """,
+)
+
+# アーカイブファイルの全文検索インデックス（行の追加・削除時に明示的に更新する）
+ARCHIVE_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.archived_history_fts USING fts5(
+        content, content='archived_history_text', content_rowid='id', tokenize='trigram'
+    )
+"""
+
+# ホットデータベースとアーカイブで共通の履歴カラム（本文以外）
+ARCHIVE_COLUMNS = (
+    "id, content_type, content_hash, category, is_favorite, created_at, last_used_at,"
+    " copy_count, size_bytes, line_count, image_path, preview"
+)
+
+# カウンターを実データから集計するクエリ（再構築・検証用、{rows}は集計対象の行）
+COUNTER_SOURCE_QUERY = """
+    WITH r AS ({rows})
+    SELECT 'total' AS name, COUNT(*) AS value FROM r
+    UNION ALL SELECT 'favorites', COUNT(*) FROM r WHERE is_favorite != 0
+    UNION ALL SELECT 'bytes', COALESCE(SUM(size_bytes), 0) FROM r
+    UNION ALL SELECT 'category:' || category, COUNT(*) FROM r GROUP BY category
+"""
+
+# 派生フィールドのカラム（挿入時にカテゴリ分類の結果から取り出し、既存行はアイドル時に埋める）
+DERIVED_COLUMNS = (*FACET_FIELDS, "char_count")
+
+# 絞り込みに使える派生フィールドの条件（{t}は派生フィールドを持つテーブルの別名）
+FACET_CONDITIONS = {
+    "url_host": "{t}.url_host = ?",
+    "email_domain": "{t}.email_domain = ?",
+    "file_ext": "{t}.file_ext = ?",
+    "min_lines": "{t}.line_count >= ?",
+    "max_lines": "{t}.line_count <= ?",
+    "min_chars": "{t}.char_count >= ?",
+    "max_chars": "{t}.char_count <= ?",
+    # 作成日時の範囲（エポックミリ秒、created_toは含まない）は履歴の行で判定する
+    "created_from": "h.created_at >= ?",
+    "created_to": "h.created_at < ?",
+    # 類似した履歴のグループ（指定すると最新以外の履歴も一覧に含める）
+    "group_id": "{t}.group_id = ?",
+}
+
+# 派生フィールドの絞り込み用インデックス（値のある行だけを最近使った順に辿る）
+DERIVED_FIELD_INDEXES = tuple(
+    f"CREATE INDEX IF NOT EXISTS idx_history_{field}_last_used_at"
+    f" ON clipboard_history({field}, last_used_at) WHERE {field} IS NOT NULL"
+    for field in FACET_FIELDS
+)
+
+
+# 類似した画像・テキストの扱い（off: 何もしない, group: 最新の履歴の下にまとめる, collapse: 古い履歴を削除済みにする）
+GROUP_POLICIES = ("off", "group", "collapse")
+DEFAULT_IMAGE_GROUP_POLICY = "group"
+DEFAULT_TEXT_GROUP_POLICY = "group"
+
+# 類似画像とみなす知覚ハッシュのハミング距離（64ビット中）の初期値と上限
+DEFAULT_IMAGE_GROUP_THRESHOLD = 6
+MAX_IMAGE_GROUP_THRESHOLD = 10
+
+# 同じテキストの編集版とみなすSimHashのハミング距離（64ビット中）の初期値と上限
+# 初期値は別の内容の短いテキスト（日付と名前だけが違うメモなど）をまとめないよう小さくする
+# 索引の区間（16ビット）ごとに距離1以内を引くため、取りこぼしなく探せるのは距離7まで
+DEFAULT_TEXT_GROUP_THRESHOLD = 4
+MAX_TEXT_GROUP_THRESHOLD = 7
+
+# テキストのSimHashの索引（16ビットずつの区間をキーにし、候補の距離をこの表だけで確かめられるようにハッシュも持つ）
+TEXT_SIMHASH_BAND_TABLE = """
+    CREATE TABLE IF NOT EXISTS text_simhash_band (
+        key INTEGER NOT NULL,
+        history_id INTEGER NOT NULL,
+        simhash INTEGER NOT NULL,
+        PRIMARY KEY (key, history_id)
+    ) WITHOUT ROWID
+"""
+
+
+def _band_key_sql(row: str, band: int) -> str:
+    """SimHashの区間のキー（hamming_index.band_keysと同じ値）を求めるSQL式（rowはnewまたはold）"""
+    return f"(({band} << {CHUNK_BITS}) | (({row}.text_simhash >> {band * CHUNK_BITS}) & {CHUNK_MASK}))"
+
+
+_BAND_INSERT = (
+    "INSERT INTO text_simhash_band (key, history_id, simhash) SELECT column1, new.id, new.text_simhash FROM (VALUES "
+    + ", ".join(f"({_band_key_sql('new', band)})" for band in range(CHUNK_COUNT))
+    + ") WHERE new.text_simhash IS NOT NULL"
+)
+_BAND_DELETE = (
+    "DELETE FROM text_simhash_band WHERE history_id = old.id AND key IN ("
+    + ", ".join(_band_key_sql("old", band) for band in range(CHUNK_COUNT)) + ")"
+)
+
+# 履歴の追加・SimHashの更新・行の削除に合わせて索引を維持するトリガー
+TEXT_SIMHASH_BAND_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_simhash_ai
+    AFTER INSERT ON clipboard_history WHEN new.text_simhash IS NOT NULL BEGIN
+        {_BAND_INSERT};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_simhash_au
+    AFTER UPDATE OF text_simhash ON clipboard_history WHEN old.text_simhash IS NOT new.text_simhash BEGIN
+        {_BAND_DELETE};
+        {_BAND_INSERT};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_simhash_ad
+    AFTER DELETE ON clipboard_history WHEN old.text_simhash IS NOT NULL BEGIN
+        {_BAND_DELETE};
+    END
+    """,
+)
+
+# グループの中で最後に使った（削除されていない）履歴だけをsuperseded = 0にする文（{group}にグループID）
+GROUP_HEAD_UPDATE = """
+    UPDATE clipboard_history SET superseded = COALESCE(id != (
+        SELECT id FROM clipboard_history WHERE group_id = {group} AND deleted_at IS NULL
+        ORDER BY last_used_at DESC, id DESC LIMIT 1
+    ), 0)
+    WHERE group_id = {group}
+"""
+
+# グループの最新の履歴を追加・再コピー・削除・取り消しに合わせて更新するトリガー
+GROUP_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_group_ai
+    AFTER INSERT ON clipboard_history WHEN new.group_id IS NOT NULL BEGIN
+        {GROUP_HEAD_UPDATE.format(group="new.group_id")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_group_au
+    AFTER UPDATE OF group_id, last_used_at, deleted_at ON clipboard_history WHEN new.group_id IS NOT NULL BEGIN
+        {GROUP_HEAD_UPDATE.format(group="new.group_id")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS clipboard_history_group_ad
+    AFTER DELETE ON clipboard_history WHEN old.group_id IS NOT NULL AND old.superseded = 0 BEGIN
+        {GROUP_HEAD_UPDATE.format(group="old.group_id")};
+    END
+    """,
+)
+
+
+def make_preview(text: Optional[str]) -> Optional[str]:
+    """一覧表示用のプレビュー文字列を作成"""
+    if text is None:
+        return None
+
+    # 長いテキストは省略
+    preview = text[:PREVIEW_CHARS] + "..." if len(text) > PREVIEW_CHARS else text
+    # 改行を含む場合は最初の数行まで
+    lines = preview.split("\n")
+    if len(lines) > PREVIEW_LINES:
+        preview = "\n".join(lines[:PREVIEW_LINES]) + "\n..."
+    return preview
+
+
+def count_lines(text: Optional[str]) -> int:
+    """テキストの行数"""
+    return text.count("\n") + 1 if text else 0
+
+
+def hash_to_bytes(content_hash):
+    """16進文字列のハッシュをバイト列に変換（変換できない値はそのまま返す）"""
+    if isinstance(content_hash, str):
+        try:
+            return bytes.fromhex(content_hash)
+        except ValueError:
+            pass
+    return content_hash
+
+
+def timestamp_to_epoch_ms(value) -> Optional[int]:
+    """日時（エポックミリ秒またはUTCの日時文字列）をエポックミリ秒に変換"""
+    if value is None or isinstance(value, int):
+        return value
+    return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+# 接続ごとに登録するSQL関数（名前, 引数の数, 関数）
+SQL_FUNCTIONS = (
+    ("history_text", 2, decompress_text),
+    ("history_preview", 1, make_preview),
+    ("history_line_count", 1, count_lines),
+    ("history_unhex", 1, hash_to_bytes),
+)
+
+
+class ConnectionManager:
+    """書き込み用の接続1つと、スレッドごとの読み取り専用接続を管理するクラス
+
+    書き込みはロックで直列化した1つの接続だけで行い、読み取りは呼び出し元スレッドの
+    読み取り専用接続で行う。WALモードのため読み取りは書き込みの完了を待たない。
+    """
+
+    def __init__(self, database_path: Path):
+        self._database_path = database_path
+        self._local = threading.local()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.RLock()
+
+    def get(self) -> sqlite3.Connection:
+        """呼び出し元スレッドの読み取り専用接続を取得（なければ作成）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._writer is None:
+                # 新規作成時にWALモードへ切り替えるため、書き込み用の接続を先に開く
+                with self.writer():
+                    pass
+            conn = self._open(read_only=True)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """書き込み用の接続を排他的に使用する（どのスレッドからでも使用できる）"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open(read_only=False)
+            yield self._writer
+
+    def close(self) -> None:
+        """呼び出し元スレッドの読み取り専用接続を閉じる"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def close_writer(self) -> None:
+        """書き込み用の接続を閉じる"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _open(self, read_only: bool) -> sqlite3.Connection:
+        """接続を作成してPRAGMAを適用
+
+        読み取り専用の接続は作成したスレッドでのみ使用でき、書き込み用の接続は
+        ロックで保護した上で複数のスレッドから使用する。
+        """
+        conn = sqlite3.connect(
+            self._database_path,
+            timeout=BUSY_TIMEOUT,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=read_only,
+            # 読み取り専用の接続は暗黙のトランザクションを開始しない（古いスナップショットを保持しない）
+            isolation_level=None if read_only else "",
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in READER_PRAGMAS if read_only else CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        for name, num_params, func in SQL_FUNCTIONS:
+            conn.create_function(name, num_params, func, deterministic=True)
+        return conn
+
+
+_manager = ConnectionManager(DATABASE_PATH)
+
+# 設定値のキャッシュ（初回アクセス時にまとめて読み込み、set_settingで更新する）
+_settings_cache: Optional[dict[str, str]] = None
+_settings_lock = threading.RLock()
+_setting_listeners: list[Callable[[str, Optional[str]], None]] = []
+
+# 環境変数（.env）から読み込む設定（データベースに値がない場合の初期値）
+ENV_SETTING_DEFAULTS = {
+    "ai_provider": AI_PROVIDER,
+    "openai_api_key": OPENAI_API_KEY,
+    "gemini_api_key": GEMINI_API_KEY,
+}
+
+# 全文検索インデックスが利用可能か（init_databaseで設定）
+_fts_enabled = False
+
+# 履歴テーブルがコンパクト形式に移行済みか（init_databaseと移行の完了時に設定）
+_compact_schema = False
+
+# カテゴリ名と整数コードの対応（コンパクト形式用）
+_category_codes: dict[str, int] = {}
+_category_names: dict[int, str] = {}
+
+# 読み取り結果のキャッシュ（このモジュールの書き込み関数が変更に応じて破棄する）
+_cache = HistoryCache()
+
+# 画像の知覚ハッシュの索引（最初の書き込み時に読み込み、書き込み用の接続のロック中にだけ操作する）
+_image_index: Optional[MultiIndexHash] = None
 
 
 def get_connection() -> sqlite3.Connection:
-    """データベース接続を取得"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """読み取り専用のデータベース接続を取得（スレッドごとに再利用される）
+
+    書き込みはwrite_transactionで行う。この接続で書き込もうとするとエラーになる。
+    """
+    return _manager.get()
+
+
+@contextmanager
+def write_transaction() -> Iterator[sqlite3.Connection]:
+    """書き込み用の接続でトランザクションを実行（書き込みはスレッド間で直列化される）
+
+    ブロック内で例外が発生した場合はロールバックする。入れ子にはできない。
+    """
+    with _manager.writer() as conn:
+        with conn:
+            yield conn
+
+
+def close_connection() -> None:
+    """現在のスレッドの読み取り専用接続を閉じる"""
+    _manager.close()
+
+
+def close_database() -> None:
+    """書き込み用の接続と現在のスレッドの読み取り専用接続を閉じる（終了時用）"""
+    _manager.close()
+    _manager.close_writer()
+
+
+def set_synchronous(mode: str) -> None:
+    """書き込み用の接続の同期モードを変更"""
+    mode = mode.upper()
+    if mode not in SYNCHRONOUS_MODES:
+        raise ValueError(f"不正な同期モードです: {mode}")
+    with _manager.writer() as conn:
+        conn.execute(f"PRAGMA synchronous = {mode}")
+
+
+def init_database() -> None:
+    """データベースを初期化"""
+    global _compact_schema, _image_index
+
+    # 画像の知覚ハッシュの索引は次の書き込み時に読み込み直す
+    _image_index = None
+
+    with write_transaction() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            # 初期バージョンの履歴テーブル（以降の変更はマイグレーションで適用する）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS clipboard_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    content_type TEXT NOT NULL,
+                    content TEXT,
+                    image_path TEXT,
+                    content_hash TEXT NOT NULL UNIQUE,
+                    category TEXT NOT NULL,
+                    is_favorite BOOLEAN DEFAULT FALSE,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # インデックス作成（一覧の並び順用の複合インデックスはマイグレーションで作成）
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON clipboard_history(created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_content_hash ON clipboard_history(content_hash)")
+            conn.execute("DROP INDEX IF EXISTS idx_category")
+            conn.execute("DROP INDEX IF EXISTS idx_is_favorite")
+
+        # 設定テーブル
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+
+        # スキーマのマイグレーション
+        _migrate(conn)
+        _compact_schema = conn.execute("PRAGMA user_version").fetchone()[0] >= COMPACT_SCHEMA_VERSION
+        if _compact_schema:
+            _load_categories(conn)
+        else:
+            _prepare_legacy_table(conn)
+
+        # 月別アーカイブの管理テーブル
+        for statement in (*ARCHIVE_INDEX_TABLES, *ARCHIVE_INDEX_TRIGGERS, *ARCHIVE_TIMELINE_TRIGGERS):
+            conn.execute(statement)
+
+        # 全文検索インデックス
+        _init_search_index(conn)
+
+
+def _init_search_index(conn: sqlite3.Connection) -> None:
+    """全文検索インデックスを作成（既存の履歴はバックフィル）"""
+    global _fts_enabled
+
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'clipboard_history_fts'"
+    ).fetchone()
+
+    if exists is None:
+        try:
+            # trigramトークナイザーは単語境界のない日本語も部分一致で検索できる
+            conn.execute("""
+                CREATE VIRTUAL TABLE clipboard_history_fts USING fts5(
+                    content,
+                    content = 'clipboard_history_text',
+                    content_rowid = 'id',
+                    tokenize = 'trigram'
+                )
+            """)
+        except sqlite3.OperationalError:
+            # FTS5またはtrigramが使えないSQLiteではLIKE検索にフォールバック
+            _fts_enabled = False
+            return
+
+        # 既存データから索引を構築
+        conn.execute("INSERT INTO clipboard_history_fts (clipboard_history_fts) VALUES ('rebuild')")
+
+    for trigger in FTS_TRIGGERS:
+        conn.execute(trigger)
+
+    _fts_enabled = True
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    """テーブルの列名（テーブルがなければ空）"""
+    return {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_archive_index_columns(conn: sqlite3.Connection, definitions: tuple[str, ...]) -> list[str]:
+    """月別アーカイブの管理テーブルがあれば、まだない列を追加（追加した列名を返す）
+
+    コンパクト形式への移行中に作成された管理テーブルには、後続のマイグレーションの列が既にある。
+    """
+    columns = _table_columns(conn, "history_archive_index")
+    if not columns:
+        return []
+
+    added = []
+    for definition in definitions:
+        name = definition.split()[0]
+        if name not in columns:
+            conn.execute(f"ALTER TABLE history_archive_index ADD COLUMN {definition}")
+            added.append(name)
+    return added
+
+
+def _migrate_add_size_bytes(conn: sqlite3.Connection) -> None:
+    """履歴ごとのバイト数カラムを追加（既存行はアイドル時に埋める）"""
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN size_bytes INTEGER")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_size_pending ON clipboard_history(id) WHERE size_bytes IS NULL"
+    )
+
+
+def _migrate_add_content_encoding(conn: sqlite3.Connection) -> None:
+    """テキストの圧縮形式カラムと、展開済みテキストのビューを追加"""
+    conn.execute(
+        f"ALTER TABLE clipboard_history ADD COLUMN content_encoding INTEGER NOT NULL DEFAULT {ENCODING_PLAIN}"
+    )
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS clipboard_history_text AS
+        SELECT id, history_text(content, content_encoding) AS content FROM clipboard_history
+    """)
+
+    # 全文検索インデックスはビューを参照するように作り直す（init_databaseで再構築）
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS clipboard_history_fts_{suffix}")
+    conn.execute("DROP TABLE IF EXISTS clipboard_history_fts")
+
+
+def _migrate_split_payload(conn: sqlite3.Connection) -> None:
+    """本文を別テーブルに移し、履歴テーブルにはプレビューと行数を持たせる"""
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN preview TEXT")
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN line_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS clipboard_payload (
+            history_id INTEGER PRIMARY KEY,
+            content,
+            content_encoding INTEGER NOT NULL DEFAULT {ENCODING_PLAIN}
+        )
+    """)
+
+    # 履歴テーブル側の全文検索トリガーを外してから本文を移動（索引の内容はそのまま使える）
+    for suffix in ("ai", "ad", "au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS clipboard_history_fts_{suffix}")
+
+    conn.execute("""
+        INSERT INTO clipboard_payload (history_id, content, content_encoding)
+        SELECT id, content, content_encoding FROM clipboard_history WHERE content IS NOT NULL
+    """)
+    conn.execute(f"""
+        UPDATE clipboard_history SET
+            preview = history_preview(history_text(content, content_encoding)),
+            line_count = history_line_count(history_text(content, content_encoding)),
+            content = NULL,
+            content_encoding = {ENCODING_PLAIN}
+        WHERE content IS NOT NULL
+    """)
+
+    conn.execute("DROP VIEW IF EXISTS clipboard_history_text")
+    conn.execute("""
+        CREATE VIEW clipboard_history_text AS
+        SELECT history_id AS id, history_text(content, content_encoding) AS content FROM clipboard_payload
+    """)
+
+    # 履歴の削除に合わせて本文も削除
+    conn.execute(PAYLOAD_DELETE_TRIGGER)
+
+
+def _migrate_add_counters(conn: sqlite3.Connection) -> None:
+    """トリガーで維持する件数カウンターを追加"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    for trigger in COUNTER_TRIGGERS:
+        conn.execute(trigger)
+    _rebuild_counters(conn)
+
+
+def _migrate_add_last_used(conn: sqlite3.Connection) -> None:
+    """最終使用日時とコピー回数を追加し、一覧を最近使った順に並べるインデックスに切り替え"""
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN last_used_at DATETIME")
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN copy_count INTEGER NOT NULL DEFAULT 1")
+    conn.execute("UPDATE clipboard_history SET last_used_at = created_at")
+
+    # 絞り込み用インデックスは(last_used_at, id)順に辿れるよう複合にする
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used_at ON clipboard_history(last_used_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_category_last_used_at ON clipboard_history(category, last_used_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_is_favorite_last_used_at ON clipboard_history(is_favorite, last_used_at)")
+    conn.execute("DROP INDEX IF EXISTS idx_category_created_at")
+    conn.execute("DROP INDEX IF EXISTS idx_is_favorite_created_at")
+
+
+def _migrate_start_compact_schema(conn: sqlite3.Connection) -> None:
+    """コンパクト形式のテーブルを作成し、旧形式からの移行を開始（コピーはアイドル時に少しずつ行う）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_categories (
+            code INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.executemany(
+        "INSERT OR IGNORE INTO history_categories (name) VALUES (?)",
+        [(name,) for name in CATEGORIES],
+    )
+
+    conn.execute(COMPACT_HISTORY_TABLE)
+    for index in COMPACT_HISTORY_INDEXES:
+        conn.execute(index)
+    for trigger in COMPACT_SYNC_TRIGGERS:
+        conn.execute(trigger)
+
+
+def _copy_compact_range(conn: sqlite3.Connection, after_id: int, last_id: Optional[int] = None) -> None:
+    """旧形式の行をIDの範囲ごとにコンパクト形式のテーブルへコピー"""
+    condition = " WHERE h.id > ?"
+    params = [after_id]
+    if last_id is not None:
+        condition += " AND h.id <= ?"
+        params.append(last_id)
+
+    conn.execute(f"INSERT OR IGNORE INTO history_categories (name) SELECT DISTINCT h.category FROM clipboard_history h{condition}", params)
+    conn.execute(COMPACT_COPY_QUERY.format(conflict="OR REPLACE ") + condition, params)
+
+
+def _migrate_finish_compact_schema(conn: sqlite3.Connection) -> None:
+    """未コピーの行をコピーし、コンパクト形式のテーブルに切り替える"""
+    row = conn.execute("SELECT value FROM settings WHERE key = 'compact_migrated_id'").fetchone()
+    _copy_compact_range(conn, int(row["value"]) if row else 0)
+
+    # 削除済みの最大IDを引き継ぎ、IDが再利用されないようにする
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'clipboard_history'").fetchone()
+
+    # 旧形式のテーブルを削除すると同期トリガーやインデックスも削除される
+    conn.execute("DROP TABLE clipboard_history")
+    conn.execute("ALTER TABLE clipboard_history_v2 RENAME TO clipboard_history")
+
+    if sequence:
+        conn.execute(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'clipboard_history'",
+            (sequence["seq"],),
+        )
+
+    conn.execute(PAYLOAD_DELETE_TRIGGER)
+    for trigger in COUNTER_TRIGGERS:
+        conn.execute(trigger)
+
+    # カテゴリ別カウンターの名前をカテゴリコードに置き換える
+    conn.execute("""
+        UPDATE history_counters SET name = 'category:' || (
+            SELECT c.code FROM history_categories c WHERE c.name = substr(history_counters.name, 10)
+        )
+        WHERE name LIKE 'category:%'
+    """)
+
+
+def _compact_copy_done(conn: sqlite3.Connection) -> bool:
+    """コンパクト形式への移行で未コピーの行が残っていないか"""
+    row = conn.execute("SELECT value FROM settings WHERE key = 'compact_migrated_id'").fetchone()
+    remaining = conn.execute(
+        "SELECT 1 FROM clipboard_history WHERE id > ? LIMIT 1", (int(row["value"]) if row else 0,)
+    ).fetchone()
+    return remaining is None
+
+
+# コンパクト形式への移行中、旧形式のテーブルに追加する後続のマイグレーションの列
+# （一覧・検索・削除のクエリが参照するため。切り替え時に旧形式のテーブルごと削除される）
+LEGACY_PENDING_COLUMNS = (
+    "deleted_at INTEGER",
+    *(f"{column} TEXT" for column in FACET_FIELDS),
+    "char_count INTEGER",
+    "perceptual_hash INTEGER",
+    "group_id INTEGER",
+    "superseded INTEGER NOT NULL DEFAULT 0",
+    "text_simhash INTEGER",
+)
+
+
+def _prepare_legacy_table(conn: sqlite3.Connection) -> None:
+    """コンパクト形式への移行中も旧形式のテーブルで履歴を扱えるようにする
+
+    後続のマイグレーション（削除済みの印、派生フィールド、類似した履歴のまとめ）は
+    切り替え後に適用するため、旧形式のテーブルには参照される列だけを追加する。
+    類似した履歴のまとめやタイムライン集計、列のバックフィルは切り替え後に行う。
+    """
+    columns = _table_columns(conn, "clipboard_history")
+    for definition in LEGACY_PENDING_COLUMNS:
+        if definition.split()[0] not in columns:
+            conn.execute(f"ALTER TABLE clipboard_history ADD COLUMN {definition}")
+
+    if "deleted_at" not in columns:
+        for trigger in ("clipboard_history_counters_ad", "clipboard_history_counters_au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        for trigger in TOMBSTONE_COUNTER_TRIGGERS:
+            conn.execute(trigger)
+
+    # 月別アーカイブの管理テーブルのトリガーが参照する
+    conn.execute(TIMELINE_TABLE)
+
+
+def _migrate_add_deleted_at(conn: sqlite3.Connection) -> None:
+    """削除を取り消せるよう、削除済みの印（deleted_at）を追加（実際の削除はアイドル時に行う）"""
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN deleted_at INTEGER")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_deleted_at ON clipboard_history(deleted_at) WHERE deleted_at IS NOT NULL"
+    )
+    for trigger in ("clipboard_history_counters_ad", "clipboard_history_counters_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for trigger in TOMBSTONE_COUNTER_TRIGGERS:
+        conn.execute(trigger)
+
+    # 月別アーカイブの管理テーブル（なければinit_databaseで削除済みの印つきで作成される）
+    if _add_archive_index_columns(conn, ("deleted_at INTEGER",)):
+        conn.execute("DROP TRIGGER IF EXISTS history_archive_index_ad")
+
+
+def _migrate_add_derived_fields(conn: sqlite3.Connection) -> None:
+    """絞り込み用の派生フィールド（URLのホスト、メールのドメイン、拡張子、文字数）を追加（既存行はアイドル時に埋める）"""
+    for column in FACET_FIELDS:
+        conn.execute(f"ALTER TABLE clipboard_history ADD COLUMN {column} TEXT")
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN char_count INTEGER")
+
+    for index in DERIVED_FIELD_INDEXES:
+        conn.execute(index)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_derived_pending ON clipboard_history(id) WHERE char_count IS NULL"
+    )
+
+    # 月別アーカイブの管理テーブル（アーカイブした履歴の派生フィールドはここに持つ）
+    _add_archive_index_columns(
+        conn, (*(f"{column} TEXT" for column in FACET_FIELDS), "line_count INTEGER", "char_count INTEGER")
+    )
+
+
+def _migrate_add_timeline(conn: sqlite3.Connection) -> None:
+    """作成日時の1時間ごと・カテゴリごとの件数をトリガーで維持する集計テーブルを追加
+
+    アーカイブした履歴は管理テーブルに作成日時を持たせ、アイドル時に埋めた分から集計に加える。
+    """
+    conn.execute(TIMELINE_TABLE)
+    for trigger in TIMELINE_TRIGGERS:
+        conn.execute(trigger)
+
+    _add_archive_index_columns(conn, ("created_at INTEGER",))
+
+    conn.execute(
+        f"""
+        INSERT INTO history_timeline (bucket, category, count)
+        SELECT created_at / {TIMELINE_BUCKET_MS} AS bucket, category, COUNT(*) FROM clipboard_history
+        WHERE deleted_at IS NULL GROUP BY bucket, category
+        """
+    )
+
+
+def _migrate_add_image_groups(conn: sqlite3.Connection) -> None:
+    """画像の知覚ハッシュと類似した履歴のグループを追加（既存の画像のハッシュはアイドル時に埋める）
+
+    グループの履歴はgroup_idが同じで、最後に使ったもの以外はsuperseded = 1として一覧から隠す。
+    """
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN perceptual_hash INTEGER")
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN group_id INTEGER")
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN superseded INTEGER NOT NULL DEFAULT 0")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_group_id ON clipboard_history(group_id) WHERE group_id IS NOT NULL"
+    )
+    for trigger in GROUP_TRIGGERS:
+        conn.execute(trigger)
+
+    # アーカイブした履歴もグループの絞り込みに含める
+    _add_archive_index_columns(conn, ("group_id INTEGER",))
+
+
+def _migrate_add_text_groups(conn: sqlite3.Connection) -> None:
+    """テキストのSimHashとその索引を追加（既存のテキストのSimHashはアイドル時に埋める）
+
+    編集版のテキストは画像と同じgroup_idとsupersededでまとめる。
+    保持ポリシーで最新以外の版から削除するためのインデックスも作成する。
+    """
+    conn.execute("ALTER TABLE clipboard_history ADD COLUMN text_simhash INTEGER")
+    conn.execute(TEXT_SIMHASH_BAND_TABLE)
+    for trigger in TEXT_SIMHASH_BAND_TRIGGERS:
+        conn.execute(trigger)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_superseded_last_used_at"
+        " ON clipboard_history(last_used_at, id) WHERE superseded = 1"
+    )
+
+    # アーカイブから戻した履歴も索引に加えるためSimHashを管理テーブルに持つ
+    _add_archive_index_columns(conn, ("text_simhash INTEGER",))
+
+
+# コンパクト形式への移行が完了したスキーマバージョン
+COMPACT_SCHEMA_VERSION = 7
+
+# (バージョン, マイグレーション関数) の一覧（PRAGMA user_versionで適用済みバージョンを管理）
+_MIGRATIONS = (
+    (1, _migrate_add_size_bytes),
+    (2, _migrate_add_content_encoding),
+    (3, _migrate_split_payload),
+    (4, _migrate_add_counters),
+    (5, _migrate_add_last_used),
+    (6, _migrate_start_compact_schema),
+    (COMPACT_SCHEMA_VERSION, _migrate_finish_compact_schema),
+    (8, _migrate_add_deleted_at),
+    (9, _migrate_add_derived_fields),
+    (10, _migrate_add_timeline),
+    (11, _migrate_add_image_groups),
+    (12, _migrate_add_text_groups),
+)
+
+# 起動時には実行せずアイドル時に少しずつ進めるマイグレーション（バージョン: すぐに完了できるか判定する関数）
+# 残りの処理がない場合は起動時に完了させる。完了するまで後続のマイグレーションは適用しない
+_BACKGROUND_MIGRATIONS = {
+    COMPACT_SCHEMA_VERSION: _compact_copy_done,
+}
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """未適用のマイグレーションを順に適用（アイドル時に進める移行が終わっていなければそこで止める）"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for target_version, migration in _MIGRATIONS:
+        if version < target_version:
+            ready = _BACKGROUND_MIGRATIONS.get(target_version)
+            if ready and not ready(conn):
+                break
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target_version}")
+            version = target_version
+
+
+def migrate_compact_schema_batch(batch_size: int = 2000) -> int:
+    """旧形式の履歴を少しずつコンパクト形式へコピーし、全件コピーしたら切り替える（コピーした件数を返す）
+
+    進捗を設定に記録するため、中断しても次回は続きからコピーする。
+    コピー済みの行への変更は同期トリガーで反映される。
+    切り替えた後、移行の完了を待っていた後続のマイグレーションを適用する。
+    """
+    global _compact_schema, _image_index
+
+    if _compact_schema:
+        return 0
+
+    conn = get_connection()
+    last_id = int(get_setting("compact_migrated_id", "0"))
+
+    chunk = conn.execute(
+        "SELECT COUNT(*) AS count, MAX(id) AS last_id FROM"
+        " (SELECT id FROM clipboard_history WHERE id > ? ORDER BY id LIMIT ?)",
+        (last_id, batch_size),
+    ).fetchone()
+
+    if chunk["count"] == 0:
+        # 書き込みのロック内で切り替えるため、切り替え前の形式で書き込まれることはない
+        # 切り替えを待っていた後続のマイグレーションも同じトランザクションで適用する
+        with write_transaction() as conn:
+            # 削除済みの印はコピーされないため、取り消し待ちの履歴はここで削除する
+            deleted = conn.execute(
+                "DELETE FROM clipboard_history WHERE deleted_at IS NOT NULL RETURNING image_path"
+            ).fetchall()
+            _migrate_finish_compact_schema(conn)
+            conn.execute(f"PRAGMA user_version = {COMPACT_SCHEMA_VERSION}")
+            _migrate(conn)
+            _compact_schema = True
+            _image_index = None
+        remove_image_files([row["image_path"] for row in deleted if row["image_path"]])
+        # 日時やカテゴリの形式が変わるためキャッシュは使えない
+        _cache.clear()
+        return 0
+
+    with write_transaction() as conn:
+        _copy_compact_range(conn, last_id, chunk["last_id"])
+
+    set_setting("compact_migrated_id", str(chunk["last_id"]))
+
+    return chunk["count"]
+
+
+def _hash_param(content_hash: str):
+    """ハッシュをテーブルの形式に合わせた検索・挿入用の値に変換"""
+    return hash_to_bytes(content_hash) if _compact_schema else content_hash
+
+
+def _time_param(epoch_ms: int):
+    """エポックミリ秒をテーブルの形式に合わせた比較用の値に変換"""
+    if _compact_schema:
+        return epoch_ms
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch_ms / 1000))
+
+
+def _load_categories(conn: sqlite3.Connection) -> None:
+    """カテゴリ名とコードの対応を読み込む"""
+    for row in conn.execute("SELECT code, name FROM history_categories"):
+        _category_codes[row["name"]] = row["code"]
+        _category_names[row["code"]] = row["name"]
+
+
+def _category_param(category: str, writer: Optional[sqlite3.Connection] = None):
+    """カテゴリ名をテーブルの形式に合わせた値に変換（書き込み用の接続を渡すと未登録のカテゴリを登録）"""
+    if not _compact_schema:
+        return category
+
+    code = _category_codes.get(category)
+    if code is None:
+        conn = writer or get_connection()
+        if writer is not None:
+            conn.execute("INSERT OR IGNORE INTO history_categories (name) VALUES (?)", (category,))
+        _load_categories(conn)
+        code = _category_codes.get(category)
+    return code
+
+
+def _category_name(code: int) -> str:
+    """カテゴリコードをカテゴリ名に変換"""
+    name = _category_names.get(code)
+    if name is None:
+        _load_categories(get_connection())
+        name = _category_names.get(code, str(code))
+    return name
+
+
+def _use_fts(search_query: str) -> bool:
+    """検索語に全文検索インデックスを使えるか判定"""
+    return _fts_enabled and len(search_query) >= FTS_MIN_QUERY_LENGTH
+
+
+def _fts_phrase(search_query: str) -> str:
+    """検索語をFTS5のフレーズとしてエスケープ"""
+    return '"' + search_query.replace('"', '""') + '"'
+
+
+def _snippet_column(fts_table: str = "clipboard_history_fts") -> str:
+    """スニペットを取得するSQL式"""
+    return (
+        f"snippet({fts_table}, 0, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', "
+        f"'{SNIPPET_ELLIPSIS}', {SNIPPET_TOKENS}) AS snippet"
+    )
+
+
+def _month_of(epoch_ms: int) -> int:
+    """エポックミリ秒の属する月（UTC、YYYYMM形式の整数）"""
+    moment = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+    return moment.year * 100 + moment.month
+
+
+def _month_range(month: int) -> tuple[int, int]:
+    """月の範囲（開始と翌月開始のエポックミリ秒）"""
+    year, month = divmod(month, 100)
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def archive_path(month: int) -> Path:
+    """月別アーカイブのファイルパス"""
+    return ARCHIVE_DIR / f"history_{month // 100:04d}_{month % 100:02d}.db"
+
+
+# ATTACHするアーカイブのスキーマ名の連番（同じ接続で入れ子にATTACHしても重複しない）
+_archive_aliases = itertools.count(1)
+
+
+@contextmanager
+def _attach_archive(conn: sqlite3.Connection, month: int, create: bool = False) -> Iterator[Optional[str]]:
+    """月別アーカイブをATTACHしてスキーマ名を返す（ファイルがなければNone）
+
+    トランザクション中の接続にはATTACHできないため、書き込み用の接続では
+    トランザクションの外で使用する。ブロックを抜けるとDETACHする。
+    """
+    path = archive_path(month)
+    if not create and not path.exists():
+        yield None
+        return
+
+    schema = f"archive_{next(_archive_aliases)}"
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+    try:
+        if create:
+            for statement in ARCHIVE_SCHEMA:
+                conn.execute(statement.format(schema=schema))
+            if _fts_enabled:
+                conn.execute(ARCHIVE_FTS_TABLE.format(schema=schema))
+        yield schema
+    finally:
+        conn.execute(f"DETACH DATABASE {schema}")
+
+
+def _archive_months(conn: sqlite3.Connection) -> list[int]:
+    """アーカイブがある月（新しい順）"""
+    if not _compact_schema:
+        return []
+    return [row["month"] for row in conn.execute("SELECT month FROM history_archive_months ORDER BY month DESC")]
+
+
+def _archived_ids_by_month(conn: sqlite3.Connection, history_ids: list[int]) -> dict[int, list[int]]:
+    """アーカイブにある履歴のIDを月ごとにまとめる"""
+    by_month: dict[int, list[int]] = {}
+    if not _compact_schema:
+        return by_month
+
+    for chunk in _chunks(list(history_ids)):
+        placeholders = ", ".join("?" * len(chunk))
+        for row in conn.execute(
+            f"SELECT id, month FROM history_archive_index WHERE id IN ({placeholders}) AND deleted_at IS NULL", chunk
+        ):
+            by_month.setdefault(row["month"], []).append(row["id"])
+
+    return by_month
+
+
+def is_managed_image(image_path: str) -> bool:
+    """アプリが保存した画像ファイル（IMAGES_DIR直下）か判定"""
+    return Path(image_path).parent == IMAGES_DIR
+
+
+def _entry_size(content: Optional[str], image_path: Optional[str]) -> int:
+    """履歴1件が占めるバイト数（テキスト＋アプリが保存した画像ファイル）"""
+    size = len(content.encode("utf-8")) if content else 0
+
+    if image_path and is_managed_image(image_path):
+        try:
+            size += Path(image_path).stat().st_size
+        except OSError:
+            pass
+
+    return size
+
+
+def _unlink_files(image_paths: list[str]) -> None:
+    """ファイルを同期的に削除"""
+    for image_path in image_paths:
+        try:
+            Path(image_path).unlink(missing_ok=True)
+        except Exception:
+            pass  # ファイル削除に失敗しても処理は続行
+
+
+# 画像ファイルの削除処理（set_image_removerでバックグラウンド処理に差し替えられる）
+_image_remover: Callable[[list[str]], None] = _unlink_files
+
+
+def set_image_remover(remover: Optional[Callable[[list[str]], None]]) -> None:
+    """画像ファイルの削除処理を設定（Noneで同期削除に戻す）"""
+    global _image_remover
+    _image_remover = remover or _unlink_files
+
+
+def remove_image_files(image_paths: list[str]) -> None:
+    """アプリが保存した画像ファイルを削除（ユーザーのファイルは削除しない）"""
+    managed = [image_path for image_path in image_paths if image_path and is_managed_image(image_path)]
+    if managed:
+        _image_remover(managed)
+
+
+def _upsert_history(conn: sqlite3.Connection, entry: dict) -> tuple[int, bool, dict, list[int]]:
+    """履歴を追加、既に同じ内容があれば最終使用日時とコピー回数を更新
+
+    (ID, 新規追加か, キャッシュの破棄に使う変更後の行, 類似した履歴のまとめで変更された履歴のID)を返す。
+    entryにlegacy_hash（以前の形式の画像のハッシュ）がある場合は、そのハッシュの履歴を
+    content_hashに置き換えてから更新する。
+    """
+    if entry.get("legacy_hash") is not None:
+        conn.execute(
+            "UPDATE OR IGNORE clipboard_history SET content_hash = ? WHERE content_hash = ?",
+            (_hash_param(entry["content_hash"]), _hash_param(entry["legacy_hash"])),
+        )
+
+    content = entry.get("content")
+    image_path = entry.get("image_path")
+    perceptual_hash = entry.get("perceptual_hash")
+    text_simhash = entry.get("text_simhash")
+    derived = extract_derived_fields(entry["category"], content, image_path)
+
+    row = conn.execute(
+        f"""
+        INSERT INTO clipboard_history
+            (content_type, preview, image_path, content_hash, category, size_bytes, line_count,
+             {", ".join(DERIVED_COLUMNS)}, perceptual_hash, text_simhash, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, {", ".join("?" * len(DERIVED_COLUMNS))}, ?, ?,
+                {EPOCH_MS_NOW if _compact_schema else LAST_USED_NOW})
+        ON CONFLICT (content_hash) DO UPDATE SET
+            last_used_at = excluded.last_used_at,
+            copy_count = copy_count + 1,
+            deleted_at = NULL
+        RETURNING id, copy_count, last_used_at, category, is_favorite, group_id
+        """,
+        (
+            entry["content_type"],
+            make_preview(content),
+            image_path,
+            _hash_param(entry["content_hash"]),
+            _category_param(entry["category"], writer=conn),
+            _entry_size(content, image_path),
+            count_lines(content),
+            *(derived[column] for column in DERIVED_COLUMNS),
+            to_signed(perceptual_hash) if perceptual_hash is not None else None,
+            to_signed(text_simhash) if text_simhash is not None else None,
+        ),
+    ).fetchone()
+    history_id, changed = row["id"], _row_to_dict(row)
+
+    if row["copy_count"] > 1:
+        # グループの古い履歴を再コピーした場合はトリガーでその履歴が最新になる
+        affected = _group_member_ids(conn, row["group_id"]) if row["group_id"] is not None else []
+        return history_id, False, changed, affected
+
+    if _compact_schema:
+        # アーカイブにある同じ内容の履歴は新しい履歴に置き換える
+        conn.execute("DELETE FROM history_archive_index WHERE content_hash = ?", (_hash_param(entry["content_hash"]),))
+
+    if content is not None:
+        stored, encoding = compress_text(content)
+        conn.execute(
+            "INSERT INTO clipboard_payload (history_id, content, content_encoding) VALUES (?, ?, ?)",
+            (history_id, stored, encoding),
+        )
+
+    # 類似した履歴のまとめはコンパクト形式への移行後に行う
+    affected = []
+    if _compact_schema and perceptual_hash is not None:
+        affected = _group_similar_image(conn, history_id, perceptual_hash)
+    elif _compact_schema and text_simhash is not None:
+        affected = _group_similar_text(conn, history_id, text_simhash)
+
+    return history_id, True, changed, affected
+
+
+def get_image_group_policy() -> tuple[str, int]:
+    """設定から類似画像の扱いとハミング距離のしきい値を取得（不正な値は初期値）"""
+    policy = get_setting("image_group_policy", DEFAULT_IMAGE_GROUP_POLICY)
+    if policy not in GROUP_POLICIES:
+        policy = DEFAULT_IMAGE_GROUP_POLICY
+
+    try:
+        threshold = int(get_setting("image_group_threshold", str(DEFAULT_IMAGE_GROUP_THRESHOLD)))
+    except (TypeError, ValueError):
+        threshold = DEFAULT_IMAGE_GROUP_THRESHOLD
+
+    return policy, min(max(threshold, 0), MAX_IMAGE_GROUP_THRESHOLD)
+
+
+def _load_image_index(conn: sqlite3.Connection) -> MultiIndexHash:
+    """画像の知覚ハッシュの索引を取得（初回はホットデータベースの画像から作る）"""
+    global _image_index
+
+    if _image_index is None:
+        index = MultiIndexHash()
+        for history_id, value in conn.execute(
+            "SELECT id, perceptual_hash FROM clipboard_history WHERE perceptual_hash IS NOT NULL AND deleted_at IS NULL"
+        ):
+            index.add(history_id, from_signed(value))
+        _image_index = index
+
+    return _image_index
+
+
+def _group_member_ids(conn: sqlite3.Connection, group_id: int) -> list[int]:
+    """グループの履歴のID"""
+    return [row[0] for row in conn.execute("SELECT id FROM clipboard_history WHERE group_id = ?", (group_id,))]
+
+
+def _group_similar_image(conn: sqlite3.Connection, history_id: int, perceptual_hash: int) -> list[int]:
+    """追加した画像を知覚ハッシュの近い既存の画像とまとめる（変更された履歴のIDを返す）
+
+    索引は削除や書き込みの失敗を反映しないことがあるため、候補はデータベースで確かめる。
+    """
+    policy, threshold = get_image_group_policy()
+    index = _load_image_index(conn)
+    candidates = [item_id for item_id, _ in index.query(perceptual_hash, threshold) if item_id != history_id]
+    index.add(history_id, perceptual_hash)
+
+    if policy == "off" or not candidates:
+        return []
+
+    rows = conn.execute(
+        f"""
+        SELECT id, group_id, is_favorite, perceptual_hash, deleted_at FROM clipboard_history
+        WHERE id IN ({", ".join("?" * len(candidates))}) AND perceptual_hash IS NOT NULL
+        """,
+        candidates,
+    ).fetchall()
+
+    # 実際に削除された（またはアーカイブされた）履歴は索引から外す（削除済みの印だけなら取り消せるため残す）
+    for stale in set(candidates) - {row["id"] for row in rows}:
+        index.remove(stale)
+    rows = [row for row in rows if row["deleted_at"] is None]
+    if not rows:
+        return []
+
+    nearest = min(rows, key=lambda row: (hamming_distance(perceptual_hash, from_signed(row["perceptual_hash"])), -row["id"]))
+    return _merge_into_group(conn, history_id, nearest, policy)
+
+
+def get_text_group_policy() -> tuple[str, int]:
+    """設定からテキストの編集版の扱いとハミング距離のしきい値を取得（不正な値は初期値）"""
+    policy = get_setting("text_group_policy", DEFAULT_TEXT_GROUP_POLICY)
+    if policy not in GROUP_POLICIES:
+        policy = DEFAULT_TEXT_GROUP_POLICY
+
+    try:
+        threshold = int(get_setting("text_group_threshold", str(DEFAULT_TEXT_GROUP_THRESHOLD)))
+    except (TypeError, ValueError):
+        threshold = DEFAULT_TEXT_GROUP_THRESHOLD
+
+    return policy, min(max(threshold, 0), MAX_TEXT_GROUP_THRESHOLD)
+
+
+def _similar_texts(conn: sqlite3.Connection, text_simhash: int, max_distance: int) -> list[tuple[int, int]]:
+    """SimHashの距離がmax_distance以内の履歴を(ID, 距離)の近い順で返す（削除済みの印がある履歴を含む）
+
+    索引の区間のキーで候補を引き、距離は索引の表に持つハッシュで確かめる（履歴の行は読まない）。
+    """
+    keys = band_keys(text_simhash, max_distance)
+    distances = {}
+    for chunk in _chunks(keys):
+        for history_id, value in conn.execute(
+            f"SELECT history_id, simhash FROM text_simhash_band WHERE key IN ({', '.join('?' * len(chunk))})",
+            chunk,
+        ):
+            distances[history_id] = hamming_distance(text_simhash, from_signed(value))
+
+    matches = [(history_id, distance) for history_id, distance in distances.items() if distance <= max_distance]
+    matches.sort(key=lambda match: (match[1], -match[0]))
+    return matches
+
+
+def _group_similar_text(conn: sqlite3.Connection, history_id: int, text_simhash: int) -> list[int]:
+    """追加したテキストをSimHashの近い既存のテキスト（編集前の版）とまとめる（変更された履歴のIDを返す）"""
+    policy, threshold = get_text_group_policy()
+    if policy == "off":
+        return []
+
+    distances = {
+        item_id: distance for item_id, distance in _similar_texts(conn, text_simhash, threshold)
+        if item_id != history_id
+    }
+    if not distances:
+        return []
+
+    rows = conn.execute(
+        f"""
+        SELECT id, group_id, is_favorite FROM clipboard_history
+        WHERE id IN ({", ".join("?" * len(distances))}) AND deleted_at IS NULL
+        """,
+        list(distances),
+    ).fetchall()
+    if not rows:
+        return []
+
+    nearest = min(rows, key=lambda row: (distances[row["id"]], -row["id"]))
+    return _merge_into_group(conn, history_id, nearest, policy)
+
+
+def _merge_into_group(conn: sqlite3.Connection, history_id: int, nearest: sqlite3.Row, policy: str) -> list[int]:
+    """追加した履歴を最も近い既存の履歴nearestとまとめる（変更された履歴のIDを返す）
+
+    groupではnearestのグループに加えて追加した履歴を最新とし、collapseではnearest
+    （とそのグループ）を削除済みにする（お気に入りは削除せずgroupと同じ扱い）。
+    """
+    if policy == "collapse" and not nearest["is_favorite"]:
+        deleted_at = int(time.time() * 1000)
+        group_id = nearest["group_id"]
+        return [
+            row[0] for row in conn.execute(
+                "UPDATE clipboard_history SET deleted_at = ?"
+                " WHERE (id = ? OR group_id = ?) AND deleted_at IS NULL AND is_favorite = FALSE RETURNING id",
+                (deleted_at, nearest["id"], group_id if group_id is not None else nearest["id"]),
+            )
+        ]
+
+    # グループに加える（トリガーで追加した履歴が最新になる）
+    group_id = nearest["group_id"] if nearest["group_id"] is not None else nearest["id"]
+    conn.execute(
+        "UPDATE clipboard_history SET group_id = ? WHERE id IN (?, ?)",
+        (group_id, nearest["id"], history_id),
+    )
+    return _group_member_ids(conn, group_id)
+
+
+def add_history(
+    content_type: str,
+    content_hash: str,
+    category: str,
+    content: Optional[str] = None,
+    image_path: Optional[str] = None,
+    perceptual_hash: Optional[int] = None,
+    text_simhash: Optional[int] = None,
+) -> int:
+    """履歴を追加（重複時は既存の履歴を最近使ったものとして更新し、そのIDを返す）
+
+    perceptual_hashは画像の知覚ハッシュで、指定すると類似画像の設定に応じて既存の画像とまとめる。
+    text_simhashはテキストのSimHashで、指定すると編集前の版のテキストとまとめる。
+    """
+    with write_transaction() as conn:
+        history_id, _, changed, affected = _upsert_history(conn, {
+            "content_type": content_type,
+            "content_hash": content_hash,
+            "category": category,
+            "content": content,
+            "image_path": image_path,
+            "perceptual_hash": perceptual_hash,
+            "text_simhash": text_simhash,
+        })
+    _cache.invalidate([history_id, *affected], [changed])
+    return history_id
+
+
+def add_history_many(entries: list[dict]) -> list[tuple[int, bool]]:
+    """複数の履歴を1トランザクションで追加（各要素はadd_historyの引数、(ID, 新規追加か)のリストを返す）"""
+    with write_transaction() as conn:
+        results = [_upsert_history(conn, entry) for entry in entries]
+    _cache.invalidate(
+        [item_id for history_id, _, _, affected in results for item_id in (history_id, *affected)],
+        [changed for _, _, changed, _ in results],
+    )
+    return [(history_id, inserted) for history_id, inserted, _, _ in results]
+
+
+def _row_to_dict(row: sqlite3.Row) -> dict:
+    """行を辞書に変換（圧縮された本文は展開する）"""
+    data = dict(row)
+    encoding = data.pop("content_encoding", ENCODING_PLAIN)
+
+    # コンパクト形式の値は呼び出し側で扱う形式（16進文字列のハッシュ、カテゴリ名）に戻す
+    if isinstance(data.get("content_hash"), bytes):
+        data["content_hash"] = data["content_hash"].hex()
+    if isinstance(data.get("category"), int):
+        data["category"] = _category_name(data["category"])
+
+    if encoding and data.get("content") is not None:
+        data["content"] = decompress_text(data["content"], encoding)
+
+    return data
+
+
+def _facet_conditions(facets: Optional[dict], table: str) -> tuple[str, list]:
+    """派生フィールドの絞り込み条件を構築（facetsはFACET_CONDITIONSの名前と値、値がNoneの項目は無視）"""
+    query = ""
+    params = []
+
+    for name, value in (facets or {}).items():
+        condition = FACET_CONDITIONS.get(name)
+        if condition is None:
+            raise ValueError(f"不明な絞り込み項目です: {name}")
+        if value is None:
+            continue
+        query += " AND " + condition.format(t=table)
+        params.append(normalize_facet_value(name, value) if name in FACET_FIELDS else int(value))
+
+    return query, params
+
+
+def _facet_key(facets: Optional[dict]) -> Optional[tuple]:
+    """派生フィールドの絞り込み条件をキャッシュのキーに使える形に変換"""
+    if not facets:
+        return None
+    return tuple(sorted((name, value) for name, value in facets.items() if value is not None)) or None
+
+
+def _build_history_query(
+    category: Optional[str],
+    search_query: Optional[str],
+    favorites_only: bool,
+    facets: Optional[dict] = None,
+    id_only: bool = False,
+    schema: Optional[str] = None,
+) -> tuple[str, list]:
+    """履歴一覧のSELECT文と絞り込み条件を構築（ORDER BYは呼び出し側で付与）
+
+    一覧には本文を含めずプレビューだけを返す。本文はget_history_by_idで取得する。
+    facetsで派生フィールド（URLのホスト、拡張子、行数など）による絞り込みを指定する。
+    id_onlyがTrueの場合はIDだけを取得する（一括操作用）。
+    schemaを指定するとATTACHした月別アーカイブを検索する。
+    類似した履歴のグループは、検索語・id_only・group_idの絞り込みがない場合は最新のものだけを返す。
+    """
+    columns = "h.id" if id_only else HISTORY_LIST_COLUMNS
+
+    if schema:
+        history, fts, text_view = f"{schema}.archived_history", "archived_history_fts", f"{schema}.archived_history_text"
+    else:
+        history, fts, text_view = "clipboard_history", "clipboard_history_fts", "clipboard_history_text"
+
+    if search_query and _use_fts(search_query):
+        # 一致した行だけを索引から取り出して結合する
+        if not id_only:
+            columns += f", {_snippet_column(fts)}"
+        query = (
+            f"SELECT {columns} FROM {schema + '.' if schema else ''}{fts}"
+            f" JOIN {history} h ON h.id = {fts}.rowid"
+            f" WHERE {fts} MATCH ?"
+        )
+        params = [_fts_phrase(search_query)]
+    else:
+        query = f"SELECT {columns} FROM {history} h WHERE 1=1"
+        params = []
+
+        if search_query:
+            query += f" AND h.id IN (SELECT id FROM {text_view} WHERE content LIKE ?)"
+            params.append(f"%{search_query}%")
+
+    if schema:
+        # 削除済み・ホットデータベースに戻した行はアーカイブファイルに残っていても除外する
+        # （アーカイブした履歴の派生フィールドは管理テーブルにある）
+        facet_query, facet_params = _facet_conditions(facets, "x")
+        query += (
+            " AND EXISTS (SELECT 1 FROM main.history_archive_index x"
+            f" WHERE x.id = h.id AND x.deleted_at IS NULL{facet_query})"
+        )
+        params.extend(facet_params)
+    else:
+        query += " AND h.deleted_at IS NULL"
+        facet_query, facet_params = _facet_conditions(facets, "h")
+        query += facet_query
+        params.extend(facet_params)
+
+        # 類似した履歴のグループは最新のものだけを一覧に出す
+        # （検索・一括操作・グループの絞り込みでは古い履歴も対象にする）
+        if not (search_query or id_only or (facets or {}).get("group_id") is not None):
+            query += " AND h.superseded = 0"
+
+    if category:
+        query += " AND h.category = ?"
+        params.append(_category_param(category))
+
+    if favorites_only:
+        query += " AND h.is_favorite = TRUE"
+
+    return query, params
+
+
+def _fetch_history(
+    conn: sqlite3.Connection,
+    limit: int,
+    category: Optional[str],
+    search_query: Optional[str],
+    favorites_only: bool,
+    facets: Optional[dict] = None,
+    after: Optional[tuple] = None,
+) -> list[dict]:
+    """履歴を最近使った順に最大limit件取得（afterは(last_used_at, id)で、これより古い行から読む）
+
+    まずホットデータベースだけを読み、足りない場合や結果が月別アーカイブの期間に
+    かかる場合だけアーカイブを新しい月から順にATTACHして結果を併合する。
+    """
+    def fetch(schema: Optional[str]) -> list[dict]:
+        query, params = _build_history_query(category, search_query, favorites_only, facets, schema=schema)
+        if after:
+            query += " AND (h.last_used_at, h.id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY h.last_used_at DESC, h.id DESC LIMIT ?"
+        params.append(limit)
+        return [_row_to_dict(row) for row in conn.execute(query, params).fetchall()]
+
+    rows = fetch(None)
+
+    # お気に入りはアーカイブしない
+    if favorites_only:
+        return _add_group_sizes(conn, rows)
+
+    created_from = (facets or {}).get("created_from")
+
+    for month in _archive_months(conn):
+        start, end = _month_range(month)
+        if after and start > after[0]:
+            continue
+        if created_from is not None and end <= created_from:
+            # 作成日時は最終使用日時より前のため、これより古い月の行は期間に入らない
+            break
+        if len(rows) >= limit and rows[limit - 1]["last_used_at"] >= end:
+            # これより古い月の行がページに入ることはない
+            break
+
+        with _attach_archive(conn, month) as schema:
+            if schema is None:
+                continue
+            archived = fetch(schema)
+
+        if archived:
+            rows = sorted(rows + archived, key=lambda row: (row["last_used_at"], row["id"]), reverse=True)[:limit]
+
+    return _add_group_sizes(conn, rows)
+
+
+def _add_group_sizes(conn: sqlite3.Connection, rows: list[dict]) -> list[dict]:
+    """類似した履歴のグループに入っている行にgroup_idとgroup_size（削除されていない履歴の数）を付与"""
+    if not rows:
+        return rows
+
+    ids = [row["id"] for row in rows]
+    groups = {}
+    for chunk in _chunks(ids):
+        groups.update(
+            (row["id"], (row["group_id"], row["group_size"])) for row in conn.execute(
+                f"""
+                SELECT h.id, h.group_id, (
+                    SELECT COUNT(*) FROM clipboard_history g WHERE g.group_id = h.group_id AND g.deleted_at IS NULL
+                ) AS group_size
+                FROM clipboard_history h WHERE h.id IN ({", ".join("?" * len(chunk))}) AND h.group_id IS NOT NULL
+                """,
+                chunk,
+            )
+        )
+
+    for row in rows:
+        if row["id"] in groups:
+            row["group_id"], row["group_size"] = groups[row["id"]]
+
+    return rows
+
+
+def get_history(
+    limit: int = 100,
+    offset: int = 0,
+    category: Optional[str] = None,
+    search_query: Optional[str] = None,
+    favorites_only: bool = False,
+    facets: Optional[dict] = None,
+) -> list[dict]:
+    """履歴を取得（検索時は全文検索インデックスを使用し、スニペットを付与）
+
+    facetsで派生フィールドによる絞り込みを指定する（例: {"url_host": "github.com"}、
+    {"file_ext": "py"}、{"min_lines": 10}、名前はFACET_CONDITIONSを参照）。
+    先頭からの取得結果はキャッシュし、同じ条件での再取得はデータベースを読まない。
+    """
+    filters = {"category": category, "search_query": search_query, "favorites_only": favorites_only, "facets": facets}
+    key = ("list", limit, category, search_query, favorites_only, _facet_key(facets))
+    if offset == 0:
+        cached = _cache.get_page(key)
+        if cached is not None:
+            return cached
+
+    generation = _cache.generation
+    conn = get_connection()
+
+    rows = _fetch_history(conn, limit + offset, category, search_query, favorites_only, facets)
+
+    if offset == 0:
+        _cache.put_page(key, rows, rows, filters, generation, full=len(rows) >= limit)
+
+    return rows[offset:]
+
+
+def _encode_cursor(row: dict) -> str:
+    """行の並び順の位置を継続トークンに変換"""
+    payload = json.dumps([row["last_used_at"], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    """継続トークンを(last_used_at, id)に復元"""
+    try:
+        last_used_at, history_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"不正な継続トークンです: {cursor!r}") from e
+    return last_used_at, history_id
+
+
+def get_history_page(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    search_query: Optional[str] = None,
+    favorites_only: bool = False,
+    facets: Optional[dict] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """履歴をキーセット方式で1ページ取得（次ページの継続トークンも返す）
+
+    最近使った順に並べ、OFFSETを使わず直前のページ末尾の(last_used_at, id)より古い行から読むため、
+    どれだけ深いページでも取得コストは一定。ページがホットデータベースの範囲を過ぎると
+    月別アーカイブも読む。次ページがない場合トークンはNone。
+    取得結果は絞り込み条件と継続トークンごとにキャッシュする。
+    """
+    filters = {"category": category, "search_query": search_query, "favorites_only": favorites_only, "facets": facets}
+    key = ("page", limit, cursor, category, search_query, favorites_only, _facet_key(facets))
+    cached = _cache.get_page(key)
+    if cached is not None:
+        return cached
+
+    generation = _cache.generation
+    conn = get_connection()
+
+    after = None
+    if cursor:
+        last_used_at, history_id = _decode_cursor(cursor)
+        if _compact_schema:
+            # 移行前に発行された継続トークンにも対応する
+            last_used_at = timestamp_to_epoch_ms(last_used_at)
+        after = (last_used_at, history_id)
+
+    # 次ページの有無を判定するため1件多く取得
+    rows = _fetch_history(conn, limit + 1, category, search_query, favorites_only, facets, after=after)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1])
+
+    _cache.put_page(key, (rows, next_cursor), rows, filters, generation, upper=after, full=next_cursor is not None)
+
+    return rows, next_cursor
+
+
+def search_history(
+    search_query: str,
+    limit: int = 50,
+    category: Optional[str] = None,
+    favorites_only: bool = False,
+    facets: Optional[dict] = None,
+) -> list[dict]:
+    """履歴を全文検索（関連度順、スニペット付き）"""
+    if not _use_fts(search_query):
+        # 索引を使えない短い検索語は新しい順で返す
+        return get_history(
+            limit=limit,
+            category=category,
+            search_query=search_query,
+            favorites_only=favorites_only,
+            facets=facets,
+        )
+
+    filters = {"category": category, "search_query": search_query, "favorites_only": favorites_only, "facets": facets}
+    key = ("search", limit, category, search_query, favorites_only, _facet_key(facets))
+    cached = _cache.get_page(key)
+    if cached is not None:
+        return cached
+
+    generation = _cache.generation
+    conn = get_connection()
+
+    query, params = _build_history_query(category, search_query, favorites_only, facets)
+
+    # rankはbm25スコア（小さいほど関連度が高い）
+    query += " ORDER BY clipboard_history_fts.rank LIMIT ?"
+    params.append(limit)
+
+    rows = [_row_to_dict(row) for row in conn.execute(query, params).fetchall()]
+
+    # 足りない分は月別アーカイブを新しい月から検索する（スコアは索引ごとに異なるため後ろに並べる）
+    if not favorites_only:
+        for month in _archive_months(conn):
+            if len(rows) >= limit:
+                break
+            with _attach_archive(conn, month) as schema:
+                if schema is None:
+                    continue
+                query, params = _build_history_query(category, search_query, favorites_only, facets, schema=schema)
+                query += " ORDER BY archived_history_fts.rank LIMIT ?"
+                params.append(limit - len(rows))
+                rows.extend(_row_to_dict(row) for row in conn.execute(query, params).fetchall())
+
+    # 関連度順のため、条件に合う行が変更されたら位置によらず破棄する
+    _cache.put_page(key, rows, rows, filters, generation)
+
+    return rows
+
+
+def get_history_by_id(history_id: int) -> Optional[dict]:
+    """IDで履歴を取得（本文を含む、展開済みの行をキャッシュする）"""
+    cached = _cache.get_row(history_id)
+    if cached is not None:
+        return cached
+
+    generation = _cache.generation
+    conn = get_connection()
+
+    row = conn.execute(
+        f"""
+        SELECT {HISTORY_LIST_COLUMNS}, p.content, p.content_encoding
+        FROM clipboard_history h LEFT JOIN clipboard_payload p ON p.history_id = h.id
+        WHERE h.id = ? AND h.deleted_at IS NULL
+        """,
+        (history_id,),
+    ).fetchone()
+
+    if row is None:
+        # 月別アーカイブにある履歴
+        for month in _archived_ids_by_month(conn, [history_id]):
+            with _attach_archive(conn, month) as schema:
+                if schema is not None:
+                    row = conn.execute(
+                        f"""
+                        SELECT {HISTORY_LIST_COLUMNS}, h.content, h.content_encoding
+                        FROM {schema}.archived_history h WHERE h.id = ?
+                        """,
+                        (history_id,),
+                    ).fetchone()
+
+    if row is None:
+        return None
+
+    data = _row_to_dict(row)
+    _cache.put_row(data, generation)
+    return data
+
+
+def delete_history(history_id: int) -> bool:
+    """履歴を削除済みにする（restore_deleted_historyで取り消せる、行と画像はアイドル時に削除）"""
+    return delete_history_many([history_id]) > 0
+
+
+def toggle_favorite(history_id: int) -> bool:
+    """お気に入り状態をトグル（アーカイブにある履歴はホットデータベースに戻す）"""
+    _restore_archived([history_id])
+
+    with write_transaction() as conn:
+        changed = [
+            _row_to_dict(row) for row in conn.execute(
+                "UPDATE clipboard_history SET is_favorite = NOT is_favorite WHERE id = ? AND deleted_at IS NULL"
+                " RETURNING id, last_used_at, category, is_favorite",
+                (history_id,),
+            )
+        ]
+
+    _cache.invalidate([history_id], changed)
+
+    return len(changed) > 0
+
+
+def _chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    """リストを一定件数ごとに分割"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _restore_archived(history_ids: list[int]) -> int:
+    """月別アーカイブにある履歴をホットデータベースに戻す（戻した件数を返す）"""
+    conn = get_connection()
+    restored = 0
+
+    for month, ids in _archived_ids_by_month(conn, history_ids).items():
+        for chunk in _chunks(ids):
+            placeholders = ", ".join("?" * len(chunk))
+
+            with _attach_archive(conn, month) as schema:
+                if schema is None:
+                    continue
+                rows = conn.execute(
+                    f"""
+                    SELECT {ARCHIVE_COLUMNS}, content, content_encoding
+                    FROM {schema}.archived_history WHERE id IN ({placeholders})
+                    """,
+                    chunk,
+                ).fetchall()
+
+            with write_transaction() as writer:
+                # 読み込んだ後に削除・戻された履歴は対象外（管理テーブルからの削除でカウンターも戻る）
+                # 派生フィールドと類似した履歴のグループ、テキストのSimHashは管理テーブルにあるものを戻す
+                live = {
+                    row["id"]: tuple(row)[1:] for row in writer.execute(
+                        f"DELETE FROM history_archive_index WHERE id IN ({placeholders}) AND deleted_at IS NULL"
+                        f" RETURNING id, {', '.join(DERIVED_COLUMNS)}, group_id, text_simhash",
+                        chunk,
+                    )
+                }
+                rows = [row for row in rows if row["id"] in live]
+
+                writer.executemany(
+                    f"INSERT INTO clipboard_history ({ARCHIVE_COLUMNS}, {', '.join(DERIVED_COLUMNS)}, group_id, text_simhash)"
+                    f" VALUES ({', '.join('?' * (14 + len(DERIVED_COLUMNS)))})",
+                    [(*tuple(row)[:12], *live[row["id"]]) for row in rows],
+                )
+                writer.executemany(
+                    "INSERT INTO clipboard_payload (history_id, content, content_encoding) VALUES (?, ?, ?)",
+                    [(row["id"], row["content"], row["content_encoding"]) for row in rows if row["content"] is not None],
+                )
+            restored += len(rows)
+
+    return restored
+
+
+def delete_history_many(history_ids: list[int]) -> int:
+    """複数の履歴を削除済みにする（削除件数を返す）
+
+    削除済みの印をつけるだけなので件数によらず速い。一覧からはすぐに消え、
+    一定時間後にpurge_deleted_batchが行と画像ファイルを削除する。
+    """
+    deleted = 0
+    deleted_at = int(time.time() * 1000)
+
+    for chunk in _chunks(list(history_ids)):
+        placeholders = ", ".join("?" * len(chunk))
+
+        with write_transaction() as conn:
+            rows = conn.execute(
+                f"UPDATE clipboard_history SET deleted_at = ? WHERE id IN ({placeholders}) AND deleted_at IS NULL"
+                " RETURNING group_id",
+                [deleted_at, *chunk],
+            ).fetchall()
+            deleted += len(rows)
+            if len(rows) < len(chunk):
+                # アーカイブにある履歴
+                cursor = conn.execute(
+                    f"UPDATE history_archive_index SET deleted_at = ? WHERE id IN ({placeholders}) AND deleted_at IS NULL",
+                    [deleted_at, *chunk],
+                )
+                deleted += cursor.rowcount
+
+        _invalidate_grouped(chunk, rows)
+
+    return deleted
+
+
+def _invalidate_grouped(history_ids: list[int], rows: list[sqlite3.Row], changed_rows: list[dict] = ()) -> None:
+    """変更した履歴のキャッシュを破棄
+
+    類似した履歴のグループに入っている行（rowsのgroup_id）があれば、グループの最新の履歴が
+    入れ替わって一覧に現れる履歴の位置が分からないため、すべて破棄する。
+    """
+    if any(row["group_id"] is not None for row in rows):
+        _cache.clear()
+    else:
+        _cache.invalidate(history_ids, changed_rows)
+
+
+def restore_deleted_history(since: int) -> int:
+    """since（エポックミリ秒）以降に削除した履歴を元に戻す（まだ削除処理されていないもののみ、戻した件数を返す）"""
+    with write_transaction() as conn:
+        rows = [
+            _row_to_dict(row) for row in conn.execute(
+                "UPDATE clipboard_history SET deleted_at = NULL WHERE deleted_at >= ?"
+                " RETURNING id, last_used_at, category, is_favorite, group_id",
+                (since,),
+            )
+        ]
+        archived = conn.execute(
+            "UPDATE history_archive_index SET deleted_at = NULL WHERE deleted_at >= ?", (since,)
+        ).rowcount
+
+    if archived:
+        # アーカイブの行の位置は管理テーブルからは分からない
+        _cache.clear()
+    else:
+        _invalidate_grouped([row["id"] for row in rows], rows, rows)
+
+    return len(rows) + archived
+
+
+def purge_deleted_batch(min_age: float = 60.0, batch_size: int = 500) -> int:
+    """削除してからmin_age秒以上経った履歴を実際に削除（画像ファイルも削除、削除件数を返す）"""
+    cutoff = int((time.time() - min_age) * 1000)
+
+    with write_transaction() as conn:
+        # 部分インデックスで削除済みの行だけを辿る
+        rows = conn.execute(
+            """
+            DELETE FROM clipboard_history WHERE id IN (
+                SELECT id FROM clipboard_history WHERE deleted_at IS NOT NULL AND deleted_at < ? LIMIT ?
+            )
+            RETURNING image_path
+            """,
+            (cutoff, batch_size),
+        ).fetchall()
+
+        # アーカイブにある履歴はアーカイブファイルからの削除待ちに移す
+        archived = conn.execute(
+            """
+            DELETE FROM history_archive_index WHERE id IN (
+                SELECT id FROM history_archive_index WHERE deleted_at IS NOT NULL AND deleted_at < ? LIMIT ?
+            )
+            """,
+            (cutoff, batch_size),
+        ).rowcount
+
+    remove_image_files([row["image_path"] for row in rows if row["image_path"]])
+
+    return len(rows) + archived
+
+
+def set_favorite_many(history_ids: list[int], favorite: bool) -> int:
+    """複数の履歴のお気に入り状態を設定（変更件数を返す）"""
+    changed = 0
+
+    # アーカイブにある履歴（お気に入りではない）はお気に入りにする前にホットデータベースに戻す
+    if favorite:
+        _restore_archived(history_ids)
+
+    for chunk in _chunks(list(history_ids)):
+        placeholders = ", ".join("?" * len(chunk))
+
+        with write_transaction() as conn:
+            rows = [
+                _row_to_dict(row) for row in conn.execute(
+                    f"UPDATE clipboard_history SET is_favorite = ? WHERE id IN ({placeholders}) AND is_favorite != ?"
+                    " AND deleted_at IS NULL RETURNING id, last_used_at, category, is_favorite",
+                    [favorite, *chunk, favorite],
+                )
+            ]
+            changed += len(rows)
+
+        _cache.invalidate([row["id"] for row in rows], rows)
+
+    return changed
+
+
+def delete_history_by_filter(
+    category: Optional[str] = None,
+    search_query: Optional[str] = None,
+    favorites_only: bool = False,
+    include_favorites: bool = False,
+    facets: Optional[dict] = None,
+) -> int:
+    """絞り込み条件に一致する履歴を削除（お気に入りはinclude_favoritesがTrueの場合のみ）"""
+    conn = get_connection()
+
+    query, params = _build_history_query(category, search_query, favorites_only, facets, id_only=True)
+    if not include_favorites:
+        query += " AND h.is_favorite = FALSE"
+
+    history_ids = [row["id"] for row in conn.execute(query, params)]
+
+    # 月別アーカイブにある履歴（お気に入りは含まれない）
+    if not favorites_only:
+        for month in _archive_months(conn):
+            with _attach_archive(conn, month) as schema:
+                if schema is None:
+                    continue
+                query, params = _build_history_query(category, search_query, False, facets, id_only=True, schema=schema)
+                history_ids.extend(row["id"] for row in conn.execute(query, params).fetchall())
+
+    return delete_history_many(history_ids)
+
 
+def clear_all_history() -> int:
+    """全履歴を削除（お気に入り以外、関連する画像ファイルも削除）"""
+    return delete_history_by_filter()
 
-def init_database() -> None:
-    """データベースを初期化"""
+
+def _load_settings() -> dict[str, str]:
+    """設定値のキャッシュを取得（未読み込みならデータベースから読み込む）"""
+    global _settings_cache
+
+    # 読み込み済みならロックを取らない（書き込み中のトランザクションから呼ばれても待たない）
+    cache = _settings_cache
+    if cache is not None:
+        return cache
+
+    # 接続の作成で書き込み用の接続のロックを取る場合があるため、設定のロックより先に開く
     conn = get_connection()
-    cursor = conn.cursor()
+    with _settings_lock:
+        if _settings_cache is None:
+            cache = {key: value for key, value in ENV_SETTING_DEFAULTS.items() if value}
+            cache.update(
+                (row["key"], row["value"])
+                for row in conn.execute("SELECT key, value FROM settings")
+            )
+            _settings_cache = cache
+        return _settings_cache
 
-    # 履歴テーブル
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS clipboard_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            content_type TEXT NOT NULL,
-            content TEXT,
-            image_path TEXT,
-            content_hash TEXT NOT NULL UNIQUE,
-            category TEXT NOT NULL,
-            is_favorite BOOLEAN DEFAULT FALSE,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
 
-    # インデックス作成
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_category ON clipboard_history(category)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON clipboard_history(created_at)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_content_hash ON clipboard_history(content_hash)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_is_favorite ON clipboard_history(is_favorite)")
+def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
+    """設定値を取得（データベースの値を優先し、なければ環境変数の値）"""
+    return _load_settings().get(key, default)
+
+
+def set_setting(key: str, value: str) -> None:
+    """設定値を保存（値が変わった場合はリスナーに通知）
+
+    ロックは書き込み用の接続→設定のキャッシュの順で取る。書き込み中の
+    トランザクション（履歴の追加時のグループ化など）が設定を読むのと同じ順にして、
+    互いに相手のロックを待ち続けないようにする。
+    """
+    with _manager.writer() as conn, _settings_lock:
+        cache = _load_settings()
+        changed = cache.get(key) != value
+
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+        cache[key] = value
+
+    if changed:
+        for listener in list(_setting_listeners):
+            try:
+                listener(key, value)
+            except Exception as e:
+                print(f"設定変更の通知に失敗: {e}")
+
+
+def add_setting_listener(listener: Callable[[str, Optional[str]], None]) -> None:
+    """設定値の変更を通知する関数を登録（listener(key, value)の形で呼ばれる）"""
+    _setting_listeners.append(listener)
+
+
+def remove_setting_listener(listener: Callable[[str, Optional[str]], None]) -> None:
+    """設定値の変更通知を解除"""
+    if listener in _setting_listeners:
+        _setting_listeners.remove(listener)
+
+
+def _counter_source_query(conn: sqlite3.Connection) -> str:
+    """カウンターの集計クエリ（アーカイブした履歴の管理テーブルがあればそれも含める）"""
+    # 削除済みの印がある（マイグレーション8以降の）場合は削除済みの履歴を除く
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(clipboard_history)")]
+    live = " WHERE deleted_at IS NULL" if "deleted_at" in columns else ""
+
+    rows = f"SELECT category, is_favorite, size_bytes FROM clipboard_history{live}"
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_archive_index'").fetchone():
+        rows += f" UNION ALL SELECT category, 0, size_bytes FROM history_archive_index{live}"
+    return COUNTER_SOURCE_QUERY.format(rows=rows)
+
+
+def _rebuild_counters(conn: sqlite3.Connection) -> None:
+    """件数カウンターを実データから作り直す"""
+    conn.execute("DELETE FROM history_counters")
+    conn.execute(f"INSERT INTO history_counters (name, value) {_counter_source_query(conn)}")
+
+
+def rebuild_counters() -> None:
+    """件数カウンターを実データから作り直す（不整合の修復用）"""
+    with write_transaction() as conn:
+        _rebuild_counters(conn)
+
+
+def verify_counters() -> bool:
+    """件数カウンターが実データと一致しているか確認"""
+    conn = get_connection()
+
+    stored = {
+        row["name"]: row["value"]
+        for row in conn.execute("SELECT name, value FROM history_counters WHERE value != 0")
+    }
+    actual = {
+        row["name"]: row["value"]
+        for row in conn.execute(_counter_source_query(conn))
+        if row["value"] != 0
+    }
+
+    return stored == actual
 
-    # 設定テーブル
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT
+
+def _get_counters(conn: sqlite3.Connection, prefix: str = "") -> dict[str, int]:
+    """件数カウンターを取得"""
+    rows = conn.execute(
+        "SELECT name, value FROM history_counters WHERE name >= ? AND name < ?",
+        (prefix, prefix + "\uffff"),
+    ).fetchall()
+
+    return {row["name"][len(prefix):]: row["value"] for row in rows}
+
+
+def get_history_stats() -> dict[str, int]:
+    """全件数・お気に入り件数・合計バイト数を取得"""
+    conn = get_connection()
+    counters = _get_counters(conn)
+
+    return {
+        "total": counters.get("total", 0),
+        "favorites": counters.get("favorites", 0),
+        "bytes": counters.get("bytes", 0),
+    }
+
+
+def get_category_counts() -> dict[str, int]:
+    """カテゴリごとの件数を取得"""
+    conn = get_connection()
+
+    counts = _get_counters(conn, prefix="category:")
+    if _compact_schema:
+        counts = {_category_name(int(code)): count for code, count in counts.items()}
+
+    return {category: count for category, count in counts.items() if count > 0}
+
+
+def get_facet_values(field: str, limit: int = 20, category: Optional[str] = None) -> list[tuple[str, int]]:
+    """派生フィールド（url_host, email_domain, file_ext）の値と件数を多い順に取得（絞り込みの選択肢用）"""
+    if field not in FACET_FIELDS:
+        raise ValueError(f"不明な絞り込み項目です: {field}")
+
+    conn = get_connection()
+    condition = f"{field} IS NOT NULL AND deleted_at IS NULL"
+    params = []
+    if category:
+        condition += " AND category = ?"
+        params.append(_category_param(category))
+
+    # ホットデータベースの行は部分インデックスで値のある行だけを辿る
+    rows = f"SELECT {field} AS value FROM clipboard_history WHERE {condition}"
+    if _compact_schema:
+        rows += f" UNION ALL SELECT {field} FROM history_archive_index WHERE {condition}"
+        params *= 2
+
+    return [
+        (row["value"], row["count"]) for row in conn.execute(
+            f"SELECT value, COUNT(*) AS count FROM ({rows}) GROUP BY value ORDER BY count DESC, value LIMIT ?",
+            (*params, limit),
         )
-    """)
+    ]
 
-    conn.commit()
-    conn.close()
 
+def get_activity_timeline(
+    start: int,
+    end: int,
+    unit: str = "day",
+    utc_offset: Optional[int] = None,
+) -> list[dict]:
+    """start〜end（エポックミリ秒、endは含まない）に作成された履歴の件数を日または時間ごと、カテゴリごとに取得
+
+    トリガーで維持している1時間ごとの集計を読むため、履歴の件数によらず区間の数に比例した時間で返る。
+    日ごとの区切りはローカル時刻（utc_offsetは秒、省略時は現在のタイムゾーン、1時間未満の差は切り捨て）。
+    startとendは区間の境界まで広げる（最初と最後の区間も全体を数える）。
+    {"start": 区間の開始（エポックミリ秒）, "category": カテゴリ名, "count": 件数}のリストを時刻順に返す。
+    """
+    if unit not in ("day", "hour"):
+        raise ValueError(f"不正な集計単位です: {unit}")
+
+    if utc_offset is None:
+        utc_offset = time.localtime().tm_gmtoff
+    offset_hours = int(utc_offset // 3600)
+    hours = 24 if unit == "day" else 1
+
+    first_slot = (start // TIMELINE_BUCKET_MS + offset_hours) // hours
+    end_slot = -(-(-(-end // TIMELINE_BUCKET_MS) + offset_hours) // hours)
 
-def add_history(
-    content_type: str,
-    content_hash: str,
-    category: str,
-    content: Optional[str] = None,
-    image_path: Optional[str] = None,
-) -> Optional[int]:
-    """履歴を追加（重複時はNoneを返す）"""
     conn = get_connection()
-    cursor = conn.cursor()
+    rows = conn.execute(
+        """
+        SELECT (bucket + ?) / ? AS slot, category, SUM(count) AS count
+        FROM history_timeline WHERE bucket >= ? AND bucket < ?
+        GROUP BY slot, category HAVING SUM(count) > 0 ORDER BY slot, category
+        """,
+        (offset_hours, hours, first_slot * hours - offset_hours, end_slot * hours - offset_hours),
+    ).fetchall()
 
-    try:
-        cursor.execute(
+    return [
+        {
+            "start": (row["slot"] * hours - offset_hours) * TIMELINE_BUCKET_MS,
+            "category": _category_name(row["category"]),
+            "count": row["count"],
+        }
+        for row in rows
+    ]
+
+
+def verify_timeline() -> bool:
+    """タイムライン集計が実データと一致しているか確認"""
+    conn = get_connection()
+
+    stored = {
+        (row["bucket"], row["category"]): row["count"]
+        for row in conn.execute("SELECT bucket, category, count FROM history_timeline WHERE count != 0")
+    }
+    actual = {(row["bucket"], row["category"]): row["count"] for row in conn.execute(TIMELINE_SOURCE_QUERY)}
+
+    return stored == actual
+
+
+def rebuild_timeline() -> None:
+    """タイムライン集計を実データから作り直す（不整合の修復用）"""
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM history_timeline")
+        conn.execute(f"INSERT INTO history_timeline (bucket, category, count) {TIMELINE_SOURCE_QUERY}")
+
+
+def get_cache_stats() -> dict[str, int]:
+    """読み取りキャッシュのヒット・ミス数と保持件数を取得"""
+    return _cache.stats()
+
+
+def check_hash_exists(content_hash: str, live_only: bool = False) -> bool:
+    """ハッシュが既に存在するか確認
+
+    live_onlyがTrueの場合は削除済みとアーカイブした履歴を除く（追加すると最終使用日時の更新だけになるか）。
+    """
+    conn = get_connection()
+
+    content_hash = _hash_param(content_hash)
+    query = "SELECT 1 FROM clipboard_history WHERE content_hash = ?"
+    if live_only:
+        query += " AND deleted_at IS NULL"
+    row = conn.execute(query, (content_hash,)).fetchone()
+    if row is None and _compact_schema and not live_only:
+        row = conn.execute("SELECT 1 FROM history_archive_index WHERE content_hash = ?", (content_hash,)).fetchone()
+
+    return row is not None
+
+
+def _iter_export_rows(conn: sqlite3.Connection, source: str, payload: str, chunk_size: int) -> Iterator[dict]:
+    """エクスポート用に履歴を本文付きでID順に読む（sourceはFROM句以降、payloadは本文と圧縮形式のカラム）"""
+    last_id = 0
+
+    while True:
+        rows = conn.execute(
+            f"""
+            SELECT h.id, h.content_type, h.content_hash, h.category, h.is_favorite,
+                   h.created_at, h.last_used_at, h.copy_count, h.image_path,
+                   {payload}
+            FROM {source} AND h.id > ? ORDER BY h.id LIMIT ?
+            """,
+            (last_id, chunk_size),
+        ).fetchall()
+        if not rows:
+            return
+
+        for row in rows:
+            data = _row_to_dict(row)
+            data["created_at"] = timestamp_to_epoch_ms(data["created_at"])
+            data["last_used_at"] = timestamp_to_epoch_ms(data["last_used_at"])
+            yield data
+
+        last_id = rows[-1]["id"]
+
+
+def iter_history_export(chunk_size: int = TRANSFER_CHUNK_SIZE) -> Iterator[dict]:
+    """全履歴を本文付きで取得（エクスポート用、日時はエポックミリ秒）
+
+    ホットデータベースの履歴をID順に返した後、月別アーカイブの履歴を古い月から返す。
+    chunk_size件ずつ読み込むため、履歴の件数によらずメモリ使用量は一定。
+    """
+    conn = get_connection()
+
+    yield from _iter_export_rows(
+        conn,
+        "clipboard_history h LEFT JOIN clipboard_payload p ON p.history_id = h.id WHERE h.deleted_at IS NULL",
+        "p.content, p.content_encoding",
+        chunk_size,
+    )
+
+    for month in reversed(_archive_months(conn)):
+        with _attach_archive(conn, month) as schema:
+            if schema is None:
+                continue
+            yield from _iter_export_rows(
+                conn,
+                f"{schema}.archived_history h"
+                " WHERE EXISTS (SELECT 1 FROM main.history_archive_index x WHERE x.id = h.id AND x.deleted_at IS NULL)",
+                "h.content, h.content_encoding",
+                chunk_size,
+            )
+
+
+def filter_new_hashes(content_hashes: list[str]) -> set[str]:
+    """履歴にまだないハッシュだけを返す"""
+    conn = get_connection()
+    new_hashes = set(content_hashes)
+
+    for chunk in _chunks(list(new_hashes)):
+        placeholders = ", ".join("?" * len(chunk))
+        query = f"SELECT content_hash FROM clipboard_history WHERE content_hash IN ({placeholders})"
+        if _compact_schema:
+            query += f" UNION ALL SELECT content_hash FROM history_archive_index WHERE content_hash IN ({placeholders})"
+        params = [_hash_param(content_hash) for content_hash in chunk]
+        for row in conn.execute(query, params * 2 if _compact_schema else params):
+            content_hash = row["content_hash"]
+            new_hashes.discard(content_hash.hex() if isinstance(content_hash, bytes) else content_hash)
+
+    return new_hashes
+
+
+def import_history_many(entries: list[dict]) -> int:
+    """エクスポートした履歴を1トランザクションで追加（追加した件数を返す）
+
+    各要素はiter_history_exportの形式。同じcontent_hashの履歴が既にある場合や
+    entries内で重複する場合は追加しない。一時テーブルにexecutemanyで書き込んでから
+    まとめて追加するため、件数が多くても1件ずつ追加するより高速。
+    """
+    if not entries:
+        return 0
+
+    now = int(time.time() * 1000)
+    staged = []
+    for entry in entries:
+        content = entry.get("content")
+        image_path = entry.get("image_path")
+        created_at = entry.get("created_at") or now
+        stored, encoding = compress_text(content) if content is not None else (None, ENCODING_PLAIN)
+        staged.append((
+            entry["content_type"],
+            entry["content_hash"],
+            entry["category"],
+            bool(entry.get("is_favorite")),
+            created_at,
+            entry.get("last_used_at") or created_at,
+            entry.get("copy_count") or 1,
+            image_path,
+            make_preview(content),
+            _entry_size(content, image_path),
+            count_lines(content),
+            stored,
+            encoding,
+        ))
+
+    with write_transaction() as conn:
+        conn.execute(IMPORT_STAGING_TABLE)
+        conn.execute("DELETE FROM temp.history_import")
+        conn.executemany(
+            "INSERT OR IGNORE INTO temp.history_import VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(row[0], _hash_param(row[1]), *row[2:]) for row in staged],
+        )
+
+        if _compact_schema:
+            conn.execute(
+                "INSERT OR IGNORE INTO history_categories (name) SELECT DISTINCT category FROM temp.history_import"
+            )
+            category = "(SELECT c.code FROM history_categories c WHERE c.name = s.category)"
+            created_at, last_used_at = "s.created_at", "s.last_used_at"
+            archived = "AND NOT EXISTS (SELECT 1 FROM history_archive_index x WHERE x.content_hash = s.content_hash)"
+        else:
+            category = "s.category"
+            archived = ""
+            created_at = "strftime('%Y-%m-%d %H:%M:%S', s.created_at / 1000.0, 'unixepoch')"
+            last_used_at = "strftime('%Y-%m-%d %H:%M:%f', s.last_used_at / 1000.0, 'unixepoch')"
+
+        # 追加された行はこれより大きいIDになる（AUTOINCREMENTのためIDは再利用されない）
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM clipboard_history").fetchone()[0]
+
+        inserted = conn.execute(
+            f"""
+            INSERT INTO clipboard_history (
+                content_type, content_hash, category, is_favorite, created_at, last_used_at,
+                copy_count, image_path, preview, size_bytes, line_count
+            )
+            SELECT s.content_type, s.content_hash, {category}, s.is_favorite, {created_at}, {last_used_at},
+                   s.copy_count, s.image_path, s.preview, s.size_bytes, s.line_count
+            FROM temp.history_import s
+            WHERE NOT EXISTS (SELECT 1 FROM clipboard_history h WHERE h.content_hash = s.content_hash)
+            {archived}
+            ORDER BY s.rowid
+            """
+        ).rowcount
+
+        conn.execute(
             """
-            INSERT INTO clipboard_history (content_type, content, image_path, content_hash, category)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO clipboard_payload (history_id, content, content_encoding)
+            SELECT h.id, s.content, s.content_encoding
+            FROM clipboard_history h JOIN temp.history_import s ON s.content_hash = h.content_hash
+            WHERE h.id > ? AND s.content IS NOT NULL
             """,
-            (content_type, content, image_path, content_hash, category),
+            (last_id,),
         )
-        conn.commit()
-        return cursor.lastrowid
-    except sqlite3.IntegrityError:
-        # 重複エントリ（content_hashがUNIQUE制約に違反）
-        return None
-    finally:
-        conn.close()
+        conn.execute("DELETE FROM temp.history_import")
 
+    # 任意の位置に追加されるため、ページのキャッシュは位置によらず破棄する
+    if inserted:
+        _cache.clear()
 
-def get_history(
-    limit: int = 100,
-    offset: int = 0,
-    category: Optional[str] = None,
-    search_query: Optional[str] = None,
-    favorites_only: bool = False,
-) -> list[dict]:
-    """履歴を取得"""
+    return inserted
+
+
+def backfill_size_bytes(batch_size: int = 500) -> int:
+    """バイト数が未計算の既存行を少しずつ埋める（処理した件数を返す）"""
     conn = get_connection()
-    cursor = conn.cursor()
 
-    query = "SELECT * FROM clipboard_history WHERE 1=1"
-    params = []
+    rows = conn.execute(
+        """
+        SELECT h.id, t.content, h.image_path
+        FROM clipboard_history h LEFT JOIN clipboard_history_text t ON t.id = h.id
+        WHERE h.size_bytes IS NULL LIMIT ?
+        """,
+        (batch_size,),
+    ).fetchall()
 
-    if category:
-        query += " AND category = ?"
-        params.append(category)
+    if rows:
+        with write_transaction() as conn:
+            conn.executemany(
+                "UPDATE clipboard_history SET size_bytes = ? WHERE id = ?",
+                [(_entry_size(row["content"], row["image_path"]), row["id"]) for row in rows],
+            )
+        _cache.invalidate([row["id"] for row in rows])
 
-    if search_query:
-        query += " AND content LIKE ?"
-        params.append(f"%{search_query}%")
+    return len(rows)
 
-    if favorites_only:
-        query += " AND is_favorite = TRUE"
 
-    query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-    params.extend([limit, offset])
+def backfill_derived_fields(batch_size: int = 500) -> int:
+    """派生フィールドが未設定の既存行（インポートした履歴を含む）を少しずつ埋める（処理した件数を返す）
+
+    ホットデータベースの行を埋めた後、月別アーカイブにある履歴の管理テーブルの行を月ごとに埋める。
+    """
+    # コンパクト形式への移行中に埋めても切り替えで失われる
+    if not _compact_schema:
+        return 0
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    conn = get_connection()
 
-    return [dict(row) for row in rows]
+    rows = conn.execute(
+        """
+        SELECT h.id, h.category, h.image_path, h.last_used_at, h.is_favorite, t.content
+        FROM clipboard_history h LEFT JOIN clipboard_history_text t ON t.id = h.id
+        WHERE h.char_count IS NULL LIMIT ?
+        """,
+        (batch_size,),
+    ).fetchall()
 
+    if rows:
+        rows = [_row_to_dict(row) for row in rows]
+        updates = []
+        for row in rows:
+            derived = extract_derived_fields(row["category"], row["content"], row["image_path"])
+            updates.append((*(derived[column] for column in DERIVED_COLUMNS), row["id"]))
+
+        with write_transaction() as writer:
+            writer.executemany(
+                f"UPDATE clipboard_history SET {', '.join(f'{column} = ?' for column in DERIVED_COLUMNS)} WHERE id = ?",
+                updates,
+            )
+        _cache.invalidate(changed_rows=rows)
+        return len(rows)
+
+    if not _compact_schema:
+        return 0
+
+    row = conn.execute("SELECT month FROM history_archive_index WHERE char_count IS NULL LIMIT 1").fetchone()
+    if row is None:
+        return 0
+    month = row["month"]
+
+    ids = [
+        row["id"] for row in conn.execute(
+            "SELECT id FROM history_archive_index WHERE month = ? AND char_count IS NULL ORDER BY id LIMIT ?",
+            (month, batch_size),
+        )
+    ]
+
+    archived: dict[int, dict] = {}
+    with _attach_archive(conn, month) as schema:
+        if schema is not None:
+            archived = {
+                row["id"]: _row_to_dict(row) for row in conn.execute(
+                    f"""
+                    SELECT id, category, image_path, last_used_at, is_favorite, line_count, content, content_encoding
+                    FROM {schema}.archived_history WHERE id IN ({", ".join("?" * len(ids))})
+                    """,
+                    ids,
+                )
+            }
+
+    updates = []
+    for history_id in ids:
+        row = archived.get(history_id)
+        if row is None:
+            # アーカイブファイルにない行は空の値で埋める（繰り返し調べないようにする）
+            derived, line_count = extract_derived_fields("", None), 0
+        else:
+            derived, line_count = extract_derived_fields(row["category"], row["content"], row["image_path"]), row["line_count"]
+        updates.append((line_count, *(derived[column] for column in DERIVED_COLUMNS), history_id))
+
+    with write_transaction() as writer:
+        writer.executemany(
+            "UPDATE history_archive_index SET line_count = ?,"
+            f" {', '.join(f'{column} = ?' for column in DERIVED_COLUMNS)} WHERE id = ?",
+            updates,
+        )
+    _cache.invalidate(changed_rows=list(archived.values()))
+
+    return len(ids)
+
+
+def backfill_archive_created_at(batch_size: int = 500) -> int:
+    """作成日時が未設定のアーカイブした履歴の管理テーブルの行を月ごとに埋める（処理した件数を返す）
+
+    埋めた行はトリガーでタイムライン集計に加えられる。
+    """
+    if not _compact_schema:
+        return 0
 
-def get_history_by_id(history_id: int) -> Optional[dict]:
-    """IDで履歴を取得"""
     conn = get_connection()
-    cursor = conn.cursor()
+    row = conn.execute("SELECT month FROM history_archive_index WHERE created_at IS NULL LIMIT 1").fetchone()
+    if row is None:
+        return 0
+    month = row["month"]
+
+    ids = [
+        row["id"] for row in conn.execute(
+            "SELECT id FROM history_archive_index WHERE month = ? AND created_at IS NULL ORDER BY id LIMIT ?",
+            (month, batch_size),
+        )
+    ]
+
+    created: dict[int, int] = {}
+    with _attach_archive(conn, month) as schema:
+        if schema is not None:
+            created = {
+                row["id"]: row["created_at"] for row in conn.execute(
+                    f"SELECT id, created_at FROM {schema}.archived_history WHERE id IN ({', '.join('?' * len(ids))})",
+                    ids,
+                )
+            }
 
-    cursor.execute("SELECT * FROM clipboard_history WHERE id = ?", (history_id,))
-    row = cursor.fetchone()
-    conn.close()
+    # アーカイブファイルにない行は月の開始時刻で埋める（繰り返し調べないようにする）
+    month_start = _month_range(month)[0]
+    with write_transaction() as writer:
+        writer.executemany(
+            "UPDATE history_archive_index SET created_at = ? WHERE id = ?",
+            [(created.get(history_id, month_start), history_id) for history_id in ids],
+        )
 
-    return dict(row) if row else None
+    return len(ids)
 
 
-def delete_history(history_id: int) -> bool:
-    """履歴を削除（関連する画像ファイルも削除）"""
+def get_perceptual_hash_backlog(batch_size: int = 20) -> list[tuple[int, str]]:
+    """知覚ハッシュが未設定の既存の画像を最大batch_size件取得（(ID, 画像のパス)のリスト）
+
+    画像の読み込みとハッシュの計算は重いため呼び出し側が別スレッドで行い、
+    結果をstore_perceptual_hashesで書き込む。
+    """
+    if not _compact_schema:
+        return []
+
     conn = get_connection()
-    cursor = conn.cursor()
+    last_id = int(get_setting("perceptual_hash_backfill_id", "0"))
 
-    # 画像パスを取得
-    cursor.execute("SELECT image_path FROM clipboard_history WHERE id = ?", (history_id,))
-    row = cursor.fetchone()
-    image_path = row["image_path"] if row else None
+    rows = conn.execute(
+        """
+        SELECT id, image_path FROM clipboard_history
+        WHERE id > ? AND content_type = 'image' AND image_path IS NOT NULL AND perceptual_hash IS NULL
+        ORDER BY id LIMIT ?
+        """,
+        (last_id, batch_size),
+    ).fetchall()
 
-    # 履歴を削除
-    cursor.execute("DELETE FROM clipboard_history WHERE id = ?", (history_id,))
-    affected = cursor.rowcount
-    conn.commit()
-    conn.close()
+    return [(row["id"], row["image_path"]) for row in rows]
 
-    # 画像ファイルを削除
-    if affected > 0 and image_path:
-        try:
-            path = Path(image_path)
-            if path.exists():
-                path.unlink()
-        except Exception:
-            pass  # ファイル削除に失敗しても処理は続行
 
-    return affected > 0
+def store_perceptual_hashes(hashes: list[tuple[int, Optional[int]]]) -> int:
+    """get_perceptual_hash_backlogで取得した画像の知覚ハッシュを書き込む（書き込んだ件数を返す）
 
+    値がNoneの画像は読み込めなかったもので、書き込まないが処理済みとして記録する。
+    埋めた画像は索引に加えるが、既存の画像どうしをグループにまとめることはしない。
+    """
+    if not hashes or not _compact_schema:
+        return 0
+
+    computed = [(history_id, value) for history_id, value in hashes if value is not None]
+
+    with write_transaction() as writer:
+        writer.executemany(
+            "UPDATE clipboard_history SET perceptual_hash = ? WHERE id = ?",
+            [(to_signed(value), history_id) for history_id, value in computed],
+        )
+        if _image_index is not None:
+            for history_id, value in computed:
+                _image_index.add(history_id, value)
+
+    # 進捗を記録（読み込めなかった画像は再処理しない）
+    set_setting("perceptual_hash_backfill_id", str(max(history_id for history_id, _ in hashes)))
+
+    return len(computed)
+
+
+def backfill_text_simhashes(batch_size: int = 200) -> int:
+    """既存のテキストのSimHashを少しずつ埋める（調べた件数を返す）
+
+    埋めたテキストは索引に加わり、以降に追加した編集版とまとめられるが、
+    既存のテキストどうしをグループにまとめることはしない。
+    """
+    if not _compact_schema:
+        return 0
 
-def toggle_favorite(history_id: int) -> bool:
-    """お気に入り状態をトグル"""
     conn = get_connection()
-    cursor = conn.cursor()
+    last_id = int(get_setting("text_simhash_backfill_id", "0"))
 
-    cursor.execute(
-        "UPDATE clipboard_history SET is_favorite = NOT is_favorite WHERE id = ?",
-        (history_id,),
+    rows = conn.execute(
+        """
+        SELECT h.id, h.category, t.content
+        FROM clipboard_history h JOIN clipboard_history_text t ON t.id = h.id
+        WHERE h.id > ? AND h.content_type = 'text' AND h.text_simhash IS NULL
+        ORDER BY h.id LIMIT ?
+        """,
+        (last_id, batch_size),
+    ).fetchall()
+
+    if not rows:
+        return 0
+
+    rows = [_row_to_dict(row) for row in rows]
+    updates = [
+        (to_signed(value), row["id"]) for row in rows
+        if (value := simhash(row["content"], row["category"])) is not None
+    ]
+
+    with write_transaction() as writer:
+        writer.executemany("UPDATE clipboard_history SET text_simhash = ? WHERE id = ?", updates)
+
+    # 進捗を記録（対象外のテキストは再処理しない）
+    set_setting("text_simhash_backfill_id", str(rows[-1]["id"]))
+
+    return len(rows)
+
+
+def compress_pending_batch(batch_size: int = 100) -> int:
+    """未圧縮の既存行を少しずつ圧縮する（調べた件数を返す）"""
+    conn = get_connection()
+    last_id = int(get_setting("compression_migrated_id", "0"))
+
+    rows = conn.execute(
+        """
+        SELECT history_id AS id, content FROM clipboard_payload
+        WHERE history_id > ? AND content_encoding = ? AND content IS NOT NULL
+        ORDER BY history_id LIMIT ?
+        """,
+        (last_id, ENCODING_PLAIN, batch_size),
+    ).fetchall()
+
+    if not rows:
+        return 0
+
+    updates = []
+    for row in rows:
+        stored, encoding = compress_text(row["content"])
+        if encoding != ENCODING_PLAIN:
+            updates.append((stored, encoding, row["id"]))
+
+    with write_transaction() as conn:
+        conn.executemany(
+            "UPDATE clipboard_payload SET content = ?, content_encoding = ? WHERE history_id = ?",
+            updates,
+        )
+
+    # 進捗を記録（中断しても圧縮済みの行は形式で判別できるため再処理されない）
+    set_setting("compression_migrated_id", str(rows[-1]["id"]))
+
+    return len(rows)
+
+
+def _superseded_first_types() -> tuple[str, ...]:
+    """保持ポリシーで最新でない版を先に削除する履歴の種類（まとめる扱いを設定で選んだもののみ）
+
+    初期設定のまとめでは別の内容をまとめてしまうことがあるため、その古い版を先に削除しない。
+    設定で「そのまま保存」（off）を選んだ場合や不正な値の場合も先に削除しない。
+    """
+    return tuple(
+        content_type
+        for content_type, key in (("image", "image_group_policy"), ("text", "text_group_policy"))
+        if get_setting(key) in ("group", "collapse")
     )
-    affected = cursor.rowcount
-    conn.commit()
-    conn.close()
 
-    return affected > 0
 
+def _evict_candidates(conn: sqlite3.Connection, limit: int, before: Optional[int] = None) -> list[sqlite3.Row]:
+    """削除候補（お気に入り以外を最後に使ったのが古い順）を取得（beforeはエポックミリ秒）
 
-def clear_all_history() -> int:
-    """全履歴を削除（お気に入り以外、関連する画像ファイルも削除）"""
+    類似した履歴の扱いを設定で選んだ種類は、グループで最新でない履歴（古い版）を最初に候補にする。
+    月別アーカイブにある履歴はホットデータベースの履歴より古いため次に候補にする
+    （アーカイブ内の順序は月単位、保持期間は月全体が期限切れの場合のみ対象）。
+    """
+    time_condition = ""
+    time_params: list = []
+    if before is not None:
+        time_condition = " AND last_used_at < ?"
+        time_params.append(_time_param(before))
+
+    rows: list[sqlite3.Row] = []
+    hot_condition = ""
+    hot_params: list = []
+    types = _superseded_first_types()
+    if types:
+        superseded = f"superseded = 1 AND content_type IN ({', '.join('?' * len(types))})"
+        rows = conn.execute(
+            "SELECT id, image_path, size_bytes, 0 AS archived FROM clipboard_history"
+            f" WHERE {superseded} AND is_favorite = FALSE AND deleted_at IS NULL{time_condition}"
+            " ORDER BY last_used_at, id LIMIT ?",
+            [*types, *time_params, limit],
+        ).fetchall()
+        if len(rows) >= limit:
+            return rows
+        hot_condition = f" AND NOT ({superseded})"
+        hot_params = list(types)
+
+    if _compact_schema:
+        query = "SELECT id, NULL AS image_path, size_bytes, 1 AS archived FROM history_archive_index WHERE deleted_at IS NULL"
+        params: list = []
+        if before is not None:
+            query += " AND month < ?"
+            params.append(_month_of(before))
+        query += " ORDER BY month, id LIMIT ?"
+        params.append(limit - len(rows))
+        rows += conn.execute(query, params).fetchall()
+        if len(rows) >= limit:
+            return rows
+
+    return rows + conn.execute(
+        "SELECT id, image_path, size_bytes, 0 AS archived FROM clipboard_history"
+        f" WHERE is_favorite = FALSE AND deleted_at IS NULL{hot_condition}{time_condition}"
+        " ORDER BY last_used_at, id LIMIT ?",
+        [*hot_params, *time_params, limit - len(rows)],
+    ).fetchall()
+
+
+def enforce_retention(
+    max_rows: int = 0,
+    max_bytes: int = 0,
+    max_age_days: int = 0,
+    batch_size: int = 200,
+) -> int:
+    """保持ポリシーを超えた履歴を最大batch_size件だけ削除（お気に入りは対象外）
+
+    各上限は0で無制限。1回の呼び出しで削除する件数を抑え、アイドル時に
+    繰り返し呼び出して少しずつ適用する。削除した件数を返す。
+    """
     conn = get_connection()
-    cursor = conn.cursor()
+    victims: dict[int, sqlite3.Row] = {}
 
-    # 削除対象の画像パスを取得
-    cursor.execute("SELECT image_path FROM clipboard_history WHERE is_favorite = FALSE AND image_path IS NOT NULL")
-    image_paths = [row["image_path"] for row in cursor.fetchall()]
+    # 保持期間
+    if max_age_days > 0:
+        cutoff = int((time.time() - max_age_days * 86400) * 1000)
+        for row in _evict_candidates(conn, batch_size, before=cutoff):
+            victims[row["id"]] = row
 
-    # 履歴を削除
-    cursor.execute("DELETE FROM clipboard_history WHERE is_favorite = FALSE")
-    affected = cursor.rowcount
-    conn.commit()
-    conn.close()
+    # 最大件数
+    if max_rows > 0 and len(victims) < batch_size:
+        total = _get_counters(conn).get("total", 0)
+        excess = total - len(victims) - max_rows
+        if excess > 0:
+            for row in _evict_candidates(conn, len(victims) + min(excess, batch_size)):
+                if len(victims) >= batch_size:
+                    break
+                victims.setdefault(row["id"], row)
 
-    # 画像ファイルを削除
-    for image_path in image_paths:
-        try:
-            path = Path(image_path)
-            if path.exists():
-                path.unlink()
-        except Exception:
-            pass  # ファイル削除に失敗しても処理は続行
+    # 最大容量
+    if max_bytes > 0 and len(victims) < batch_size:
+        total_bytes = _get_counters(conn).get("bytes", 0)
+        excess = total_bytes - sum(row["size_bytes"] or 0 for row in victims.values()) - max_bytes
+        if excess > 0:
+            for row in _evict_candidates(conn, len(victims) + batch_size):
+                if excess <= 0 or len(victims) >= batch_size:
+                    break
+                if row["id"] not in victims:
+                    victims[row["id"]] = row
+                    excess -= row["size_bytes"] or 0
 
-    return affected
+    if not victims:
+        return 0
 
+    hot = [history_id for history_id, row in victims.items() if not row["archived"]]
+    archived = [history_id for history_id, row in victims.items() if row["archived"]]
+
+    with write_transaction() as conn:
+        # 候補を選んだ後にお気に入りにされた履歴は削除しない
+        deleted = conn.execute(
+            f"DELETE FROM clipboard_history WHERE id IN ({', '.join('?' * len(hot))}) AND is_favorite = FALSE"
+            " RETURNING image_path, group_id",
+            hot,
+        ).fetchall()
+
+        # アーカイブにある履歴は管理テーブルから外す（ファイルからはアイドル時に削除）
+        archived_count = conn.execute(
+            f"DELETE FROM history_archive_index WHERE id IN ({', '.join('?' * len(archived))})",
+            archived,
+        ).rowcount if archived else 0
+
+    _invalidate_grouped(list(victims), deleted)
+
+    remove_image_files([row["image_path"] for row in deleted if row["image_path"]])
+
+    return len(deleted) + archived_count
+
+
+def archive_history_batch(hot_days: int, batch_size: int = 500) -> int:
+    """最後に使ってからhot_days日以上経った履歴を月別アーカイブに移す（移した件数を返す）
+
+    お気に入りは移さない。履歴は最終使用日時の月（UTC）ごとのファイルに移し、
+    ホットデータベースにはIDとハッシュだけを管理テーブルに残す。
+    アーカイブへの追加とホットデータベースからの削除は別々のファイルのため、
+    途中で中断した場合は次回に同じ行をもう一度移す（アーカイブ側の重複は無視される）。
+    """
+    if not _compact_schema or hot_days <= 0:
+        return 0
 
-def get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
-    """設定値を取得"""
     conn = get_connection()
-    cursor = conn.cursor()
+    cutoff = int((time.time() - hot_days * 86400) * 1000)
 
-    cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = cursor.fetchone()
-    conn.close()
+    rows = conn.execute(
+        """
+        SELECT id, last_used_at FROM clipboard_history
+        WHERE is_favorite = FALSE AND deleted_at IS NULL AND last_used_at < ?
+        ORDER BY last_used_at LIMIT ?
+        """,
+        (cutoff, batch_size),
+    ).fetchall()
 
-    return row["value"] if row else default
+    by_month: dict[int, list[int]] = {}
+    for row in rows:
+        by_month.setdefault(_month_of(row["last_used_at"]), []).append(row["id"])
 
+    moved = 0
+    for month, ids in by_month.items():
+        placeholders = ", ".join("?" * len(ids))
+
+        with _manager.writer() as writer, _attach_archive(writer, month, create=True) as schema:
+            with writer:
+                # 選んだ後にお気に入りにされた・削除された履歴は移さない
+                ids = [
+                    row["id"] for row in writer.execute(
+                        f"SELECT id FROM clipboard_history WHERE id IN ({placeholders})"
+                        " AND is_favorite = FALSE AND deleted_at IS NULL",
+                        ids,
+                    )
+                ]
+                if not ids:
+                    continue
+                placeholders = ", ".join("?" * len(ids))
+
+                existing = {
+                    row["id"] for row in writer.execute(
+                        f"SELECT id FROM {schema}.archived_history WHERE id IN ({placeholders})", ids
+                    )
+                }
+                writer.execute(
+                    f"""
+                    INSERT OR IGNORE INTO {schema}.archived_history ({ARCHIVE_COLUMNS}, content, content_encoding)
+                    SELECT {", ".join(f"h.{column.strip()}" for column in ARCHIVE_COLUMNS.split(","))},
+                           p.content, COALESCE(p.content_encoding, {ENCODING_PLAIN})
+                    FROM clipboard_history h LEFT JOIN clipboard_payload p ON p.history_id = h.id
+                    WHERE h.id IN ({placeholders})
+                    """,
+                    ids,
+                )
+
+                new_ids = [history_id for history_id in ids if history_id not in existing]
+                if _fts_enabled and new_ids:
+                    writer.execute(
+                        f"""
+                        INSERT INTO {schema}.archived_history_fts (rowid, content)
+                        SELECT id, history_text(content, content_encoding) FROM {schema}.archived_history
+                        WHERE id IN ({", ".join("?" * len(new_ids))}) AND content IS NOT NULL
+                        """,
+                        new_ids,
+                    )
+
+                writer.execute("INSERT OR IGNORE INTO history_archive_months (month) VALUES (?)", (month,))
+                writer.execute(
+                    f"""
+                    INSERT INTO history_archive_index
+                        (id, content_hash, month, category, size_bytes, line_count, created_at, group_id, text_simhash,
+                         {", ".join(DERIVED_COLUMNS)})
+                    SELECT id, content_hash, ?, category, size_bytes, line_count, created_at, group_id, text_simhash,
+                           {", ".join(DERIVED_COLUMNS)}
+                    FROM clipboard_history WHERE id IN ({placeholders})
+                    """,
+                    [month, *ids],
+                )
+                writer.execute(f"DELETE FROM clipboard_history WHERE id IN ({placeholders})", ids)
+
+            moved += len(ids)
+
+    return moved
+
+
+def purge_archives_batch(batch_size: int = 500) -> int:
+    """削除された履歴を月別アーカイブのファイルから取り除く（処理した件数を返す）
+
+    月の履歴がすべて削除された場合はアーカイブファイルごと削除する。
+    """
+    if not _compact_schema:
+        return 0
 
-def set_setting(key: str, value: str) -> None:
-    """設定値を保存"""
     conn = get_connection()
-    cursor = conn.cursor()
+    row = conn.execute("SELECT month FROM history_archive_purge LIMIT 1").fetchone()
+    if row is None:
+        return 0
+    month = row["month"]
 
-    cursor.execute(
-        "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-        (key, value),
-    )
-    conn.commit()
-    conn.close()
+    if conn.execute("SELECT 1 FROM history_archive_index WHERE month = ? LIMIT 1", (month,)).fetchone() is None:
+        return _drop_archive(conn, month)
 
+    purged = [
+        row["id"] for row in conn.execute(
+            "SELECT id FROM history_archive_purge WHERE month = ? LIMIT ?", (month, batch_size)
+        )
+    ]
+    placeholders = ", ".join("?" * len(purged))
 
-def get_category_counts() -> dict[str, int]:
-    """カテゴリごとの件数を取得"""
+    with _manager.writer() as writer, _attach_archive(writer, month, create=True) as schema:
+        with writer:
+            writer.execute(f"DELETE FROM history_archive_purge WHERE id IN ({placeholders})", purged)
+
+            # 削除を待つ間に同じ月へ再びアーカイブされた履歴は残す
+            archived = {
+                row["id"] for row in writer.execute(
+                    f"SELECT id FROM history_archive_index WHERE id IN ({placeholders})", purged
+                )
+            }
+            ids = [history_id for history_id in purged if history_id not in archived]
+            placeholders = ", ".join("?" * len(ids))
+
+            image_paths = [
+                row["image_path"] for row in writer.execute(
+                    f"""
+                    SELECT image_path FROM {schema}.archived_history
+                    WHERE id IN ({placeholders}) AND image_path IS NOT NULL
+                    """,
+                    ids,
+                )
+            ]
+            if _fts_enabled:
+                writer.execute(
+                    f"""
+                    INSERT INTO {schema}.archived_history_fts (archived_history_fts, rowid, content)
+                    SELECT 'delete', id, history_text(content, content_encoding) FROM {schema}.archived_history
+                    WHERE id IN ({placeholders}) AND content IS NOT NULL
+                    """,
+                    ids,
+                )
+            writer.execute(f"DELETE FROM {schema}.archived_history WHERE id IN ({placeholders})", ids)
+
+    # ホットデータベースに戻した履歴は画像をまだ使っている
+    remove_image_files([image_path for image_path in image_paths if not _image_in_use(conn, image_path)])
+
+    return len(purged)
+
+
+def _drop_archive(conn: sqlite3.Connection, month: int) -> int:
+    """履歴が残っていない月別アーカイブをファイルごと削除（取り除いた件数を返す）"""
+    image_paths = []
+    with _attach_archive(conn, month) as schema:
+        if schema is not None:
+            image_paths = [
+                row["image_path"] for row in conn.execute(
+                    f"SELECT image_path FROM {schema}.archived_history WHERE image_path IS NOT NULL"
+                )
+            ]
+
+    with write_transaction() as writer:
+        writer.execute("DELETE FROM history_archive_months WHERE month = ?", (month,))
+        purged = writer.execute("DELETE FROM history_archive_purge WHERE month = ?", (month,)).rowcount
+
+    # ホットデータベースに戻した履歴は画像をまだ使っている
+    remove_image_files([image_path for image_path in image_paths if not _image_in_use(conn, image_path)])
+
+    try:
+        archive_path(month).unlink(missing_ok=True)
+    except OSError as e:
+        print(f"アーカイブファイル削除エラー: {e}")
+
+    return purged
+
+
+def _image_in_use(conn: sqlite3.Connection, image_path: str) -> bool:
+    """画像がホットデータベースの履歴で使われているか"""
+    return conn.execute("SELECT 1 FROM clipboard_history WHERE image_path = ? LIMIT 1", (image_path,)).fetchone() is not None
+
+
+# 統計情報の収集で1つのインデックスあたりに調べる行数の上限（ANALYZEの所要時間を抑える）
+ANALYSIS_LIMIT = 1000
+
+# チェックポイント後にWALファイルを切り詰めるサイズ
+WAL_TRUNCATE_BYTES = 4 * 1024 * 1024
+
+
+def list_tables() -> list[str]:
+    """メンテナンス対象のテーブル名（全文検索の内部テーブルを含み、仮想テーブル自体は除く）"""
     conn = get_connection()
-    cursor = conn.cursor()
+    return [
+        row["name"] for row in conn.execute(
+            """
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'
+            ORDER BY name
+            """
+        )
+    ]
 
-    cursor.execute(
-        "SELECT category, COUNT(*) as count FROM clipboard_history GROUP BY category"
-    )
-    rows = cursor.fetchall()
-    conn.close()
 
-    return {row["category"]: row["count"] for row in rows}
+def analyze_table(table: str) -> None:
+    """テーブルの統計情報を更新（クエリプランナーが使用する）"""
+    with _manager.writer() as conn:
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute(f'ANALYZE "{table}"')
+
+
+def optimize_database() -> None:
+    """PRAGMA optimizeを実行（必要なテーブルだけ統計情報を更新する）"""
+    with _manager.writer() as conn:
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("PRAGMA optimize")
+
+
+def checkpoint_wal(truncate_bytes: int = WAL_TRUNCATE_BYTES) -> int:
+    """WALの内容をデータベースに書き戻す（書き戻したフレーム数を返す）
+
+    読み取り中の接続を待たないPASSIVEで行い、すべて書き戻せてWALファイルが
+    truncate_bytesより大きい場合はファイルを切り詰める。切り詰めは読み取り中の接続が
+    あれば待たずに省略する（次回のチェックポイントで行う）。
+    """
+    with _manager.writer() as conn:
+        busy, log_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+
+        wal_path = Path(f"{DATABASE_PATH}-wal")
+        if not busy and log_frames == checkpointed and wal_path.exists() and wal_path.stat().st_size > truncate_bytes:
+            # TRUNCATEは読み取りの終了をビジータイムアウトまで待つため、待たないようにする
+            conn.execute("PRAGMA busy_timeout = 0")
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            finally:
+                conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
 
+    return max(checkpointed, 0)
 
-def check_hash_exists(content_hash: str) -> bool:
-    """ハッシュが既に存在するか確認"""
+
+def quick_check_table(table: str, time_limit: float) -> Optional[list[str]]:
+    """テーブルとそのインデックスの簡易整合性チェック（問題がなければ["ok"]）
+
+    time_limit秒を超えた場合は中断してNoneを返す。読み取り専用の接続で行うため書き込みは止めない。
+    """
     conn = get_connection()
-    cursor = conn.cursor()
+    deadline = time.monotonic() + time_limit
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    try:
+        return [row[0] for row in conn.execute(f'PRAGMA quick_check("{table}")')]
+    except sqlite3.OperationalError as e:
+        if "interrupt" in str(e):
+            return None
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
 
-    cursor.execute(
-        "SELECT 1 FROM clipboard_history WHERE content_hash = ?",
-        (content_hash,),
-    )
-    exists = cursor.fetchone() is not None
-    conn.close()
 
-    return exists
+def incremental_vacuum_enabled() -> bool:
+    """auto_vacuum=INCREMENTALが有効か（古いデータベースは移行するまで無効）"""
+    # 読み取り専用の接続は他の接続での移行後も古い値を返すため、書き込み用の接続で調べる
+    with _manager.writer() as conn:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def convert_to_incremental_vacuum() -> int:
+    """auto_vacuum=INCREMENTALへ移行（減ったファイルサイズをバイト数で返す）
+
+    移行にはVACUUMでデータベース全体を書き直す必要があり、大きなデータベースでは
+    長時間かかる。設定画面から明示的に実行し、ワーカースレッドで呼び出すこと
+    （実行中は他の書き込みが待たされる）。
+    """
+    with _manager.writer() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return 0
+
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+        return max(0, before - after) * page_size
+
+
+def incremental_vacuum(max_pages: int = 256) -> int:
+    """空きページを最大max_pagesページ解放（解放したページ数を返す、移行前のデータベースは0）"""
+    with _manager.writer() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if before == 0:
+            return 0
+
+        conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return before - after
@@ -0,0 +1,187 @@
+"""データベースのメンテナンスモジュール
+
+統計情報の更新（ANALYZE、PRAGMA optimize）、WALのチェックポイント、整合性チェックを
+アイドル時に少しずつ実行し、作業ごとの所要時間と最終実行日時を設定に記録する。
+整合性チェックは時間がかかるため専用スレッドで実行し、アイドル時には終了を確認するだけにする。
+"""
+import json
+import threading
+import time
+from typing import Any, Callable, Generator, Iterator, Optional
+
+from database import (
+    get_setting, set_setting, list_tables, analyze_table, optimize_database,
+    checkpoint_wal, quick_check_table, close_connection,
+)
+
+
+# 1テーブルの整合性チェックに使う時間の上限（秒、超えたらそのテーブルは次回に回す）
+# 専用スレッドで実行するため画面は止めないが、読み取り中はWALを切り詰められないので上限を設ける
+CHECK_TIME_LIMIT = 0.5
+
+# 時間切れで省略したテーブルの次回の時間の上限（省略するたびに倍にし、この値で止める）
+CHECK_TIME_LIMIT_MAX = 4.0
+
+# 省略した作業がある場合に再実行するまでの間隔（秒）
+SKIPPED_RETRY_INTERVAL = 3600
+
+
+def _checkpoint() -> Iterator[None]:
+    """WALのチェックポイント"""
+    checkpoint_wal()
+    yield
+
+
+def _optimize() -> Iterator[None]:
+    """PRAGMA optimize"""
+    optimize_database()
+    yield
+
+
+def _analyze() -> Iterator[None]:
+    """テーブルごとにANALYZE"""
+    for table in list_tables():
+        analyze_table(table)
+        yield
+
+
+def _run_in_thread(func: Callable[..., Any], *args) -> Generator[None, None, Any]:
+    """funcを専用スレッドで実行し、終わるまでyieldする（funcの戻り値を返し、例外はここで送出）"""
+    outcome: dict[str, Any] = {}
+
+    def run() -> None:
+        try:
+            outcome["value"] = func(*args)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            close_connection()
+
+    thread = threading.Thread(target=run, name="DatabaseMaintenance", daemon=True)
+    thread.start()
+    while thread.is_alive():
+        yield
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+def _integrity_check() -> Generator[None, None, dict]:
+    """テーブルごとに簡易整合性チェック（問題があれば最後に例外を送出）
+
+    チェックは専用スレッドで行い、ここでは終わるまでyieldする。所要時間にはスレッドでの
+    実行時間を記録する。時間切れで省略したテーブルは結果と次回の時間の上限（skipped）を
+    記録し、次回は省略したテーブルから、倍にした時間の上限で調べる。
+    """
+    previous = get_maintenance_status().get("integrity_check", {}).get("skipped", {})
+    tables = list_tables()
+    tables.sort(key=lambda table: table not in previous)
+
+    problems = []
+    skipped = {}
+    started = time.perf_counter()
+
+    for table in tables:
+        time_limit = previous.get(table, CHECK_TIME_LIMIT)
+        result = yield from _run_in_thread(quick_check_table, table, time_limit)
+        if result is None:
+            skipped[table] = min(time_limit * 2, CHECK_TIME_LIMIT_MAX)
+        elif result != ["ok"]:
+            problems.extend(f"{table}: {message}" for message in result)
+        yield
+
+    if problems:
+        raise RuntimeError("; ".join(problems))
+
+    record = {"duration_ms": round((time.perf_counter() - started) * 1000)}
+    if skipped:
+        record.update(result=f"skipped: {', '.join(skipped)}", skipped=skipped)
+    return record
+
+
+# 作業名: (実行間隔（秒）, 1単位ずつyieldするジェネレーター関数)
+# ジェネレーターは記録に加える項目（"result"・"duration_ms"と、省略した作業がある場合の"skipped"）を返せる
+MAINTENANCE_TASKS: dict[str, tuple[float, Callable[[], Iterator[None]]]] = {
+    "checkpoint": (10 * 60, _checkpoint),
+    "optimize": (24 * 3600, _optimize),
+    "analyze": (7 * 24 * 3600, _analyze),
+    "integrity_check": (7 * 24 * 3600, _integrity_check),
+}
+
+
+def _setting_key(name: str) -> str:
+    """作業の記録を保存する設定キー"""
+    return f"maintenance_{name}"
+
+
+def get_maintenance_status() -> dict[str, dict]:
+    """作業ごとの最終実行日時（エポック秒）・所要時間（ミリ秒）・結果（省略した作業があれば"skipped"も）を取得"""
+    status = {}
+    for name in MAINTENANCE_TASKS:
+        try:
+            status[name] = json.loads(get_setting(_setting_key(name), "{}"))
+        except ValueError:
+            status[name] = {}
+    return status
+
+
+class MaintenanceScheduler:
+    """データベースのメンテナンス作業を実行間隔ごとに少しずつ実行するクラス
+
+    run_stepを1回呼ぶごとに作業を1単位（テーブル1つなど）だけ進める。
+    IdleTaskRunnerのタスクとして登録して使う。
+    """
+
+    def __init__(self, tasks: Optional[dict] = None):
+        self._tasks = dict(tasks or MAINTENANCE_TASKS)
+        # 実行中の作業（名前, ジェネレーター, ここまでの所要時間（秒））
+        self._current: Optional[tuple[str, Iterator[None], float]] = None
+
+    def _next_due(self) -> Optional[str]:
+        """実行間隔を過ぎた作業（最後の実行が最も古いもの）"""
+        now = time.time()
+        status = get_maintenance_status()
+
+        due = []
+        for name, (interval, _) in self._tasks.items():
+            record = status.get(name, {})
+            if record.get("skipped"):
+                # 省略した作業がある場合は実行間隔を待たずに再実行する
+                interval = min(interval, SKIPPED_RETRY_INTERVAL)
+            if now - record.get("last_run", 0) >= interval:
+                due.append((record.get("last_run", 0), name))
+        return min(due)[1] if due else None
+
+    def run_step(self) -> bool:
+        """作業を1単位だけ進める（まだ作業が残っていればTrueを返す）"""
+        if self._current is None:
+            name = self._next_due()
+            if name is None:
+                return False
+            self._current = (name, self._tasks[name][1](), 0.0)
+
+        name, slices, elapsed = self._current
+        started = time.perf_counter()
+        try:
+            next(slices)
+        except StopIteration as stop:
+            self._finish(name, elapsed + time.perf_counter() - started, "ok", stop.value)
+        except Exception as e:
+            print(f"メンテナンス「{name}」でエラー: {e}")
+            self._finish(name, elapsed + time.perf_counter() - started, f"error: {e}")
+        else:
+            self._current = (name, slices, elapsed + time.perf_counter() - started)
+            return True
+
+        return self._next_due() is not None
+
+    def _finish(self, name: str, elapsed: float, result: str, extra: Optional[dict] = None) -> None:
+        """作業の完了を記録（extraは作業が返した記録に加える項目で、resultより優先する）"""
+        self._current = None
+        set_setting(_setting_key(name), json.dumps({
+            "last_run": int(time.time()),
+            "duration_ms": round(elapsed * 1000),
+            "result": result,
+            **(extra or {}),
+        }))
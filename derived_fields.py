@@ -0,0 +1,83 @@
+"""派生フィールドの抽出モジュール
+
+カテゴリ分類の結果に応じて、テキストから絞り込み用の値（URLのホスト、
+メールアドレスのドメイン、ファイルの拡張子）と文字数を取り出す。
+"""
+from pathlib import PureWindowsPath
+from typing import Optional
+from urllib.parse import urlsplit, unquote
+
+
+# 絞り込みに使う文字列の派生フィールド
+FACET_FIELDS = ("url_host", "email_domain", "file_ext")
+
+# 拡張子として扱う最大文字数（これより長いものはファイル名の一部とみなす）
+MAX_EXTENSION_LENGTH = 10
+
+
+def url_host(url: str) -> Optional[str]:
+    """URLのホスト名（小文字、先頭の「www.」は除く）"""
+    url = url.strip()
+    if "://" not in url:
+        # ドメイン形式（example.com/path）
+        url = "//" + url
+
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+
+    if host and host.startswith("www."):
+        host = host[4:]
+    return host or None
+
+
+def email_domain(address: str) -> Optional[str]:
+    """メールアドレスのドメイン（小文字）"""
+    domain = address.strip().rpartition("@")[2]
+    return domain.lower() or None
+
+
+def file_ext(path: str) -> Optional[str]:
+    """ファイルの拡張子（小文字、ドットなし）"""
+    path = path.strip()
+    if path.startswith("file:///"):
+        path = unquote(path[8:])
+
+    # Windows形式のパスは「/」と「\」のどちらの区切りも扱える
+    suffix = PureWindowsPath(path).suffix[1:].lower()
+    if not suffix or len(suffix) > MAX_EXTENSION_LENGTH:
+        return None
+    return suffix
+
+
+def normalize_facet_value(name: str, value: str) -> str:
+    """絞り込み値を保存時と同じ形式にそろえる"""
+    value = value.strip().lower()
+    if name == "file_ext":
+        value = value.lstrip(".")
+    elif name == "url_host" and value.startswith("www."):
+        value = value[4:]
+    return value
+
+
+def extract_derived_fields(category: str, content: Optional[str], image_path: Optional[str] = None) -> dict:
+    """カテゴリに応じた派生フィールドを取り出す（該当しないフィールドはNone）"""
+    fields = {
+        "url_host": None,
+        "email_domain": None,
+        "file_ext": None,
+        "char_count": len(content) if content else 0,
+    }
+
+    if category == "url" and content:
+        if content.strip().startswith("file:///"):
+            fields["file_ext"] = file_ext(content)
+        else:
+            fields["url_host"] = url_host(content)
+    elif category == "email" and content:
+        fields["email_domain"] = email_domain(content)
+    elif category in ("filepath", "image") and (content or image_path):
+        fields["file_ext"] = file_ext(content or image_path)
+
+    return fields
@@ -0,0 +1,91 @@
+"""画像ファイル削除モジュール（バックグラウンド処理）"""
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from database import set_image_remover
+
+
+# 進捗を通知する最小間隔（秒）
+PROGRESS_INTERVAL = 0.1
+
+
+class FileCleanupWorker(QObject):
+    """専用スレッドで画像ファイルを削除するクラス"""
+
+    # 進捗シグナル（削除済み件数, 削除要求の合計件数）。キューが空になると done == total で通知される
+    progress = pyqtSignal(int, int)
+
+    _STOP = object()
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._total = 0
+        self._done = 0
+
+    def start(self) -> None:
+        """削除スレッドを開始し、データベース層の削除処理として登録"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._thread = threading.Thread(target=self._run, name="FileCleanupWorker", daemon=True)
+        self._thread.start()
+        set_image_remover(self.enqueue)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """残りのファイルを削除してからスレッドを停止"""
+        if self._thread is None:
+            return
+
+        set_image_remover(None)
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def enqueue(self, image_paths: list[str]) -> None:
+        """ファイルの削除を要求"""
+        if not image_paths:
+            return
+
+        with self._lock:
+            self._total += len(image_paths)
+        self._queue.put(list(image_paths))
+
+    def _run(self) -> None:
+        """削除スレッドのメインループ"""
+        last_report = 0.0
+
+        while True:
+            paths = self._queue.get()
+            if paths is self._STOP:
+                break
+
+            for image_path in paths:
+                try:
+                    Path(image_path).unlink(missing_ok=True)
+                except Exception:
+                    pass  # ファイル削除に失敗しても処理は続行
+
+                with self._lock:
+                    self._done += 1
+                    done, total = self._done, self._total
+
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    self.progress.emit(done, total)
+                    last_report = now
+
+            if self._queue.empty():
+                # 一連の削除が完了したら完了を通知してカウンターをリセット
+                with self._lock:
+                    done, total = self._done, self._total
+                    if done == total:
+                        self._done = self._total = 0
+                self.progress.emit(done, total)
@@ -0,0 +1,107 @@
+"""ハミング距離による近傍検索モジュール
+
+64ビットのハッシュを16ビットずつ4つに分け、それぞれを索引にする（マルチインデックスハッシュ）。
+距離t以内のハッシュは、鳩の巣原理により少なくとも1つの区間で距離t//4以内になるため、
+各区間でその範囲の値だけを引き、候補の全体の距離を確かめれば取りこぼしなく探せる。
+データベースに索引を持つ場合は、区間の番号と値を1つの整数にしたキー（band_keys）で引く。
+"""
+from functools import lru_cache
+
+
+HASH_BITS = 64
+CHUNK_COUNT = 4
+CHUNK_BITS = HASH_BITS // CHUNK_COUNT
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュのハミング距離"""
+    return (a ^ b).bit_count()
+
+
+def to_signed(value: int) -> int:
+    """64ビットの符号なし整数をSQLiteのINTEGERに保存できる符号付き整数に変換"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed(value: int) -> int:
+    """SQLiteのINTEGERから読んだ値を64ビットの符号なし整数に戻す"""
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def split_chunks(value: int) -> list[int]:
+    """ハッシュを16ビットずつの区間に分割（下位から）"""
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNK_COUNT)]
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(radius: int) -> tuple[int, ...]:
+    """区間の値に排他的論理和をとると距離radius以内の値になるマスクの一覧"""
+    return tuple(mask for mask in range(1 << CHUNK_BITS) if mask.bit_count() <= radius)
+
+
+def band_keys(value: int, max_distance: int) -> list[int]:
+    """距離max_distance以内のハッシュと少なくとも1つの区間で一致するキー（区間の番号を上位に持つ整数）"""
+    if max_distance < 0:
+        raise ValueError(f"距離は0以上で指定してください: {max_distance}")
+
+    masks = _flip_masks(max_distance // CHUNK_COUNT)
+    return [
+        (band << CHUNK_BITS) | (chunk ^ mask)
+        for band, chunk in enumerate(split_chunks(value)) for mask in masks
+    ]
+
+
+class MultiIndexHash:
+    """ハッシュをIDで保持し、ハミング距離の近いものを探す索引"""
+
+    def __init__(self):
+        self._hashes: dict[int, int] = {}
+        self._tables: list[dict[int, set[int]]] = [{} for _ in range(CHUNK_COUNT)]
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._hashes
+
+    def add(self, item_id: int, value: int) -> None:
+        """ハッシュを追加（同じIDがあれば置き換える）"""
+        self.remove(item_id)
+        self._hashes[item_id] = value
+        for table, chunk in zip(self._tables, split_chunks(value)):
+            table.setdefault(chunk, set()).add(item_id)
+
+    def remove(self, item_id: int) -> None:
+        """ハッシュを削除"""
+        value = self._hashes.pop(item_id, None)
+        if value is None:
+            return
+        for table, chunk in zip(self._tables, split_chunks(value)):
+            ids = table.get(chunk)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del table[chunk]
+
+    def query(self, value: int, max_distance: int) -> list[tuple[int, int]]:
+        """距離max_distance以内のハッシュを(ID, 距離)の近い順で返す"""
+        if max_distance < 0:
+            raise ValueError(f"距離は0以上で指定してください: {max_distance}")
+
+        masks = _flip_masks(max_distance // CHUNK_COUNT)
+        candidates: set[int] = set()
+        for table, chunk in zip(self._tables, split_chunks(value)):
+            get = table.get
+            for mask in masks:
+                ids = get(chunk ^ mask)
+                if ids:
+                    candidates |= ids
+
+        hashes = self._hashes
+        matches = [
+            (item_id, distance) for item_id in candidates
+            if (distance := (value ^ hashes[item_id]).bit_count()) <= max_distance
+        ]
+        matches.sort(key=lambda match: (match[1], -match[0]))
+        return matches
@@ -0,0 +1,194 @@
+"""履歴の読み取りキャッシュモジュール
+
+デコード済みの履歴（ID単位）と一覧のページ（絞り込み条件と位置単位）を
+件数上限つきのLRUで保持する。書き込み時はdatabase.pyが変更内容を通知し、
+影響するエントリだけを破棄する。
+"""
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+# 保持する履歴の件数（本文を含む）
+ROW_CACHE_SIZE = 512
+
+# この長さを超える本文の履歴は保持しない
+ROW_CACHE_MAX_CONTENT = 256 * 1024
+
+# 保持するページ数
+PAGE_CACHE_SIZE = 64
+
+
+class LRUCache:
+    """件数上限つきのLRUキャッシュ（ヒット・ミス数を記録する）"""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        """値を取得（なければNone）"""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value) -> None:
+        """値を保存（上限を超えたら最も古く使われたものを破棄）"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """値を破棄"""
+        self._entries.pop(key, None)
+
+    def items(self) -> list:
+        """保持している(キー, 値)の一覧"""
+        return list(self._entries.items())
+
+    def clear(self) -> None:
+        """すべて破棄"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CachedPage:
+    """キャッシュした一覧のページ
+
+    upperより古く、lower以上の(last_used_at, id)の範囲の行を含む
+    （upperがNoneなら先頭から、lowerがNoneなら末尾まで）。
+    """
+
+    def __init__(self, result, rows: list[dict], filters: dict, upper: Optional[tuple], full: bool):
+        self.result = result
+        self.filters = filters
+        self.upper = upper
+        self.lower = _row_key(rows[-1]) if full and rows else None
+        self.ids = {row["id"] for row in rows}
+
+    def covers(self, row: dict) -> bool:
+        """変更された行がこのページに入りうるか"""
+        category = self.filters.get("category")
+        if category and row["category"] != category:
+            return False
+        if self.filters.get("favorites_only") and not row["is_favorite"]:
+            return False
+        # 検索語・派生フィールドとの一致は変更後の行からは分からないため、一致するものとして扱う
+
+        key = _row_key(row)
+        if self.upper is not None and not key < self.upper:
+            return False
+        return self.lower is None or not key < self.lower
+
+
+def _row_key(row: dict) -> tuple:
+    """並び順のキー"""
+    return row["last_used_at"], row["id"]
+
+
+class HistoryCache:
+    """履歴とページのキャッシュ
+
+    読み取りは別スレッドで行われるため、読み込み中に書き込みがあった結果は保存しない
+    （読み込み開始時の世代番号をputに渡し、破棄が起きていれば保存しない）。
+    """
+
+    def __init__(self, row_size: int = ROW_CACHE_SIZE, page_size: int = PAGE_CACHE_SIZE):
+        self._rows = LRUCache(row_size)
+        self._pages = LRUCache(page_size)
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """破棄のたびに増える世代番号"""
+        return self._generation
+
+    def get_row(self, history_id: int) -> Optional[dict]:
+        """履歴を取得（呼び出し側で変更しても影響しないようコピーを返す）"""
+        with self._lock:
+            row = self._rows.get(history_id)
+        return dict(row) if row is not None else None
+
+    def put_row(self, row: dict, generation: int) -> None:
+        """履歴を保存"""
+        content = row.get("content")
+        if content is not None and len(content) > ROW_CACHE_MAX_CONTENT:
+            return
+        with self._lock:
+            if generation == self._generation:
+                self._rows.put(row["id"], dict(row))
+
+    def get_page(self, key: Hashable):
+        """ページの結果を取得"""
+        with self._lock:
+            page = self._pages.get(key)
+        return _copy_result(page.result) if page is not None else None
+
+    def put_page(
+        self,
+        key: Hashable,
+        result,
+        rows: list[dict],
+        filters: dict,
+        generation: int,
+        upper: Optional[tuple] = None,
+        full: bool = False,
+    ) -> None:
+        """ページの結果を保存（rowsは結果に含まれる行、fullは次のページがあるか）"""
+        page = CachedPage(_copy_result(result), rows, filters, upper, full)
+        with self._lock:
+            if generation == self._generation:
+                self._pages.put(key, page)
+
+    def invalidate(self, removed_ids=(), changed_rows: list[dict] = ()) -> None:
+        """書き込みで影響を受けるエントリを破棄
+
+        removed_idsは一覧での位置・内容が変わった（または削除された）行のID、
+        changed_rowsは変更後の行（last_used_at, id, category, is_favorite）で、
+        その位置に現れうるページを破棄する。
+        """
+        removed = set(removed_ids)
+        with self._lock:
+            self._generation += 1
+            for history_id in removed:
+                self._rows.pop(history_id)
+            for key, page in self._pages.items():
+                if not removed.isdisjoint(page.ids) or any(page.covers(row) for row in changed_rows):
+                    self._pages.pop(key)
+
+    def clear(self) -> None:
+        """すべて破棄（一括インポートやスキーマの移行時）"""
+        with self._lock:
+            self._generation += 1
+            self._rows.clear()
+            self._pages.clear()
+
+    def stats(self) -> dict[str, int]:
+        """ヒット・ミス数と保持件数"""
+        with self._lock:
+            return {
+                "row_hits": self._rows.hits,
+                "row_misses": self._rows.misses,
+                "rows": len(self._rows),
+                "page_hits": self._pages.hits,
+                "page_misses": self._pages.misses,
+                "pages": len(self._pages),
+            }
+
+
+def _copy_result(result):
+    """ページの結果をコピー（行の辞書も複製する）"""
+    if isinstance(result, tuple):
+        rows, cursor = result
+        return [dict(row) for row in rows], cursor
+    return [dict(row) for row in result]
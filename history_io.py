@@ -0,0 +1,170 @@
+"""履歴のエクスポート・インポートモジュール
+
+履歴は1行1件のNDJSON形式で書き出す。1行目はヘッダー（形式・バージョン・件数）。
+アプリが保存した画像は、エクスポートファイルと同じ場所の「<ファイル名>_images」
+フォルダに内容のSHA-256をファイル名としてコピーする（同じ画像は1つにまとまる）。
+"""
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Callable, Optional
+
+from config import IMAGES_DIR
+from database import (
+    TRANSFER_CHUNK_SIZE, iter_history_export, filter_new_hashes, import_history_many,
+    get_history_stats, is_managed_image,
+)
+
+
+EXPORT_FORMAT = "clipboard-history"
+EXPORT_VERSION = 1
+
+# エクスポートするフィールド（画像はimageにサイドカーのファイル名を記録する）
+EXPORT_FIELDS = (
+    "content_type", "content_hash", "category", "is_favorite",
+    "created_at", "last_used_at", "copy_count", "content", "image_path",
+)
+
+# 進捗通知のコールバック（処理済み件数, 全件数）
+ProgressCallback = Callable[[int, int], None]
+
+
+def sidecar_dir(path: Path) -> Path:
+    """エクスポートファイルに対応する画像フォルダ"""
+    path = Path(path)
+    return path.with_name(f"{path.stem}_images")
+
+
+def _file_digest(path: Path) -> str:
+    """ファイル内容のSHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _export_image(image_path: str, images_dir: Path) -> Optional[str]:
+    """画像をサイドカーフォルダにコピーしてファイル名を返す（ファイルがない場合はNone）"""
+    source = Path(image_path)
+    if not source.exists():
+        return None
+
+    name = f"{_file_digest(source)}{source.suffix.lower()}"
+    target = images_dir / name
+    if not target.exists():
+        shutil.copyfile(source, target)
+    return name
+
+
+def export_history(path: Path, progress: Optional[ProgressCallback] = None) -> int:
+    """全履歴をNDJSONファイルにエクスポート（書き出した件数を返す）"""
+    path = Path(path)
+    images_dir = sidecar_dir(path)
+    total = get_history_stats()["total"]
+    count = 0
+
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        header = {"format": EXPORT_FORMAT, "version": EXPORT_VERSION, "count": total}
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+        for entry in iter_history_export():
+            record = {key: entry.get(key) for key in EXPORT_FIELDS}
+            record["is_favorite"] = bool(record["is_favorite"])
+
+            # アプリが保存した画像はサイドカーに含める（ユーザーのファイルはパスのみ記録）
+            image_path = record["image_path"]
+            if image_path and is_managed_image(image_path):
+                images_dir.mkdir(exist_ok=True)
+                image = _export_image(image_path, images_dir)
+                if image:
+                    record["image"] = image
+                    record["image_path"] = None
+
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+
+            if progress and count % TRANSFER_CHUNK_SIZE == 0:
+                progress(count, max(total, count))
+
+    if progress:
+        progress(count, count)
+
+    return count
+
+
+def _read_header(line: str) -> dict:
+    """ヘッダー行を検証"""
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+
+    if not isinstance(header, dict) or header.get("format") != EXPORT_FORMAT:
+        raise ValueError("エクスポートファイルの形式が正しくありません")
+    if header.get("version", 0) > EXPORT_VERSION:
+        raise ValueError(f"新しいバージョンのエクスポートファイルです: {header.get('version')}")
+    return header
+
+
+def _import_chunk(records: list[dict], images_dir: Path) -> int:
+    """1チャンク分の履歴をインポート（既存の履歴と重複するものは画像もコピーしない）"""
+    new_hashes = filter_new_hashes([record["content_hash"] for record in records])
+
+    entries = []
+    for record in records:
+        if record["content_hash"] not in new_hashes:
+            continue
+
+        image = record.get("image")
+        if image:
+            source = images_dir / Path(image).name
+            if not source.exists():
+                print(f"画像が見つからないためスキップ: {source}")
+                continue
+            target = IMAGES_DIR / source.name
+            if not target.exists():
+                shutil.copyfile(source, target)
+            record["image_path"] = str(target)
+
+        entries.append(record)
+
+    return import_history_many(entries)
+
+
+def import_history(path: Path, progress: Optional[ProgressCallback] = None) -> int:
+    """エクスポートファイルから履歴をインポート（追加した件数を返す）
+
+    content_hashが既存の履歴と一致するものは追加しない。
+    """
+    path = Path(path)
+    images_dir = sidecar_dir(path)
+    imported = 0
+    done = 0
+
+    with open(path, "r", encoding="utf-8") as f:
+        header = _read_header(f.readline())
+        total = header.get("count") or 0
+
+        records = []
+        for line in f:
+            if not line.strip():
+                continue
+            records.append(json.loads(line))
+
+            if len(records) >= TRANSFER_CHUNK_SIZE:
+                imported += _import_chunk(records, images_dir)
+                done += len(records)
+                records = []
+                if progress:
+                    progress(done, max(total, done))
+
+        if records:
+            imported += _import_chunk(records, images_dir)
+            done += len(records)
+
+    if progress:
+        progress(done, done)
+
+    return imported
@@ -0,0 +1,138 @@
+"""画像のハッシュ計算と保存モジュール
+
+画像の重複判定はPNGにエンコードせず、ピクセルデータ（形式・サイズと各行の画素）を
+そのままハッシュ計算する。保存時はPNGへのエンコードを1回だけ行い、そのバイト列を書き込む。
+見た目がほぼ同じ画像の判定には、縮小したグレースケール画像の知覚ハッシュ（dHash）を使う。
+"""
+import hashlib
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from PyQt6.QtCore import Qt, QBuffer, QIODevice
+from PyQt6.QtGui import QImage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from config import IMAGES_DIR
+
+
+# 知覚ハッシュの縮小サイズ（横に隣り合う画素を比べるため幅は1つ多い、8x8=64ビット）
+DHASH_WIDTH = 9
+DHASH_HEIGHT = 8
+
+# この倍率の大きさに縮小してから区画ごとに合計する（細かい模様の影響を抑える）
+DHASH_SAMPLE_SCALE = 8
+
+
+def image_hash(image: QImage) -> str:
+    """ピクセルデータのSHA-256（形式・幅・高さを含め、行末の詰め物は含めない）"""
+    hasher = hashlib.sha256(
+        f"{image.format().value}:{image.width()}x{image.height()}:".encode("ascii")
+    )
+    if image.isNull():
+        return hasher.hexdigest()
+
+    row_bytes = (image.width() * image.depth() + 7) // 8
+    bytes_per_line = image.bytesPerLine()
+
+    # constBitsはコピーせずに画素のメモリを参照する
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    view = memoryview(bits)
+
+    if row_bytes == bytes_per_line:
+        hasher.update(view)
+    else:
+        # 行末の詰め物は未初期化のことがあるため、各行の画素部分だけを読む
+        for y in range(image.height()):
+            start = y * bytes_per_line
+            hasher.update(view[start:start + row_bytes])
+
+    return hasher.hexdigest()
+
+
+def encode_png(image: QImage) -> bytes:
+    """PNGにエンコードしたバイト列"""
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    data = buffer.data().data()
+    buffer.close()
+    return data
+
+
+def new_image_path() -> Path:
+    """新しい画像ファイルのパス（日時と乱数による名前）"""
+    filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.png"
+    return IMAGES_DIR / filename
+
+
+def legacy_image_hash(png_data: bytes) -> str:
+    """以前の形式の画像のハッシュ（PNGにエンコードしたバイト列のSHA-256、既存の履歴の照合用）"""
+    return hashlib.sha256(png_data).hexdigest()
+
+
+def save_png(png_data: bytes) -> Path:
+    """エンコード済みのPNGを新しいファイルに書き込み、そのパスを返す"""
+    image_path = new_image_path()
+    image_path.write_bytes(png_data)
+    return image_path
+
+
+def _grayscale_grid(image: QImage, scale: int) -> QImage:
+    """グレースケールに変換し、知覚ハッシュの縮小サイズのscale倍に縮小した画像"""
+    return image.scaled(
+        DHASH_WIDTH * scale, DHASH_HEIGHT * scale,
+        Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation,
+    ).convertToFormat(QImage.Format.Format_Grayscale8)
+
+
+def _block_sums(data: bytes, stride: int) -> list[list[int]]:
+    """DHASH_SAMPLE_SCALE倍に縮小したグレースケール画像のブロックごとの画素値の合計（NumPyなしの計算）"""
+    scale = DHASH_SAMPLE_SCALE
+    grid = [[0] * DHASH_WIDTH for _ in range(DHASH_HEIGHT)]
+    for y in range(DHASH_HEIGHT * scale):
+        line = data[y * stride:y * stride + DHASH_WIDTH * scale]
+        row = grid[y // scale]
+        for x in range(DHASH_WIDTH):
+            row[x] += sum(line[x * scale:(x + 1) * scale])
+    return grid
+
+
+def perceptual_hash(image: QImage) -> Optional[int]:
+    """知覚ハッシュ（dHash、64ビットの符号なし整数、画像が空ならNone）
+
+    9x8のブロックに分けた画像の各行で、右隣のブロックより明るい場合に1とする。
+    NumPyの有無で同じ値になるよう、どちらもブロックごとの画素値の合計で比べる。
+    """
+    if image.isNull():
+        return None
+
+    sample = _grayscale_grid(image, DHASH_SAMPLE_SCALE)
+    bits = sample.constBits()
+    bits.setsize(sample.sizeInBytes())
+
+    if numpy is None:
+        value = 0
+        for row in _block_sums(bytes(bits), sample.bytesPerLine()):
+            for x in range(DHASH_WIDTH - 1):
+                value = (value << 1) | (row[x] > row[x + 1])
+        return value
+
+    pixels = numpy.frombuffer(bits, dtype=numpy.uint8).reshape(sample.height(), sample.bytesPerLine())
+    pixels = pixels[:, :sample.width()].astype(numpy.uint32)
+
+    grid = pixels.reshape(DHASH_HEIGHT, DHASH_SAMPLE_SCALE, DHASH_WIDTH, DHASH_SAMPLE_SCALE).sum(axis=(1, 3))
+    diff = grid[:, :-1] > grid[:, 1:]
+    return int.from_bytes(numpy.packbits(diff).tobytes(), "big")
+
+
+def perceptual_hash_file(image_path: str) -> Optional[int]:
+    """画像ファイルの知覚ハッシュ（読み込めなければNone）"""
+    image = QImage(image_path)
+    return perceptual_hash(image)
@@ -7,14 +7,23 @@ import sys
 from pathlib import Path
 
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 
 # アプリケーションディレクトリをパスに追加
 sys.path.insert(0, str(Path(__file__).parent))
 
 from config import APP_NAME
-from database import init_database, get_setting
+from database import (
+    init_database, get_setting, close_database, compress_pending_batch, migrate_compact_schema_batch,
+    backfill_derived_fields, backfill_archive_created_at, backfill_text_simhashes,
+)
 from clipboard_monitor import ClipboardMonitor
+from capture_pipeline import PerceptualHashBackfill
+from settings_notifier import SettingsNotifier
+from maintenance import IdleTaskRunner
+from db_maintenance import MaintenanceScheduler
+from retention import run_retention_step, run_archive_step, run_purge_step
+from file_cleanup import FileCleanupWorker
 from ui.styles import get_stylesheet, is_dark_mode
 from ui.tray_icon import TrayIcon
 from ui.main_window import MainWindow
@@ -44,9 +53,16 @@ class Application:
 
     def _init_components(self) -> None:
         """コンポーネントを初期化"""
+        # 設定変更の通知
+        self.settings_notifier = SettingsNotifier()
+
+        # 画像ファイルの削除（バックグラウンド）
+        self.file_cleanup = FileCleanupWorker()
+
         # クリップボード監視
         self.monitor = ClipboardMonitor()
         self._update_ai_settings()
+        self._update_storage_settings()
 
         # メインウィンドウ
         self.main_window = MainWindow()
@@ -57,6 +73,27 @@ class Application:
         # システムトレイ
         self.tray_icon = TrayIcon()
 
+        # アイドル時タスク
+        self.idle_runner = IdleTaskRunner()
+        self.idle_runner.register("purge_deleted", run_purge_step)
+        self.idle_runner.register("retention", run_retention_step)
+        self.idle_runner.register("archive", run_archive_step)
+        self.idle_runner.register("compression", lambda: compress_pending_batch() > 0)
+        self.idle_runner.register("compact_schema", lambda: migrate_compact_schema_batch() > 0)
+        self.idle_runner.register("derived_fields", lambda: backfill_derived_fields() > 0)
+        self.idle_runner.register("timeline", lambda: backfill_archive_created_at() > 0)
+        # 画像の読み込みとハッシュの計算は別スレッドで行い、書き込みだけをアイドル時に行う
+        self.perceptual_hashes = PerceptualHashBackfill()
+        self.idle_runner.register("perceptual_hash", self.perceptual_hashes.run_step)
+        self.idle_runner.register("text_simhash", lambda: backfill_text_simhashes() > 0)
+        self.db_maintenance = MaintenanceScheduler()
+        self.idle_runner.register("db_maintenance", self.db_maintenance.run_step)
+
+        # 履歴追加が連続した場合に一覧の再描画をまとめるタイマー
+        self._refresh_timer = QTimer()
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.timeout.connect(self._refresh_main_window)
+
     def _connect_signals(self) -> None:
         """シグナルを接続"""
         # トレイアイコン
@@ -68,11 +105,21 @@ class Application:
         self.main_window.copy_requested.connect(self._on_copy_requested)
         self.main_window.settings_requested.connect(self._show_settings)
 
+        # 画像ファイル削除の進捗
+        self.file_cleanup.progress.connect(self.main_window.set_cleanup_progress)
+
+        # 設定ダイアログからのインポート
+        self.settings_dialog.history_imported.connect(self._on_history_added)
+
         # クリップボード監視
         self.monitor.history_added.connect(self._on_history_added)
+        self.monitor.history_added.connect(self.idle_runner.notify_activity)
+
+        # アプリ内の操作もアイドル判定に含める
+        self.idle_runner.watch(self.app)
 
-        # 設定ダイアログ
-        self.settings_dialog.settings_changed.connect(self._on_settings_changed)
+        # 設定変更（設定ダイアログ以外からの変更も含む）
+        self.settings_notifier.setting_changed.connect(self._on_setting_changed)
 
     def _apply_theme(self) -> None:
         """テーマを適用"""
@@ -92,8 +139,13 @@ class Application:
         provider = get_setting("ai_provider", "none")
         self.monitor.set_use_ai(provider != "none")
 
+    def _update_storage_settings(self) -> None:
+        """データ保存設定を更新"""
+        self.monitor.set_durability(get_setting("write_durability", "normal"))
+
     def _show_main_window(self) -> None:
         """メインウィンドウを表示"""
+        self.idle_runner.notify_activity()
         self.main_window.show()
         self.main_window.raise_()
         self.main_window.activateWindow()
@@ -108,26 +160,47 @@ class Application:
 
     def _on_history_added(self, history_id: int) -> None:
         """履歴追加時"""
+        # 連続して追加された場合も再描画は1回にまとめる
+        if not self._refresh_timer.isActive():
+            self._refresh_timer.start(100)
+
+    def _refresh_main_window(self) -> None:
+        """メインウィンドウの一覧を更新"""
         # メインウィンドウが表示されている場合は更新
         if self.main_window.isVisible():
             self.main_window.refresh_history()
 
-    def _on_settings_changed(self) -> None:
+    def _on_setting_changed(self, key: str, value: object) -> None:
         """設定変更時"""
-        self._apply_theme()
-        self._update_ai_settings()
+        if key == "theme":
+            self._apply_theme()
+        elif key == "ai_provider":
+            self._update_ai_settings()
+        elif key == "write_durability":
+            self._update_storage_settings()
 
     def _quit(self) -> None:
         """アプリケーションを終了"""
         self.monitor.stop()
+        self.idle_runner.stop()
+        self.perceptual_hashes.stop()
+        self.file_cleanup.stop()
+        self.settings_notifier.close()
         self.tray_icon.hide()
+        close_database()
         self.app.quit()
 
     def run(self) -> int:
         """アプリケーションを実行"""
+        # 画像ファイル削除スレッド開始
+        self.file_cleanup.start()
+
         # クリップボード監視開始
         self.monitor.start()
 
+        # アイドル時タスク開始
+        self.idle_runner.start()
+
         # トレイアイコン表示
         self.tray_icon.show()
         self.tray_icon.show_message(
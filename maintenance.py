@@ -0,0 +1,101 @@
+"""アイドル時タスク実行モジュール"""
+import time
+from typing import Callable, Optional
+
+from PyQt6.QtCore import QObject, QTimer, QEvent
+
+
+# 最後の操作からアイドルとみなすまでの時間（秒）
+IDLE_THRESHOLD = 5.0
+
+# アイドル判定と作業のある間のチェック間隔（ミリ秒）
+ACTIVE_INTERVAL = 1000
+
+# すべてのタスクに作業がないときのチェック間隔（ミリ秒）
+IDLE_INTERVAL = 60000
+
+
+# ユーザー操作とみなすイベント
+ACTIVITY_EVENTS = (
+    QEvent.Type.KeyPress,
+    QEvent.Type.MouseButtonPress,
+    QEvent.Type.Wheel,
+)
+
+
+class ActivityFilter(QObject):
+    """アプリ内のキーボード・マウス操作をIdleTaskRunnerに通知するイベントフィルター"""
+
+    def __init__(self, runner: "IdleTaskRunner"):
+        super().__init__(runner)
+        self._runner = runner
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        if event.type() in ACTIVITY_EVENTS:
+            self._runner.notify_activity()
+        return False
+
+
+class IdleTaskRunner(QObject):
+    """アイドル時に登録されたタスクを少しずつ実行するクラス
+
+    タスクは1回の呼び出しで小さな単位の作業だけを行い、
+    まだ作業が残っている場合にTrueを返す関数として登録する。
+    """
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._tasks: list[tuple[str, Callable[[], bool]]] = []
+        self._next_index = 0
+        self._last_activity = time.monotonic()
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._on_tick)
+
+    def register(self, name: str, task: Callable[[], bool]) -> None:
+        """タスクを登録"""
+        self._tasks.append((name, task))
+
+    def watch(self, target: QObject) -> None:
+        """対象（通常はQApplication）のユーザー操作を監視してアイドル判定に使う"""
+        self._activity_filter = ActivityFilter(self)
+        target.installEventFilter(self._activity_filter)
+
+    def start(self) -> None:
+        """実行を開始"""
+        self._timer.start(ACTIVE_INTERVAL)
+
+    def stop(self) -> None:
+        """実行を停止"""
+        self._timer.stop()
+
+    def notify_activity(self, *args) -> None:
+        """ユーザー操作やキャプチャがあったことを通知"""
+        self._last_activity = time.monotonic()
+        if self._timer.interval() != ACTIVE_INTERVAL:
+            self._timer.start(ACTIVE_INTERVAL)
+
+    def _on_tick(self) -> None:
+        """タイマー発火時（アイドルならタスクを1つ実行）"""
+        if not self._tasks:
+            return
+
+        if time.monotonic() - self._last_activity < IDLE_THRESHOLD:
+            return
+
+        # タスクを順番に1つずつ実行し、全タスクに作業がなければ間隔を伸ばす
+        for _ in range(len(self._tasks)):
+            name, task = self._tasks[self._next_index]
+            self._next_index = (self._next_index + 1) % len(self._tasks)
+
+            try:
+                has_more = task()
+            except Exception as e:
+                print(f"アイドルタスク「{name}」でエラー: {e}")
+                has_more = False
+
+            if has_more:
+                self._timer.setInterval(ACTIVE_INTERVAL)
+                return
+
+        self._timer.setInterval(IDLE_INTERVAL)
@@ -0,0 +1,83 @@
+"""履歴の保持ポリシーモジュール"""
+from database import (
+    get_setting, enforce_retention, backfill_size_bytes,
+    incremental_vacuum,
+    archive_history_batch, purge_archives_batch, purge_deleted_batch,
+)
+
+
+# 1回のアイドル処理で削除する最大件数
+RETENTION_BATCH_SIZE = 200
+
+# 1回のアイドル処理で解放する最大ページ数
+VACUUM_BATCH_PAGES = 256
+
+# 最後に使ってから月別アーカイブに移すまでの日数の初期値
+ARCHIVE_AFTER_DAYS = 90
+
+# 1回のアイドル処理でアーカイブに移す・アーカイブから削除する最大件数
+ARCHIVE_BATCH_SIZE = 500
+
+# 削除済みの履歴を実際に削除するまでの時間（秒、画面で削除を取り消せる時間より長くする）
+DELETED_PURGE_DELAY = 60.0
+
+# 1回のアイドル処理で実際に削除する削除済みの履歴の最大件数
+PURGE_BATCH_SIZE = 500
+
+
+def _read_int(key: str, default: int = 0) -> int:
+    """整数の設定値を取得（不正な値は初期値）"""
+    try:
+        return max(0, int(get_setting(key, str(default))))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_retention_policy() -> dict[str, int]:
+    """設定から保持ポリシーを取得（0は無制限）"""
+    return {
+        "max_rows": _read_int("retention_max_rows"),
+        "max_bytes": _read_int("retention_max_mb") * 1024 * 1024,
+        "max_age_days": _read_int("retention_max_days"),
+    }
+
+
+def get_archive_days() -> int:
+    """設定からアーカイブに移すまでの日数を取得（0はアーカイブしない）"""
+    return _read_int("archive_after_days", ARCHIVE_AFTER_DAYS)
+
+
+def run_retention_step() -> bool:
+    """保持ポリシーを少しだけ適用（まだ作業が残っていればTrueを返す）"""
+    # 既存行のバイト数を先に埋める（容量上限の計算に必要）
+    if backfill_size_bytes() > 0:
+        return True
+
+    policy = get_retention_policy()
+    if not any(policy.values()):
+        return False
+
+    deleted = enforce_retention(batch_size=RETENTION_BATCH_SIZE, **policy)
+
+    # 削除で空いたページを少しずつ解放（移行前のデータベースは空きページを再利用するだけ）
+    freed = incremental_vacuum(VACUUM_BATCH_PAGES)
+
+    return deleted > 0 or freed > 0
+
+
+def run_archive_step() -> bool:
+    """古い履歴を少しだけ月別アーカイブに移す（まだ作業が残っていればTrueを返す）"""
+    # 削除された履歴をアーカイブファイルから先に取り除く
+    if purge_archives_batch(ARCHIVE_BATCH_SIZE) > 0:
+        return True
+
+    days = get_archive_days()
+    if days <= 0:
+        return False
+
+    return archive_history_batch(days, ARCHIVE_BATCH_SIZE) > 0
+
+
+def run_purge_step() -> bool:
+    """削除済みの履歴を少しだけ実際に削除（まだ作業が残っていればTrueを返す）"""
+    return purge_deleted_batch(DELETED_PURGE_DELAY, PURGE_BATCH_SIZE) > 0
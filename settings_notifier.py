@@ -0,0 +1,25 @@
+"""設定変更通知モジュール"""
+from typing import Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from database import add_setting_listener, remove_setting_listener
+
+
+class SettingsNotifier(QObject):
+    """設定値の変更をQtシグナルとして通知するクラス"""
+
+    # 設定値が変更されたときのシグナル（どのスレッドで変更されても受信側のスレッドで処理される）
+    setting_changed = pyqtSignal(str, object)  # キー, 新しい値
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        add_setting_listener(self._on_setting_changed)
+
+    def close(self) -> None:
+        """通知を停止"""
+        remove_setting_listener(self._on_setting_changed)
+
+    def _on_setting_changed(self, key: str, value: Optional[str]) -> None:
+        """データベース層からの変更通知"""
+        self.setting_changed.emit(key, value)
@@ -0,0 +1,116 @@
+"""件数カウンターの整合性のテスト
+
+一時ディレクトリのデータベースに履歴を追加し、一括削除・絞り込み削除・全削除・
+保持ポリシーの適用の後でカウンターが実データと一致していることを確認する。
+
+実行方法: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+from history_cache import HistoryCache  # noqa: E402
+
+
+CATEGORIES = ("text", "code", "url", "email")
+
+
+@pytest.fixture
+def history_db(tmp_path, monkeypatch):
+    """一時ディレクトリのデータベースを初期化し、履歴を追加する（IDのリストを返す）"""
+    database_path = tmp_path / "clipboard_history.db"
+    monkeypatch.setattr(database, "DATABASE_PATH", database_path)
+    monkeypatch.setattr(database, "_manager", database.ConnectionManager(database_path))
+    monkeypatch.setattr(database, "_settings_cache", None)
+    monkeypatch.setattr(database, "_cache", HistoryCache())
+    database.init_database()
+
+    results = database.add_history_many([
+        {
+            "content_type": "text",
+            "content": f"counter test {i} " + "x" * (i * 7 % 300),
+            "content_hash": f"{i:064x}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+        }
+        for i in range(120)
+    ])
+    history_ids = [history_id for history_id, _ in results]
+    database.set_favorite_many(history_ids[::10], True)
+
+    yield history_ids
+
+    database.close_database()
+
+
+def test_counters_match_after_insert(history_db):
+    assert database.verify_counters()
+    assert database.get_history_stats()["total"] == len(history_db)
+
+
+def test_delete_history_many(history_db):
+    deleted = database.delete_history_many(history_db[:50])
+    assert deleted == 50
+    assert database.verify_counters()
+    assert database.get_history_stats()["total"] == len(history_db) - 50
+
+    # 削除の取り消しと実際の削除でも一致したまま
+    database.restore_deleted_history(0)
+    assert database.verify_counters()
+    assert database.get_history_stats()["total"] == len(history_db)
+
+    database.delete_history_many(history_db[:50])
+    while database.purge_deleted_batch(min_age=0, batch_size=20):
+        assert database.verify_counters()
+    assert database.verify_counters()
+    assert database.get_history_stats()["total"] == len(history_db) - 50
+
+
+def test_delete_history_by_filter(history_db):
+    deleted = database.delete_history_by_filter(category="code")
+    assert deleted > 0
+    assert database.verify_counters()
+    counts = database.get_category_counts()
+    assert "code" not in counts
+    assert sum(counts.values()) == len(history_db) - deleted
+
+    database.purge_deleted_batch(min_age=0)
+    assert database.verify_counters()
+
+
+def test_clear_all_history(history_db):
+    database.clear_all_history()
+    assert database.verify_counters()
+
+    stats = database.get_history_stats()
+    assert stats["total"] == stats["favorites"] == len(history_db[::10])
+
+    database.purge_deleted_batch(min_age=0)
+    assert database.verify_counters()
+
+
+def test_enforce_retention(history_db):
+    while database.enforce_retention(max_rows=40, batch_size=25):
+        assert database.verify_counters()
+    assert database.verify_counters()
+    assert database.get_history_stats()["total"] == 40
+
+    stats = database.get_history_stats()
+    while database.enforce_retention(max_bytes=stats["bytes"] // 2, batch_size=10):
+        assert database.verify_counters()
+    assert database.get_history_stats()["bytes"] <= stats["bytes"] // 2
+
+    database.purge_deleted_batch(min_age=0)
+    assert database.verify_counters()
+
+
+def test_rebuild_counters(history_db):
+    with database.write_transaction() as conn:
+        conn.execute("UPDATE history_counters SET value = value + 5 WHERE name = 'total'")
+    assert not database.verify_counters()
+
+    database.rebuild_counters()
+    assert database.verify_counters()
@@ -0,0 +1,59 @@
+"""テキストの類似判定用の指紋（SimHash）モジュール
+
+テキストを文字の4-gramに分け、各4-gramの64ビットのハッシュを出現回数で重み付けして
+ビットごとに多数決をとる。少しだけ編集したテキストは、ハミング距離の近い指紋になる。
+"""
+import hashlib
+import re
+from collections import Counter
+from typing import Optional
+
+
+# 指紋を計算するカテゴリ（URLやメールアドレスなどの短い値は編集の版として扱わない）
+SIMHASH_CATEGORIES = ("text", "code")
+
+# 指紋を計算する最小の文字数（短いテキストは1文字の違いで指紋が大きく変わるため対象外）
+SIMHASH_MIN_CHARS = 16
+
+# 指紋の計算に使う最大の文字数（これより長いテキストは先頭だけを使う）
+SIMHASH_MAX_CHARS = 20000
+
+# 1つの特徴とする文字数
+SHINGLE_CHARS = 4
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """空白の連続を1つにまとめ、小文字にしたテキスト（インデントや改行だけの違いを無視する）"""
+    return _WHITESPACE.sub(" ", text[:SIMHASH_MAX_CHARS]).strip().lower()
+
+
+def simhash(text: Optional[str], category: Optional[str] = None) -> Optional[int]:
+    """テキストのSimHash（64ビットの符号なし整数、対象外のテキストはNone）
+
+    categoryを指定した場合はSIMHASH_CATEGORIESのカテゴリだけを対象にする。
+    """
+    if text is None or (category is not None and category not in SIMHASH_CATEGORIES):
+        return None
+
+    normalized = normalize_text(text)
+    if len(normalized) < SIMHASH_MIN_CHARS:
+        return None
+
+    shingles = Counter(normalized[i:i + SHINGLE_CHARS] for i in range(len(normalized) - SHINGLE_CHARS + 1))
+
+    # バイト位置ごとに、各バイト値の重みを合計してからビットごとに集計する（特徴ごとに64ビットを調べない）
+    tables = [[0] * 256 for _ in range(8)]
+    for shingle, weight in shingles.items():
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for table, byte in zip(tables, digest):
+            table[byte] += weight
+
+    total = sum(shingles.values())
+    value = 0
+    for table in tables:
+        for bit in range(7, -1, -1):
+            ones = sum(weight for byte, weight in enumerate(table) if byte >> bit & 1)
+            value = (value << 1) | (ones * 2 > total)
+    return value
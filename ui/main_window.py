@@ -1,4 +1,5 @@
 """メインウィンドウモジュール"""
+import time
 import webbrowser
 from datetime import datetime
 from typing import Optional
@@ -8,14 +9,74 @@ from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLineEdit, QListWidget, QListWidgetItem, QLabel,
     QPushButton, QComboBox, QMenu, QFrame, QSizePolicy,
-    QMessageBox
+    QMessageBox, QAbstractItemView
 )
-from PyQt6.QtCore import Qt, pyqtSignal, QSize, QTimer
-from PyQt6.QtGui import QPixmap, QIcon, QAction, QCursor
+from PyQt6.QtCore import Qt, pyqtSignal, QSize, QTimer, QObject, QRunnable, QThreadPool
+from PyQt6.QtGui import QPixmap, QIcon, QAction, QCursor, QKeySequence, QShortcut
 
 from config import APP_NAME, CATEGORIES
-from database import get_history, delete_history, toggle_favorite, clear_all_history
+from database import (
+    get_history_page, get_history_by_id, delete_history, toggle_favorite, clear_all_history,
+    make_preview, get_category_counts, get_history_stats, get_facet_values,
+    delete_history_many, set_favorite_many, delete_history_by_filter, restore_deleted_history,
+)
 from categorizer import get_category_icon, get_category_display_name
+from ui.timeline_widget import TimelineWidget
+
+
+# 1ページあたりの取得件数
+PAGE_SIZE = 50
+
+# 末尾から何件以内までスクロールしたら次ページを先読みするか
+PREFETCH_THRESHOLD = 10
+
+# カテゴリごとに選択肢を表示する派生フィールド（値は件数の多い順）
+FACET_FIELD_BY_CATEGORY = {
+    "url": "url_host",
+    "email": "email_domain",
+    "filepath": "file_ext",
+    "image": "file_ext",
+}
+
+# 行数で絞り込むカテゴリと選択肢（表示名, 条件）
+LINE_FACET_CATEGORIES = ("text", "code")
+LINE_FACETS = (
+    ("1行", {"max_lines": 1}),
+    ("2〜20行", {"min_lines": 2, "max_lines": 20}),
+    ("21行以上", {"min_lines": 21}),
+)
+
+# 派生フィールドの選択肢の最大数
+FACET_VALUE_LIMIT = 30
+
+# 削除を取り消せる時間（ミリ秒、削除済みの履歴が実際に削除されるまでの時間より短くする）
+UNDO_TIMEOUT = 10000
+
+
+class PageLoader(QObject):
+    """履歴ページの読み込み完了を通知するオブジェクト"""
+
+    page_loaded = pyqtSignal(int, list, object)  # 世代番号, 行リスト, 次ページのトークン
+
+
+class PageLoadTask(QRunnable):
+    """バックグラウンドで履歴ページを読み込むタスク"""
+
+    def __init__(self, loader: PageLoader, generation: int, cursor: Optional[str], filters: dict):
+        super().__init__()
+        self._loader = loader
+        self._generation = generation
+        self._cursor = cursor
+        self._filters = filters
+
+    def run(self) -> None:
+        """ページを取得して結果を通知"""
+        try:
+            rows, next_cursor = get_history_page(limit=PAGE_SIZE, cursor=self._cursor, **self._filters)
+        except Exception as e:
+            print(f"履歴の読み込みに失敗: {e}")
+            rows, next_cursor = [], None
+        self._loader.page_loaded.emit(self._generation, rows, next_cursor)
 
 
 class HistoryItemWidget(QFrame):
@@ -25,6 +86,7 @@ class HistoryItemWidget(QFrame):
     favorite_clicked = pyqtSignal(dict)  # お気に入りボタンクリック
     delete_clicked = pyqtSignal(dict)  # 削除ボタンクリック
     open_url_clicked = pyqtSignal(dict)  # URL開くボタンクリック
+    group_clicked = pyqtSignal(dict)  # 類似の履歴ボタンクリック
 
     def __init__(self, data: dict, parent: Optional[QWidget] = None):
         super().__init__(parent)
@@ -52,16 +114,22 @@ class HistoryItemWidget(QFrame):
 
         header_layout.addStretch()
 
-        # タイムスタンプ
-        created_at = self.data.get("created_at", "")
-        if created_at:
+        # タイムスタンプ（最後にコピーした日時）
+        used_at = self.data.get("last_used_at") or self.data.get("created_at", "")
+        if isinstance(used_at, int):
+            # エポックミリ秒（コンパクト形式）
+            time_str = datetime.fromtimestamp(used_at / 1000).strftime("%Y/%m/%d %H:%M")
+        elif used_at:
             try:
-                dt = datetime.fromisoformat(created_at)
+                dt = datetime.fromisoformat(used_at)
                 time_str = dt.strftime("%Y/%m/%d %H:%M")
             except Exception:
-                time_str = created_at
+                time_str = used_at
         else:
             time_str = ""
+        copy_count = self.data.get("copy_count") or 1
+        if copy_count > 1:
+            time_str = f"×{copy_count}  {time_str}"
         time_label = QLabel(time_str)
         time_label.setProperty("class", "subtitle")
         header_layout.addWidget(time_label)
@@ -90,14 +158,12 @@ class HistoryItemWidget(QFrame):
             else:
                 content_layout.addWidget(QLabel("[画像ファイルが見つかりません]"))
         else:
-            # テキストコンテンツ
-            content = self.data.get("content", "")
-            # 長いテキストは省略
-            display_text = content[:200] + "..." if len(content) > 200 else content
-            # 改行を含む場合は最初の3行まで
-            lines = display_text.split("\n")
-            if len(lines) > 3:
-                display_text = "\n".join(lines[:3]) + "\n..."
+            # テキストコンテンツ（保存時に作成したプレビューを表示）
+            display_text = self.data.get("preview") or ""
+            # 検索結果の場合は一致箇所のスニペットを優先表示
+            snippet = self.data.get("snippet")
+            if snippet:
+                display_text = make_preview(snippet)
 
             content_label = QLabel(display_text)
             content_label.setWordWrap(True)
@@ -125,6 +191,15 @@ class HistoryItemWidget(QFrame):
             open_btn.clicked.connect(lambda: self.open_url_clicked.emit(self.data))
             button_layout.addWidget(open_btn)
 
+        # 類似の履歴がまとめられている場合は件数ボタンを追加
+        group_size = self.data.get("group_size", 0)
+        if group_size > 1:
+            group_btn = QPushButton(f"🗂{group_size}")
+            group_btn.setProperty("class", "icon")
+            group_btn.setToolTip("類似の履歴を表示")
+            group_btn.clicked.connect(lambda: self.group_clicked.emit(self.data))
+            button_layout.addWidget(group_btn)
+
         # お気に入りボタン
         is_favorite = self.data.get("is_favorite", False)
         fav_btn = QPushButton("★" if is_favorite else "☆")
@@ -176,9 +251,27 @@ class MainWindow(QMainWindow):
         self._search_timer.timeout.connect(self._do_search)
 
         self._current_category: Optional[str] = None
+        self._current_facets: Optional[dict] = None
+        self._current_range: Optional[tuple[int, int]] = None  # タイムラインで選択した作成日時の範囲
+        self._current_group: Optional[int] = None  # 表示中の類似の履歴のグループ
         self._current_search: str = ""
         self._favorites_only: bool = False
 
+        # ページング状態（世代番号が変わったら古い読み込み結果は破棄する）
+        self._generation = 0
+        self._next_cursor: Optional[str] = None
+        self._loading = False
+        self._total_count = 0
+        self._page_loader = PageLoader(self)
+        self._page_loader.page_loaded.connect(self._on_page_loaded)
+
+        # 削除の取り消し（この時刻以降に削除した履歴を戻す）
+        self._undo_since: Optional[int] = None
+        self._undo_count = 0
+        self._undo_timer = QTimer()
+        self._undo_timer.setSingleShot(True)
+        self._undo_timer.timeout.connect(self._hide_undo)
+
         self._setup_ui()
 
     def _setup_ui(self) -> None:
@@ -229,8 +322,22 @@ class MainWindow(QMainWindow):
         self._category_combo.currentIndexChanged.connect(self._on_category_changed)
         filter_layout.addWidget(self._category_combo)
 
+        # 派生フィールドの絞り込み（URLのホスト、メールのドメイン、拡張子、行数）
+        self._facet_combo = QComboBox()
+        self._facet_combo.currentIndexChanged.connect(self._on_facet_changed)
+        self._facet_combo.hide()
+        filter_layout.addWidget(self._facet_combo)
+
         filter_layout.addStretch()
 
+        # タイムラインの表示切り替え
+        self._timeline_btn = QPushButton("📊")
+        self._timeline_btn.setProperty("class", "secondary")
+        self._timeline_btn.setToolTip("タイムライン")
+        self._timeline_btn.setCheckable(True)
+        self._timeline_btn.clicked.connect(self._on_timeline_toggled)
+        filter_layout.addWidget(self._timeline_btn)
+
         # お気に入りフィルター
         self._fav_btn = QPushButton("☆ お気に入り")
         self._fav_btn.setProperty("class", "secondary")
@@ -246,12 +353,73 @@ class MainWindow(QMainWindow):
 
         layout.addLayout(filter_layout)
 
+        # タイムライン（棒をクリックするとその期間に作成された履歴に絞り込む）
+        self._timeline_panel = QWidget()
+        timeline_layout = QVBoxLayout(self._timeline_panel)
+        timeline_layout.setContentsMargins(0, 0, 0, 0)
+
+        self._timeline_unit_combo = QComboBox()
+        self._timeline_unit_combo.addItem("日ごと", "day")
+        self._timeline_unit_combo.addItem("時間ごと", "hour")
+        self._timeline_unit_combo.currentIndexChanged.connect(self._on_timeline_unit_changed)
+        timeline_layout.addWidget(self._timeline_unit_combo, alignment=Qt.AlignmentFlag.AlignLeft)
+
+        self._timeline = TimelineWidget()
+        self._timeline.range_selected.connect(self._on_range_selected)
+        timeline_layout.addWidget(self._timeline)
+
+        self._timeline_panel.hide()
+        layout.addWidget(self._timeline_panel)
+
+        # 類似の履歴の表示中バー
+        self._group_bar = QWidget()
+        group_layout = QHBoxLayout(self._group_bar)
+        group_layout.setContentsMargins(0, 0, 0, 0)
+
+        self._group_label = QLabel("")
+        group_layout.addWidget(self._group_label)
+        group_layout.addStretch()
+
+        group_clear_btn = QPushButton("グループの表示を解除")
+        group_clear_btn.setProperty("class", "secondary")
+        group_clear_btn.clicked.connect(lambda: self._show_group(None))
+        group_layout.addWidget(group_clear_btn)
+
+        self._group_bar.hide()
+        layout.addWidget(self._group_bar)
+
         # 履歴リスト
         self._list_widget = QListWidget()
         self._list_widget.setSpacing(2)
+        self._list_widget.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self._list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self._list_widget.customContextMenuRequested.connect(self._show_context_menu)
         self._list_widget.itemDoubleClicked.connect(self._on_item_double_clicked)
+        self._list_widget.verticalScrollBar().valueChanged.connect(self._on_scrolled)
         layout.addWidget(self._list_widget)
 
+        # 選択中のアイテムをDeleteキーで削除
+        delete_shortcut = QShortcut(QKeySequence.StandardKey.Delete, self._list_widget)
+        delete_shortcut.setContext(Qt.ShortcutContext.WidgetShortcut)
+        delete_shortcut.activated.connect(self._delete_selected)
+
+        # 削除の取り消しバー
+        self._undo_bar = QWidget()
+        undo_layout = QHBoxLayout(self._undo_bar)
+        undo_layout.setContentsMargins(0, 0, 0, 0)
+
+        self._undo_label = QLabel("")
+        undo_layout.addWidget(self._undo_label)
+        undo_layout.addStretch()
+
+        undo_btn = QPushButton("元に戻す")
+        undo_btn.setProperty("class", "secondary")
+        undo_btn.clicked.connect(self._undo_delete)
+        undo_layout.addWidget(undo_btn)
+
+        self._undo_bar.hide()
+        layout.addWidget(self._undo_bar)
+
         # ステータスバー
         self._status_label = QLabel("")
         self._status_label.setProperty("class", "subtitle")
@@ -270,6 +438,57 @@ class MainWindow(QMainWindow):
     def _on_category_changed(self, index: int) -> None:
         """カテゴリ変更時"""
         self._current_category = self._category_combo.currentData()
+        self._update_facet_options()
+        self.refresh_history()
+
+    def _update_facet_options(self) -> None:
+        """カテゴリに応じて派生フィールドの選択肢を作り直す（選択は解除する）"""
+        self._current_facets = None
+        self._facet_combo.blockSignals(True)
+        self._facet_combo.clear()
+
+        field = FACET_FIELD_BY_CATEGORY.get(self._current_category)
+        if field:
+            self._facet_combo.addItem("すべて", None)
+            for value, count in get_facet_values(field, FACET_VALUE_LIMIT, self._current_category):
+                label = f".{value}" if field == "file_ext" else value
+                self._facet_combo.addItem(f"{label} ({count})", {field: value})
+        elif self._current_category in LINE_FACET_CATEGORIES:
+            self._facet_combo.addItem("すべての行数", None)
+            for label, facets in LINE_FACETS:
+                self._facet_combo.addItem(label, facets)
+
+        self._facet_combo.setVisible(self._facet_combo.count() > 1)
+        self._facet_combo.blockSignals(False)
+
+    def _on_facet_changed(self, index: int) -> None:
+        """派生フィールドの選択変更時"""
+        self._current_facets = self._facet_combo.currentData()
+        self.refresh_history()
+
+    def _on_timeline_toggled(self, checked: bool) -> None:
+        """タイムラインの表示切り替え（非表示にすると期間の絞り込みも解除）"""
+        self._timeline_panel.setVisible(checked)
+        if checked:
+            self._timeline.refresh()
+        else:
+            self._timeline.clear_selection()
+
+    def _on_timeline_unit_changed(self, index: int) -> None:
+        """タイムラインの集計単位変更時"""
+        self._timeline.set_unit(self._timeline_unit_combo.currentData())
+
+    def _on_range_selected(self, time_range: Optional[tuple]) -> None:
+        """タイムラインで期間を選択・解除した時"""
+        self._current_range = time_range
+        self.refresh_history()
+
+    def _show_group(self, data: Optional[dict]) -> None:
+        """類似の履歴のグループを表示（Noneで解除）"""
+        self._current_group = data.get("group_id") if data else None
+        if self._current_group is not None:
+            self._group_label.setText(f"類似の履歴 {data.get('group_size', 0)}件")
+        self._group_bar.setVisible(self._current_group is not None)
         self.refresh_history()
 
     def _on_favorites_toggled(self, checked: bool) -> None:
@@ -289,9 +508,10 @@ class MainWindow(QMainWindow):
         )
 
         if reply == QMessageBox.StandardButton.Yes:
+            since = int(time.time() * 1000)
             count = clear_all_history()
-            self._status_label.setText(f"{count}件の履歴を削除しました")
             self.refresh_history()
+            self._show_undo(count, since)
 
     def _on_item_double_clicked(self, item: QListWidgetItem) -> None:
         """アイテムダブルクリック時"""
@@ -302,11 +522,19 @@ class MainWindow(QMainWindow):
     def _copy_item(self, data: dict) -> None:
         """アイテムをコピー"""
         content_type = data.get("content_type", "text")
-        content = data.get("content", "")
+        content = self._load_content(data)
         image_path = data.get("image_path", "")
         self.copy_requested.emit(content_type, content, image_path)
         self._status_label.setText("コピーしました")
 
+    def _load_content(self, data: dict) -> str:
+        """アイテムの本文を取得（一覧にはプレビューしかないため必要時に読み込む）"""
+        if "content" in data:
+            return data["content"] or ""
+
+        full_data = get_history_by_id(data["id"]) if data.get("id") else None
+        return (full_data.get("content") or "") if full_data else ""
+
     def _favorite_item(self, data: dict) -> None:
         """アイテムのお気に入りをトグル"""
         history_id = data.get("id")
@@ -318,12 +546,128 @@ class MainWindow(QMainWindow):
         """アイテムを削除"""
         history_id = data.get("id")
         if history_id:
-            delete_history(history_id)
+            since = int(time.time() * 1000)
+            if delete_history(history_id):
+                self.refresh_history()
+                self._show_undo(1, since)
+
+    def _selected_ids(self) -> list[int]:
+        """選択中のアイテムのIDリスト"""
+        history_ids = []
+        for item in self._list_widget.selectedItems():
+            widget = self._list_widget.itemWidget(item)
+            if isinstance(widget, HistoryItemWidget) and widget.data.get("id"):
+                history_ids.append(widget.data["id"])
+        return history_ids
+
+    def _show_context_menu(self, pos) -> None:
+        """一覧の右クリックメニューを表示"""
+        menu = QMenu(self)
+        selected_count = len(self._selected_ids())
+
+        if selected_count:
+            favorite_action = menu.addAction(f"選択した{selected_count}件をお気に入りに追加")
+            favorite_action.triggered.connect(lambda: self._favorite_selected(True))
+
+            unfavorite_action = menu.addAction(f"選択した{selected_count}件をお気に入りから外す")
+            unfavorite_action.triggered.connect(lambda: self._favorite_selected(False))
+
+            delete_action = menu.addAction(f"選択した{selected_count}件を削除")
+            delete_action.triggered.connect(self._delete_selected)
+
+            menu.addSeparator()
+
+        filter_action = menu.addAction("表示中の条件に一致する履歴を削除")
+        filter_action.triggered.connect(self._delete_filtered)
+
+        menu.exec(self._list_widget.viewport().mapToGlobal(pos))
+
+    def _favorite_selected(self, favorite: bool) -> None:
+        """選択中のアイテムのお気に入り状態を一括設定"""
+        history_ids = self._selected_ids()
+        if history_ids:
+            set_favorite_many(history_ids, favorite)
+            self.refresh_history()
+
+    def _delete_selected(self) -> None:
+        """選択中のアイテムを一括削除"""
+        history_ids = self._selected_ids()
+        if not history_ids:
+            return
+
+        if len(history_ids) > 1:
+            reply = QMessageBox.question(
+                self,
+                "確認",
+                f"選択した{len(history_ids)}件の履歴を削除しますか？",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.No
+            )
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+
+        since = int(time.time() * 1000)
+        count = delete_history_many(history_ids)
+        self.refresh_history()
+        self._show_undo(count, since)
+
+    def _delete_filtered(self) -> None:
+        """現在の絞り込み条件に一致する履歴を一括削除（お気に入りは除く）"""
+        reply = QMessageBox.question(
+            self,
+            "確認",
+            "表示中の条件に一致する履歴（お気に入り以外）をすべて削除しますか？",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+
+        if reply == QMessageBox.StandardButton.Yes:
+            since = int(time.time() * 1000)
+            count = delete_history_by_filter(**self._current_filters())
             self.refresh_history()
+            self._show_undo(count, since)
+
+    def _show_undo(self, count: int, since: int) -> None:
+        """削除を取り消すバーを表示（表示中に続けて削除した場合はまとめて取り消す）"""
+        if count <= 0:
+            return
+
+        if self._undo_since is None:
+            self._undo_since = since
+            self._undo_count = 0
+        self._undo_count += count
+
+        self._undo_label.setText(f"{self._undo_count}件の履歴を削除しました")
+        self._undo_bar.show()
+        self._undo_timer.start(UNDO_TIMEOUT)
+
+    def _hide_undo(self) -> None:
+        """削除の取り消しバーを隠す"""
+        self._undo_timer.stop()
+        self._undo_bar.hide()
+        self._undo_since = None
+        self._undo_count = 0
+
+    def _undo_delete(self) -> None:
+        """直前の削除を取り消す"""
+        if self._undo_since is None:
+            return
+
+        count = restore_deleted_history(self._undo_since)
+        self._hide_undo()
+        self.refresh_history()
+        self._status_label.setText(f"{count}件の履歴を元に戻しました")
+
+    def set_cleanup_progress(self, done: int, total: int) -> None:
+        """画像ファイル削除の進捗を表示"""
+        if done < total:
+            self._status_label.setText(f"画像ファイルを削除中... {done}/{total}")
+        else:
+            self._update_status()
 
     def _open_url(self, data: dict) -> None:
         """URLをブラウザで開く"""
-        content = data.get("content", "")
+        content = self._load_content(data)
         if content:
             # http/https がない場合は追加
             url = content
@@ -335,17 +679,39 @@ class MainWindow(QMainWindow):
             except Exception as e:
                 self._status_label.setText(f"URLを開けませんでした: {e}")
 
+    def _current_filters(self) -> dict:
+        """現在の絞り込み条件"""
+        facets = dict(self._current_facets or {})
+        if self._current_range:
+            facets["created_from"], facets["created_to"] = self._current_range
+        if self._current_group is not None:
+            facets["group_id"] = self._current_group
+
+        return {
+            "category": self._current_category,
+            "search_query": self._current_search if self._current_search else None,
+            "favorites_only": self._favorites_only,
+            "facets": facets or None,
+        }
+
     def refresh_history(self) -> None:
-        """履歴を更新"""
+        """履歴を更新（先頭ページを読み込み直す）"""
+        self._generation += 1
+        self._loading = False
         self._list_widget.clear()
 
-        history = get_history(
-            limit=200,
-            category=self._current_category,
-            search_query=self._current_search if self._current_search else None,
-            favorites_only=self._favorites_only,
-        )
+        history, self._next_cursor = get_history_page(limit=PAGE_SIZE, **self._current_filters())
+        self._append_items(history)
+        self._update_category_counts()
+        self._update_status()
+        if self._timeline_panel.isVisible():
+            self._timeline.refresh()
+
+        # 画面が埋まらない場合は続きを読み込む
+        self._on_scrolled(self._list_widget.verticalScrollBar().value())
 
+    def _append_items(self, history: list[dict]) -> None:
+        """履歴アイテムをリスト末尾に追加"""
         for item_data in history:
             item = QListWidgetItem(self._list_widget)
             widget = HistoryItemWidget(item_data)
@@ -355,12 +721,56 @@ class MainWindow(QMainWindow):
             widget.favorite_clicked.connect(self._favorite_item)
             widget.delete_clicked.connect(self._delete_item)
             widget.open_url_clicked.connect(self._open_url)
+            widget.group_clicked.connect(self._show_group)
 
             item.setSizeHint(widget.sizeHint())
             self._list_widget.addItem(item)
             self._list_widget.setItemWidget(item, widget)
 
-        self._status_label.setText(f"{len(history)}件の履歴")
+    def _update_category_counts(self) -> None:
+        """カテゴリフィルターの件数バッジを更新"""
+        counts = get_category_counts()
+        self._total_count = get_history_stats()["total"]
+
+        for index in range(self._category_combo.count()):
+            key = self._category_combo.itemData(index)
+            if key is None:
+                self._category_combo.setItemText(index, f"すべて ({self._total_count})")
+            else:
+                name = CATEGORIES.get(key, key)
+                self._category_combo.setItemText(
+                    index, f"{get_category_icon(key)} {name} ({counts.get(key, 0)})"
+                )
+
+    def _update_status(self) -> None:
+        """件数表示を更新"""
+        count = self._list_widget.count()
+        suffix = "以上" if self._next_cursor else ""
+        self._status_label.setText(f"{count}件{suffix}の履歴（全{self._total_count}件）")
+
+    def _on_scrolled(self, value: int) -> None:
+        """スクロール時（末尾に近づいたら次ページを先読み）"""
+        if self._loading or not self._next_cursor:
+            return
+
+        row = self._list_widget.indexAt(self._list_widget.viewport().rect().bottomLeft()).row()
+        if row < 0 or row >= self._list_widget.count() - PREFETCH_THRESHOLD:
+            self._loading = True
+            task = PageLoadTask(self._page_loader, self._generation, self._next_cursor, self._current_filters())
+            QThreadPool.globalInstance().start(task)
+
+    def _on_page_loaded(self, generation: int, history: list, next_cursor: Optional[str]) -> None:
+        """次ページの読み込み完了時"""
+        if generation != self._generation:
+            return  # 絞り込み条件が変わった後の古い結果
+
+        self._loading = False
+        self._next_cursor = next_cursor
+        self._append_items(history)
+        self._update_status()
+
+        # まだ末尾付近なら続けて読み込む
+        self._on_scrolled(self._list_widget.verticalScrollBar().value())
 
     def showEvent(self, event) -> None:
         """ウィンドウ表示時"""
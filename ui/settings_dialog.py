@@ -4,18 +4,70 @@ from typing import Optional
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QFormLayout,
     QLabel, QLineEdit, QPushButton, QComboBox,
-    QGroupBox, QCheckBox, QMessageBox
+    QGroupBox, QCheckBox, QMessageBox, QSpinBox,
+    QFileDialog, QProgressDialog
 )
-from PyQt6.QtCore import pyqtSignal, Qt
+from PyQt6.QtCore import pyqtSignal, Qt, QObject, QRunnable, QThreadPool
 
-from database import get_setting, set_setting
+from database import (
+    get_setting, set_setting, close_connection, get_image_group_policy, get_text_group_policy,
+    incremental_vacuum_enabled, convert_to_incremental_vacuum, MAX_IMAGE_GROUP_THRESHOLD, MAX_TEXT_GROUP_THRESHOLD,
+)
 from ai_client import test_api_connection
+from history_io import export_history, import_history
+from retention import ARCHIVE_AFTER_DAYS
+
+
+class TransferSignals(QObject):
+    """エクスポート・インポートの進捗を通知するシグナル"""
+
+    progress = pyqtSignal(int, int)  # 処理済み件数, 全件数
+    finished = pyqtSignal(int)  # 処理した件数
+    failed = pyqtSignal(str)  # エラーメッセージ
+
+
+class TransferTask(QRunnable):
+    """エクスポート・インポートをワーカースレッドで実行するタスク"""
+
+    def __init__(self, func, path: str):
+        super().__init__()
+        self.signals = TransferSignals()
+        self._func = func
+        self._path = path
+
+    def run(self) -> None:
+        """タスクを実行"""
+        try:
+            count = self._func(self._path, progress=self.signals.progress.emit)
+            self.signals.finished.emit(count)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        finally:
+            close_connection()
+
+
+class VacuumTask(QRunnable):
+    """空き領域の自動解放への移行（VACUUM）をワーカースレッドで実行するタスク"""
+
+    def __init__(self):
+        super().__init__()
+        self.signals = TransferSignals()
+
+    def run(self) -> None:
+        """タスクを実行"""
+        try:
+            self.signals.finished.emit(convert_to_incremental_vacuum())
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        finally:
+            close_connection()
 
 
 class SettingsDialog(QDialog):
     """設定ダイアログクラス"""
 
     settings_changed = pyqtSignal()
+    history_imported = pyqtSignal(int)  # インポートした件数
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -99,6 +151,92 @@ class SettingsDialog(QDialog):
 
         layout.addWidget(display_group)
 
+        # データ保存設定グループ
+        storage_group = QGroupBox("データ保存")
+        storage_layout = QFormLayout(storage_group)
+
+        self._durability_combo = QComboBox()
+        self._durability_combo.addItem("厳格（毎回ディスクに同期）", "strict")
+        self._durability_combo.addItem("標準", "normal")
+        self._durability_combo.addItem("高速（異常終了時に直近の履歴を失う場合あり）", "relaxed")
+        storage_layout.addRow("書き込みモード:", self._durability_combo)
+
+        # 保持ポリシー（0は無制限、お気に入りは対象外）
+        self._max_rows_spin = QSpinBox()
+        self._max_rows_spin.setRange(0, 10_000_000)
+        self._max_rows_spin.setSingleStep(1000)
+        self._max_rows_spin.setSpecialValueText("無制限")
+        storage_layout.addRow("最大件数:", self._max_rows_spin)
+
+        self._max_mb_spin = QSpinBox()
+        self._max_mb_spin.setRange(0, 1_000_000)
+        self._max_mb_spin.setSingleStep(100)
+        self._max_mb_spin.setSuffix(" MB")
+        self._max_mb_spin.setSpecialValueText("無制限")
+        storage_layout.addRow("最大容量:", self._max_mb_spin)
+
+        self._max_days_spin = QSpinBox()
+        self._max_days_spin.setRange(0, 36500)
+        self._max_days_spin.setSuffix(" 日")
+        self._max_days_spin.setSpecialValueText("無制限")
+        storage_layout.addRow("保持期間:", self._max_days_spin)
+
+        # 古い履歴を月別のアーカイブファイルに移すまでの日数（0は移さない）
+        self._archive_days_spin = QSpinBox()
+        self._archive_days_spin.setRange(0, 36500)
+        self._archive_days_spin.setSuffix(" 日")
+        self._archive_days_spin.setSpecialValueText("しない")
+        storage_layout.addRow("アーカイブ:", self._archive_days_spin)
+
+        # 見た目がほぼ同じ画像（同じウィンドウのスクリーンショットなど）の扱い
+        self._image_group_combo = QComboBox()
+        self._image_group_combo.addItem("そのまま保存", "off")
+        self._image_group_combo.addItem("最新の画像の下にまとめる", "group")
+        self._image_group_combo.addItem("最新の画像だけを残す", "collapse")
+        storage_layout.addRow("類似画像:", self._image_group_combo)
+
+        # 類似とみなす知覚ハッシュの距離（大きいほど違いの大きい画像もまとめる）
+        self._image_group_threshold_spin = QSpinBox()
+        self._image_group_threshold_spin.setRange(0, MAX_IMAGE_GROUP_THRESHOLD)
+        self._image_group_threshold_spin.setPrefix("距離 ")
+        storage_layout.addRow("類似の判定:", self._image_group_threshold_spin)
+
+        # 編集してコピーし直したテキスト（同じ段落やコードの別の版）の扱い
+        self._text_group_combo = QComboBox()
+        self._text_group_combo.addItem("そのまま保存", "off")
+        self._text_group_combo.addItem("最新の版の下にまとめる", "group")
+        self._text_group_combo.addItem("最新の版だけを残す", "collapse")
+        storage_layout.addRow("テキストの編集版:", self._text_group_combo)
+
+        # 編集版とみなすSimHashの距離（大きいほど違いの大きいテキストもまとめる）
+        self._text_group_threshold_spin = QSpinBox()
+        self._text_group_threshold_spin.setRange(0, MAX_TEXT_GROUP_THRESHOLD)
+        self._text_group_threshold_spin.setPrefix("距離 ")
+        storage_layout.addRow("編集版の判定:", self._text_group_threshold_spin)
+
+        # バックアップ
+        backup_layout = QHBoxLayout()
+
+        export_btn = QPushButton("エクスポート...")
+        export_btn.setProperty("class", "secondary")
+        export_btn.clicked.connect(self._export_history)
+        backup_layout.addWidget(export_btn)
+
+        import_btn = QPushButton("インポート...")
+        import_btn.setProperty("class", "secondary")
+        import_btn.clicked.connect(self._import_history)
+        backup_layout.addWidget(import_btn)
+
+        storage_layout.addRow("バックアップ:", backup_layout)
+
+        # 古いデータベースは空き領域を少しずつ解放できないため、VACUUMで移行する（時間がかかる）
+        self._vacuum_btn = QPushButton("空き領域の自動解放を有効にする...")
+        self._vacuum_btn.setProperty("class", "secondary")
+        self._vacuum_btn.clicked.connect(self._convert_vacuum)
+        storage_layout.addRow("データベース:", self._vacuum_btn)
+
+        layout.addWidget(storage_group)
+
         # ボタン
         button_layout = QHBoxLayout()
         button_layout.addStretch()
@@ -139,9 +277,50 @@ class SettingsDialog(QDialog):
         if theme_index >= 0:
             self._theme_combo.setCurrentIndex(theme_index)
 
+        # 書き込みモード
+        durability = get_setting("write_durability", "normal")
+        durability_index = self._durability_combo.findData(durability)
+        if durability_index >= 0:
+            self._durability_combo.setCurrentIndex(durability_index)
+
+        # 保持ポリシー
+        self._max_rows_spin.setValue(self._get_int_setting("retention_max_rows"))
+        self._max_mb_spin.setValue(self._get_int_setting("retention_max_mb"))
+        self._max_days_spin.setValue(self._get_int_setting("retention_max_days"))
+        self._archive_days_spin.setValue(self._get_int_setting("archive_after_days", ARCHIVE_AFTER_DAYS))
+
+        # 類似画像
+        image_group_policy, image_group_threshold = get_image_group_policy()
+        self._image_group_combo.setCurrentIndex(self._image_group_combo.findData(image_group_policy))
+        self._image_group_threshold_spin.setValue(image_group_threshold)
+
+        # テキストの編集版
+        text_group_policy, text_group_threshold = get_text_group_policy()
+        self._text_group_combo.setCurrentIndex(self._text_group_combo.findData(text_group_policy))
+        self._text_group_threshold_spin.setValue(text_group_threshold)
+
+        # 移行済みのデータベースでは書き直す必要がない
+        self._vacuum_btn.setEnabled(not incremental_vacuum_enabled())
+
         # 初期表示状態を更新
         self._on_provider_changed(self._provider_combo.currentIndex())
 
+    def _get_int_setting(self, key: str, default: int = 0) -> int:
+        """整数の設定値を取得（不正な値は初期値）"""
+        try:
+            return max(0, int(get_setting(key, str(default))))
+        except (TypeError, ValueError):
+            return default
+
+    def _save_choice(self, key: str, value: str, current: str) -> None:
+        """選び直した場合か既に保存されている場合だけ設定を保存
+
+        類似した履歴の扱いは、選んだ場合だけ保持ポリシーで古い版を先に削除するため、
+        初期値のままなら保存しない。
+        """
+        if value != current or get_setting(key) is not None:
+            set_setting(key, value)
+
     def _save_settings(self) -> None:
         """設定を保存"""
         # プロバイダー
@@ -156,9 +335,100 @@ class SettingsDialog(QDialog):
         theme = self._theme_combo.currentData()
         set_setting("theme", theme)
 
+        # 書き込みモード
+        set_setting("write_durability", self._durability_combo.currentData())
+
+        # 保持ポリシー
+        set_setting("retention_max_rows", str(self._max_rows_spin.value()))
+        set_setting("retention_max_mb", str(self._max_mb_spin.value()))
+        set_setting("retention_max_days", str(self._max_days_spin.value()))
+        set_setting("archive_after_days", str(self._archive_days_spin.value()))
+
+        # 類似画像
+        self._save_choice("image_group_policy", self._image_group_combo.currentData(), get_image_group_policy()[0])
+        set_setting("image_group_threshold", str(self._image_group_threshold_spin.value()))
+
+        # テキストの編集版
+        self._save_choice("text_group_policy", self._text_group_combo.currentData(), get_text_group_policy()[0])
+        set_setting("text_group_threshold", str(self._text_group_threshold_spin.value()))
+
         self.settings_changed.emit()
         self.accept()
 
+    def _export_history(self) -> None:
+        """履歴をファイルにエクスポート"""
+        path, _ = QFileDialog.getSaveFileName(
+            self, "履歴をエクスポート", "clipboard_history.ndjson", "NDJSON (*.ndjson)"
+        )
+        if path:
+            self._run_transfer(export_history, path, "エクスポート中...", "{count}件の履歴をエクスポートしました")
+
+    def _import_history(self) -> None:
+        """エクスポートしたファイルから履歴をインポート"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "履歴をインポート", "", "NDJSON (*.ndjson)"
+        )
+        if path:
+            self._run_transfer(import_history, path, "インポート中...", "{count}件の履歴をインポートしました")
+
+    def _run_transfer(self, func, path: str, label: str, done_message: str) -> None:
+        """エクスポート・インポートをバックグラウンドで実行し、進捗を表示"""
+        progress_dialog = QProgressDialog(label, None, 0, 0, self)
+        progress_dialog.setWindowTitle("バックアップ")
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+
+        def on_progress(done: int, total: int) -> None:
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+
+        def on_finished(count: int) -> None:
+            progress_dialog.close()
+            if func is import_history:
+                self.history_imported.emit(count)
+            QMessageBox.information(self, "完了", done_message.format(count=count))
+
+        def on_failed(message: str) -> None:
+            progress_dialog.close()
+            QMessageBox.warning(self, "エラー", f"処理に失敗しました: {message}")
+
+        task = TransferTask(func, path)
+        task.signals.progress.connect(on_progress)
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(on_failed)
+        QThreadPool.globalInstance().start(task)
+
+    def _convert_vacuum(self) -> None:
+        """データベースを書き直して空き領域の自動解放を有効にする"""
+        answer = QMessageBox.question(
+            self, "確認",
+            "データベース全体を書き直します。履歴が多い場合は時間がかかり、"
+            "その間は新しい履歴の保存が待たされます。実行しますか？",
+        )
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+
+        progress_dialog = QProgressDialog("データベースを書き直し中...", None, 0, 0, self)
+        progress_dialog.setWindowTitle("データベース")
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+
+        def on_finished(freed: int) -> None:
+            progress_dialog.close()
+            self._vacuum_btn.setEnabled(False)
+            QMessageBox.information(
+                self, "完了", f"空き領域の自動解放を有効にしました（{freed / (1024 * 1024):.1f}MB 削減）"
+            )
+
+        def on_failed(message: str) -> None:
+            progress_dialog.close()
+            QMessageBox.warning(self, "エラー", f"処理に失敗しました: {message}")
+
+        task = VacuumTask()
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(on_failed)
+        QThreadPool.globalInstance().start(task)
+
     def _test_connection(self, provider: str) -> None:
         """API接続をテスト"""
         if provider == "openai":
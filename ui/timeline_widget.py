@@ -0,0 +1,161 @@
+"""アクティビティのタイムライン表示モジュール"""
+import time
+from datetime import datetime
+from typing import Optional
+
+from PyQt6.QtWidgets import QWidget, QToolTip
+from PyQt6.QtCore import Qt, pyqtSignal, QRectF
+from PyQt6.QtGui import QPainter, QColor, QPen
+
+from config import CATEGORIES
+from database import TIMELINE_BUCKET_MS, get_activity_timeline
+from categorizer import get_category_display_name
+
+
+# 表示する区間の数
+TIMELINE_DAYS = 30
+TIMELINE_HOURS = 48
+
+# ウィジェットの高さ
+TIMELINE_HEIGHT = 72
+
+# カテゴリごとの棒の色
+CATEGORY_COLORS = {
+    "url": "#2196F3",
+    "email": "#9C27B0",
+    "code": "#4CAF50",
+    "phone": "#FF9800",
+    "filepath": "#795548",
+    "image": "#E91E63",
+    "text": "#9E9E9E",
+}
+OTHER_COLOR = "#607D8B"
+
+
+class TimelineWidget(QWidget):
+    """日ごと・時間ごとの履歴の件数をカテゴリ別の積み上げ棒グラフで表示するウィジェット
+
+    棒をクリックするとその期間を選択し（もう一度クリックすると解除）、range_selectedで通知する。
+    """
+
+    range_selected = pyqtSignal(object)  # (開始, 終了)のエポックミリ秒、解除時はNone
+
+    def __init__(self, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self._unit = "day"
+        self._slots: list[tuple[int, dict[str, int]]] = []  # (区間の開始, カテゴリごとの件数)
+        self._selected: Optional[int] = None  # 選択中の区間の開始
+
+        self.setMinimumHeight(TIMELINE_HEIGHT)
+        self.setMouseTracking(True)
+        self.setCursor(Qt.CursorShape.PointingHandCursor)
+
+    def _slot_ms(self) -> int:
+        """1区間の長さ（ミリ秒）"""
+        return TIMELINE_BUCKET_MS * (24 if self._unit == "day" else 1)
+
+    def set_unit(self, unit: str) -> None:
+        """集計単位（"day"または"hour"）を変更（選択は解除する）"""
+        self._unit = unit
+        self.clear_selection()
+        self.refresh()
+
+    def clear_selection(self) -> None:
+        """期間の選択を解除"""
+        if self._selected is not None:
+            self._selected = None
+            self.range_selected.emit(None)
+            self.update()
+
+    def refresh(self) -> None:
+        """集計を読み込み直す"""
+        slot_ms = self._slot_ms()
+        count = TIMELINE_DAYS if self._unit == "day" else TIMELINE_HOURS
+
+        # 現在の区間の開始（get_activity_timelineと同じく1時間単位のタイムゾーン差で区切る）
+        now = int(time.time() * 1000)
+        offset_ms = time.localtime().tm_gmtoff // 3600 * TIMELINE_BUCKET_MS
+        current = (now + offset_ms) // slot_ms * slot_ms - offset_ms
+        starts = [current - i * slot_ms for i in reversed(range(count))]
+
+        counts: dict[int, dict[str, int]] = {start: {} for start in starts}
+        for row in get_activity_timeline(starts[0], current + slot_ms, self._unit):
+            if row["start"] in counts:
+                counts[row["start"]][row["category"]] = row["count"]
+
+        self._slots = [(start, counts[start]) for start in starts]
+        self.update()
+
+    def _slot_at(self, x: float) -> Optional[int]:
+        """座標にある区間の番号"""
+        if not self._slots or self.width() <= 0:
+            return None
+        index = int(x * len(self._slots) / self.width())
+        return index if 0 <= index < len(self._slots) else None
+
+    def paintEvent(self, event) -> None:
+        """棒グラフを描画"""
+        if not self._slots:
+            return
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        width = self.width() / len(self._slots)
+        height = self.height() - 2
+        peak = max((sum(counts.values()) for _, counts in self._slots), default=0) or 1
+        order = list(CATEGORIES) + sorted({c for _, counts in self._slots for c in counts} - set(CATEGORIES))
+
+        for index, (start, counts) in enumerate(self._slots):
+            x = index * width
+            bottom = float(height)
+
+            if start == self._selected:
+                painter.fillRect(QRectF(x, 0, width, height), self.palette().highlight().color().lighter(170))
+
+            for category in order:
+                count = counts.get(category, 0)
+                if not count:
+                    continue
+                bar = count / peak * (height - 4)
+                painter.fillRect(
+                    QRectF(x + 1, bottom - bar, max(width - 2, 1), bar),
+                    QColor(CATEGORY_COLORS.get(category, OTHER_COLOR)),
+                )
+                bottom -= bar
+
+        # 基準線
+        painter.setPen(QPen(self.palette().mid().color()))
+        painter.drawLine(0, height, self.width(), height)
+        painter.end()
+
+    def mouseMoveEvent(self, event) -> None:
+        """区間の件数をツールチップで表示"""
+        index = self._slot_at(event.position().x())
+        if index is None:
+            QToolTip.hideText()
+            return
+
+        start, counts = self._slots[index]
+        label = datetime.fromtimestamp(start / 1000).strftime("%Y-%m-%d" if self._unit == "day" else "%m-%d %H:00")
+        lines = [f"{label}（{sum(counts.values())}件）"]
+        lines += [
+            f"{get_category_display_name(category)}: {count}"
+            for category, count in sorted(counts.items(), key=lambda item: -item[1])
+        ]
+        QToolTip.showText(event.globalPosition().toPoint(), "\n".join(lines), self)
+
+    def mousePressEvent(self, event) -> None:
+        """クリックした区間を選択（選択中の区間なら解除）"""
+        index = self._slot_at(event.position().x())
+        if index is None:
+            return
+
+        start = self._slots[index][0]
+        if start == self._selected:
+            self.clear_selection()
+            return
+
+        self._selected = start
+        self.range_selected.emit((start, start + self._slot_ms()))
+        self.update()